@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark the badge pipeline (make_badge) against stub image and Storage APIs.
+
+Every stub call sleeps for a fixed delay to stand in for the image model. The
+run shows a first generation, a repeat of the same prompt (cache hit), a burst
+of identical concurrent requests (one generation shared by all of them) and a
+forced regeneration. Each generation is streamed into the stub's Storage by
+transfer_badge, with the local copy kept in a temporary image store.
+
+Usage: python bench_badges.py [concurrent] [delay_ms]
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(BACKEND_DIR, "campaign"))
+
+from stub_services import start_stub_server
+
+PROMPT = "Design a modern badge for a donor that contributed to Bench Campaign."
+
+def main():
+    concurrent = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    server, base_url = start_stub_server(delay=delay_ms / 1000)
+    os.environ["API_URL"] = f"{base_url}/v1/images/generations"
+    os.environ["SUPABASE_URL"] = base_url
+    os.environ["SUPABASE_KEY"] = "bench"
+    os.environ["BADGE_OUTPUT_DIR"] = tempfile.mkdtemp()
+    os.environ["BADGE_CACHE_PATH"] = os.path.join(os.environ["BADGE_OUTPUT_DIR"], "index.db")
+    os.environ["BADGE_KEEP_LOCAL"] = "true"
+
+    # Import after pointing the image API, Storage and output directory at the stub
+    with contextlib.redirect_stdout(io.StringIO()):
+        import campaign as campaign_service
+    from badge_jobs import BadgeJob
+
+    jobs = count()
+
+    def make(prompt, force=False):
+        job = BadgeJob({"bench": next(jobs)})
+        return campaign_service.make_badge(job, prompt, None, force)
+
+    def timed(label, fn):
+        before = server.generations
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{label:<24} {elapsed:8.2f} ms   image API calls: {server.generations - before}")
+
+    def uploaded():
+        return sum(len(body) for body in server.stored.values())
+
+    print(f"🚀 {delay_ms:.0f} ms per stub call\n")
+
+    timed("First request", lambda: make(PROMPT))
+    timed("Same prompt again", lambda: make(PROMPT))
+
+    # A new prompt, requested by many clients at once
+    burst = PROMPT + " Burst."
+    with ThreadPoolExecutor(max_workers=concurrent) as pool:
+        timed(f"{concurrent} identical at once", lambda: list(pool.map(lambda _: make(burst), range(concurrent))))
+
+    timed("force=true", lambda: make(burst, force=True))
+    print(f"\n{campaign_service.badge_cache.stats()}")
+    print(f"Storage: {len(server.stored)} objects, {uploaded()} bytes; {campaign_service.image_store.stats()}")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
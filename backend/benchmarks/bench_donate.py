@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark donate latency against stub services: sequential calls vs the async orchestrator.
+
+Every stub call sleeps for a fixed delay to stand in for real service latency.
+The sequential run replays the original one-call-after-another donate path
+(including the second campaign GET and the inline email); the orchestrated run
+uses makedonation/orchestrator.py, which queues the email in a temporary outbox.
+
+Usage: python bench_donate.py [donations] [delay_ms]
+"""
+
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.join(BACKEND_DIR, "makedonation"))
+
+from stub_services import point_services_at, start_stub_server
+
+DONATION = {
+    "campaign_id": 1,
+    "name": "Stub Donor",
+    "email": "stub@example.com",
+    "amount": 10,
+    "charge": {"amount": 1000, "currency": "hkd", "description": "bench", "source": "tok_visa"},
+}
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def donate_sequential(client):
+    client.post("stripe", "/charges", json=DONATION["charge"])
+    client.get("campaign", "/1")
+    client.patch("campaign", "/1", json={"current_amount": 10})
+    client.get("donor", f"/{DONATION['email']}")
+    client.post("donation", json={"campaign_id": 1, "donor_id": 1, "amount": 10})
+    client.get("campaign", "/1")
+    client.post("email", "/send-email", json={"email_type": "thanks"})
+
+def measure(label, fn, donations):
+    samples = []
+    # The orchestrator logs every step; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(donations):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<14} p50 {statistics.median(samples):7.2f} ms   p99 {percentile(samples, 99):7.2f} ms")
+
+def main():
+    donations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    server, base_url = start_stub_server(delay=delay_ms / 1000)
+    os.environ.update(point_services_at(base_url))
+    os.environ["OUTBOX_PATH"] = os.path.join(tempfile.mkdtemp(), "outbox.db")
+
+    # Import after pointing the service URLs at the stubs
+    from orchestrator import donate_flow, run
+    from service_client import ServiceClient
+
+    print(f"🚀 {donations} donations, {delay_ms:.0f} ms per stub call\n")
+
+    client = ServiceClient()
+    measure("Sequential", lambda: donate_sequential(client), donations)
+    measure("Orchestrated", lambda: run(donate_flow(dict(DONATION))), donations)
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
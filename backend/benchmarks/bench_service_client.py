@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark the donate path's inter-service calls: bare requests vs the pooled client.
+
+Replays the sequence of HTTP calls one donation makes against the stub services,
+once with a new connection per call and once through service_client.
+
+Usage: python bench_service_client.py [donations]
+"""
+
+import os
+import sys
+import time
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stub_services import point_services_at, start_stub_server
+
+def donation_calls(base_url):
+    """The calls makedonation.donate makes for a single donation"""
+    return [
+        ("POST", f"{base_url}/stripeservice/charges", {"amount": 1000}),
+        ("POST", f"{base_url}/campaign/1/increment", {"amount": 10}),
+        ("GET", f"{base_url}/donor/stub@example.com", None),
+        ("POST", f"{base_url}/donation", {"campaign_id": 1, "donor_id": 1, "amount": 10}),
+        ("GET", f"{base_url}/campaign/1", None),
+        ("POST", f"{base_url}/email/send-email", {"email_type": "thanks"}),
+    ]
+
+def run_bare(calls, donations):
+    start = time.perf_counter()
+    for _ in range(donations):
+        for method, url, body in calls:
+            requests.request(method, url, json=body)
+    return time.perf_counter() - start
+
+def run_pooled(calls, donations):
+    from service_client import ServiceClient
+
+    pooled = ServiceClient()
+    start = time.perf_counter()
+    for _ in range(donations):
+        for method, url, body in calls:
+            pooled.session.request(method, url, json=body)
+    elapsed = time.perf_counter() - start
+    pooled.close()
+    return elapsed
+
+def main():
+    donations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    server, base_url = start_stub_server()
+    os.environ.update(point_services_at(base_url))
+    calls = donation_calls(base_url)
+
+    print(f"🚀 Replaying {donations} donations ({len(calls)} calls each) against {base_url}\n")
+
+    bare = run_bare(calls, donations)
+    pooled = run_pooled(calls, donations)
+
+    print(f"Bare requests:  {bare * 1000 / donations:.2f} ms per donation")
+    print(f"Pooled client:  {pooled * 1000 / donations:.2f} ms per donation")
+    print(f"Speedup:        {bare / pooled:.2f}x")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of email template rendering: a new Jinja Environment per email
+(the old behaviour) vs the email service's shared, precompiled environment.
+
+Usage: python bench_templates.py [renders]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+EMAIL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "email")
+sys.path.insert(0, EMAIL_DIR)
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+CONTEXTS = {
+    "thanks.html": {"donor_name": "Bench Donor", "donation_amount": 100, "campaign_name": "Bench Campaign"},
+    "badge.html": {"donor_name": "Bench Donor", "badge_earned": "https://example.com/badge.png", "campaign_name": "Bench Campaign"},
+    "post_event.html": {"donor_name": "Bench Donor", "campaign_name": "Bench Campaign"},
+}
+
+def render_per_request(template_file, context):
+    env = Environment(
+        loader=FileSystemLoader(os.path.join(EMAIL_DIR, "templates")),
+        autoescape=select_autoescape(["html", "xml"])
+    )
+    return env.get_template(template_file).render(**context)
+
+def measure(label, fn, renders):
+    start = time.perf_counter()
+    for i in range(renders):
+        template_file = list(CONTEXTS)[i % len(CONTEXTS)]
+        fn(template_file, CONTEXTS[template_file])
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed * 1e6 / renders:9.1f} µs per email")
+
+def main():
+    renders = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+
+    # The email service opens its outbox on import; keep it out of the repo
+    os.environ["OUTBOX_PATH"] = os.path.join(tempfile.mkdtemp(), "outbox.db")
+    import send_email
+
+    print(f"🚀 Rendering {renders} emails\n")
+    measure("New Environment per email", render_per_request, renders)
+    measure("Shared precompiled", lambda t, c: send_email.get_template(t).render(**c), renders)
+
+if __name__ == "__main__":
+    main()
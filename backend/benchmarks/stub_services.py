@@ -0,0 +1,157 @@
+"""
+Stub versions of the backend services for local benchmarks.
+
+One threaded HTTP/1.1 server answers the routes the donate flow calls on the
+donor, campaign, donation, stripe and email services with canned JSON after an
+optional artificial delay, so benchmarks do not need Supabase, Stripe or SMTP.
+It also stands in for the text-to-image API used for badges
+(POST /v1/images/generations), serving a small PNG for every generation, and
+for Supabase Storage uploads (POST /storage/v1/object/...), which it keeps in
+`server.stored`.
+"""
+
+import json
+import re
+import socket
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CAMPAIGN = {"campaign_id": 1, "name": "Stub Campaign", "current_amount": 0, "goal_amount": 1000000}
+DONOR = {"donor_id": 1, "name": "Stub Donor", "email": "stub@example.com"}
+
+
+def make_png(width=64, height=64):
+    """
+    Build a solid-colour RGB PNG without any imaging library
+    """
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    row = b"\x00" + b"\xff\xd7\x00" * width
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(row * height))
+        + chunk(b"IEND", b"")
+    )
+
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; avoid Nagle stalls on kept-alive connections
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _reply_bytes(self, status, payload, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_raw(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            data = b""
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                data += self.rfile.read(size)
+                self.rfile.readline()
+                if size == 0:
+                    return data
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _read_body(self):
+        raw = self._read_raw()
+        return json.loads(raw) if raw else {}
+
+    def _route(self, method):
+        path = self.path.split("?")[0]
+        if method == "POST" and path.startswith("/storage/v1/object/"):
+            key = path[len("/storage/v1/object/"):]
+            self.server.stored[key] = self._read_raw()
+            return self._reply(200, {"Key": key})
+
+        body = self._read_body()
+        if self.delay:
+            time.sleep(self.delay)
+
+        if method == "POST" and path == "/stripeservice/charges":
+            return self._reply(200, {"success": True, "charge": {"id": "ch_stub"}})
+        if method == "POST" and re.fullmatch(r"/campaign/\d+/increment", path):
+            return self._reply(200, {"status": "success", "data": [CAMPAIGN]})
+        if method in ("GET", "PATCH") and re.fullmatch(r"/campaign/\d+", path):
+            return self._reply(200, {"status": "success", "data": [CAMPAIGN]})
+        if method == "GET" and path.startswith("/donor/"):
+            return self._reply(200, {"status": "success", "data": [DONOR]})
+        if method == "POST" and path.rstrip("/") == "/donor":
+            return self._reply(201, {"status": "success", "data": [DONOR]})
+        if method == "POST" and path == "/donor/upsert":
+            return self._reply(200, {"status": "success", "data": {**DONOR, "created": False}})
+        if method == "POST" and path.rstrip("/") == "/donation":
+            donation = {"donation_id": 1, **body}
+            return self._reply(201, {"status": "success", "data": [donation]})
+        if method == "POST" and path.startswith("/email/"):
+            return self._reply(200, {"status": "success"})
+        if method == "POST" and path == "/v1/images/generations":
+            self.server.generations += 1
+            url = f"http://{self.headers['Host']}/images/{self.server.generations}.png"
+            return self._reply(200, {"data": [{"url": url}]})
+        if method == "GET" and path.startswith("/images/"):
+            # A different image per generation, so content hashes differ
+            number = re.sub(r"\D", "", path) or "0"
+            return self._reply_bytes(200, make_png(height=64 + int(number) % 64), "image/png")
+        return self._reply(404, {"status": "error", "message": "Not found"})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PATCH(self):
+        self._route("PATCH")
+
+
+def start_stub_server(port=0, delay=0.0):
+    """
+    Start the stub server in a background thread and return (server, base_url)
+    """
+    handler = type("DelayedStubHandler", (StubHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.generations = 0
+    server.stored = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def point_services_at(base_url):
+    """
+    Return environment overrides that send every service call to the stub server
+    """
+    return {
+        "DONOR_SERVICE_URL": f"{base_url}/donor",
+        "CAMPAIGN_SERVICE_URL": f"{base_url}/campaign",
+        "DONATION_SERVICE_URL": f"{base_url}/donation",
+        "STRIPE_SERVICE_URL": f"{base_url}/stripeservice",
+        "EMAIL_SERVICE_URL": f"{base_url}/email",
+    }
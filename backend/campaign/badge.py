@@ -8,24 +8,63 @@ load_dotenv()
 # === CONFIG ===
 API_KEY = os.getenv("API_KEY")
 API_URL = os.getenv("API_URL")
-OUTPUT_DIR = "generated_images"
+MODEL = os.getenv("BADGE_MODEL", "stabilityai/stable-diffusion-3-5-large")
+SIZE = os.getenv("BADGE_SIZE", "1024x1024")
+OUTPUT_DIR = os.getenv("BADGE_OUTPUT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "generated_images"))
+# Seconds to wait for the image API, and for downloading the generated image
+GENERATE_TIMEOUT = float(os.getenv("BADGE_GENERATE_TIMEOUT", "120"))
+DOWNLOAD_TIMEOUT = float(os.getenv("BADGE_DOWNLOAD_TIMEOUT", "30"))
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def generate_badge(
-    prompt: str, base_image_url: str = None, output_filename: str = "output.png"):
+# Theme-specific styling for badge prompts
+THEME_STYLES = {
+    'cute': {
+        'colors': 'soft pastel pink (#FFB6C1), bright pink (#FF69B4), and golden yellow (#FFD700)',
+        'style': 'playful and friendly with rounded corners, heart shapes, and cheerful decorative elements',
+        'mood': 'warm, inviting, and joyful with cute illustrations'
+    },
+    'prestigious': {
+        'colors': 'deep navy blue (#000080), rich gold (#FFD700), and crisp white',
+        'style': 'formal and elegant with sharp geometric borders, classical laurel wreaths, and premium typography',
+        'mood': 'authoritative, distinguished, and professional like an academic award'
+    },
+    'pretty': {
+        'colors': 'lavender (#E6E6FA), plum (#DDA0DD), and hot pink (#FF1493)',
+        'style': 'elegant and feminine with floral patterns, delicate swirls, and graceful curves',
+        'mood': 'sophisticated, beautiful, and refined with artistic flourishes'
+    },
+    'nature': {
+        'colors': 'forest green (#228B22), lime green (#32CD32), and light green (#90EE90)',
+        'style': 'organic and natural with leaf patterns, tree motifs, and earth-inspired elements',
+        'mood': 'fresh, sustainable, and environmentally conscious'
+    },
+    'modern': {
+        'colors': 'dark slate (#2C3E50), bright blue (#3498DB), and light gray (#ECF0F1)',
+        'style': 'clean and minimalist with geometric shapes, sharp lines, and contemporary design',
+        'mood': 'innovative, tech-forward, and sleek'
+    }
+}
+
+
+class BadgeError(Exception):
+    """
+    A failed generation or download; `retryable` is set for rate limits and server errors
     """
-    Generates an image using the SiliconFlow AI API based on the given prompt.
 
-    Args:
-        prompt (str): The text prompt describing the image.
-        output_filename (str): The filename to save the generated image.
-        base_image_url (str, optional): URL of a base image to guide style (image-to-image).
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def request_image(prompt: str, base_image_url: str = None) -> str:
+    """
+    Ask the SiliconFlow AI API for an image and return the URL it was generated at.
     """
     payload = {
-        "model": "stabilityai/stable-diffusion-3-5-large",
+        "model": MODEL,
         "prompt": prompt,
-        "size": "1024x1024",
+        "size": SIZE,
         "n": 1,
         "response_format": "url",
     }
@@ -36,16 +75,53 @@ def generate_badge(
 
     headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
 
-    resp = requests.post(API_URL, headers=headers, json=payload)
+    resp = requests.post(API_URL, headers=headers, json=payload, timeout=GENERATE_TIMEOUT)
     if resp.status_code != 200:
-        raise Exception(f"Error generating image: {resp.text}")
+        retryable = resp.status_code == 429 or resp.status_code >= 500
+        raise BadgeError(f"Error generating image: {resp.text}", retryable=retryable)
+
+    return resp.json()["data"][0]["url"]
+
+
+def open_image(image_url: str) -> requests.Response:
+    """
+    Start downloading a generated image; the caller reads it with iter_content() and closes it.
+    """
+    img_resp = requests.get(image_url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    if img_resp.status_code != 200:
+        img_resp.close()
+        retryable = img_resp.status_code == 429 or img_resp.status_code >= 500
+        raise BadgeError(f"Error downloading image: HTTP {img_resp.status_code}", retryable=retryable)
+    return img_resp
+
+
+def badge_prompt(campaign: dict, theme: str) -> str:
+    """
+    Build the text-to-image prompt for a campaign row (name, description) and theme.
+    """
+    name = campaign.get("name")
+    description = campaign.get("description")
 
-    result = resp.json()
-    image_url = result["data"][0]["url"]
-    img_resp = requests.get(image_url)
+    # Get theme styling or default to prestigious
+    theme_info = THEME_STYLES.get(theme, THEME_STYLES['prestigious'])
 
-    output_path = os.path.join(OUTPUT_DIR, output_filename)
-    with open(output_path, "wb") as f:
-        f.write(img_resp.content)
+    # Construct the AI prompt with theme-specific elements
+    prompt = (
+        f"Create a {theme} themed sponsor appreciation badge for '{name}' campaign. "
+        f"Design requirements: "
+        f"- Clean, elegant circular or shield-shaped badge on pure white background "
+        f"- Bold, readable text '{name}' as the main title in premium serif or sans-serif font "
+        f"- Subtitle text 'Sponsor Appreciation' or 'Thank You Sponsor' below the main title "
+        f"- Color scheme: {theme_info['colors']} "
+        f"- Style: {theme_info['style']} "
+        f"- Mood: {theme_info['mood']} "
+        f"- Professional border with decorative elements appropriate for {theme} theme "
+        f"- High contrast for text readability "
+        f"- Corporate/institutional aesthetic suitable for formal recognition "
+        f"- Campaign focus: {description} "
+        f"- Overall appearance: Premium certificate design, award-quality appearance "
+        f"- No complex backgrounds, maintain focus on text and elegant design elements "
+        f"- Theme consistency: Ensure all elements reflect the {theme} aesthetic"
+    )
 
-    return output_path
+    return prompt
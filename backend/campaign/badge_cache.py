@@ -0,0 +1,161 @@
+"""
+Content-addressed cache of generated badges.
+
+A badge is identified by the SHA-256 of everything that determines the image:
+the rendered prompt, the base image URL, the model and the size. The first
+request for a key generates and uploads the badge; later requests get the
+stored URL without calling the image API. Identical requests that arrive while
+the badge is being generated wait for that generation instead of starting
+their own. The index is a SQLite file next to the images.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import closing
+
+from badge import OUTPUT_DIR
+
+BADGE_CACHE_PATH = os.getenv("BADGE_CACHE_PATH", os.path.join(OUTPUT_DIR, "index.db"))
+
+SCHEMA = """
+create table if not exists badges (
+    key text primary key,
+    badge_url text not null,
+    local_path text,
+    thumbnail_url text,
+    sha256 text,
+    model text,
+    size text,
+    created_at real not null,
+    last_used_at real not null
+);
+"""
+
+
+def badge_key(prompt, base_image_url, model, size):
+    raw = json.dumps([prompt, base_image_url or None, model, size])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class BadgeCache:
+    def __init__(self, path=BADGE_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("pragma table_info(badges)")}
+            # Indexes created before thumbnails and the image store existed
+            for column in ("thumbnail_url", "sha256"):
+                if column not in columns:
+                    conn.execute(f"alter table badges add column {column} text")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get(self, key):
+        with closing(self._connect()) as conn:
+            row = conn.execute("select * from badges where key = ?", (key,)).fetchone()
+            if row:
+                conn.execute("update badges set last_used_at = ? where key = ?", (time.time(), key))
+        if row is None:
+            return None
+        entry = dict(row)
+        # The local copy may have been evicted from the image store since
+        if entry["local_path"] and not os.path.exists(entry["local_path"]):
+            entry["local_path"] = None
+        return entry
+
+    def put(self, key, badge_url, local_path=None, model=None, size=None, thumbnail_url=None, sha256=None):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "insert or replace into badges"
+                " (key, badge_url, local_path, thumbnail_url, sha256, model, size, created_at, last_used_at)"
+                " values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, badge_url, local_path, thumbnail_url, sha256, model, size, now, now),
+            )
+
+    def hashes_for(self, badge_urls):
+        """
+        Content hashes of the cached badges with these URLs
+        """
+        urls = list(badge_urls)
+        hashes = set()
+        with closing(self._connect()) as conn:
+            for start in range(0, len(urls), 500):
+                batch = urls[start:start + 500]
+                rows = conn.execute(
+                    f"select sha256 from badges where sha256 is not null and badge_url in ({','.join('?' * len(batch))})",
+                    batch,
+                )
+                hashes.update(row["sha256"] for row in rows)
+        return hashes
+
+    def get_or_create(self, key, create, force=False):
+        """
+        Return (entry, cached). create() must return {"badge_url"} and may add
+        "local_path", "thumbnail_url", "sha256", "model" and "size"
+        and is only called when the key is missing (or force is set) and no
+        identical request is already generating it.
+        """
+        if not force:
+            entry = self.get(key)
+            if entry:
+                self.hits += 1
+                return entry, True
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result(), False
+
+        try:
+            result = create()
+            self.put(
+                key,
+                result["badge_url"],
+                result.get("local_path"),
+                result.get("model"),
+                result.get("size"),
+                result.get("thumbnail_url"),
+                result.get("sha256"),
+            )
+            entry = self.get(key)
+            future.set_result(entry)
+            return entry, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            entries = conn.execute("select count(*) from badges").fetchone()[0]
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
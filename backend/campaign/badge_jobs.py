@@ -0,0 +1,215 @@
+"""
+Background jobs for badge generation.
+
+Generating a badge takes tens of seconds (text-to-image call, streamed
+download and upload, DB update), so the campaign service hands it to a small
+pool of BADGE_WORKERS threads and answers with a job id right away. Clients
+poll the job for its status and step:
+
+    queued -> running (generating, transferring, saving) -> succeeded
+                                                          | failed
+                                                          | cancelled
+
+Each step is retried with exponential backoff on timeouts, connection errors,
+rate limits and server errors, up to BADGE_JOB_MAX_ATTEMPTS attempts.
+Cancelling a queued job removes it from the queue; a running job stops at the
+next step boundary (an HTTP call in progress finishes or times out first).
+Jobs live in memory and are forgotten BADGE_JOB_TTL seconds after they finish;
+the badge itself is stored on the campaign.
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import requests
+
+from badge import BadgeError
+
+BADGE_WORKERS = int(os.getenv("BADGE_WORKERS", "2"))
+# Submissions beyond this many waiting jobs are refused with 503
+MAX_QUEUED = int(os.getenv("BADGE_JOB_MAX_QUEUED", "50"))
+MAX_ATTEMPTS = int(os.getenv("BADGE_JOB_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE = float(os.getenv("BADGE_JOB_BACKOFF_BASE", "2"))
+JOB_TTL = float(os.getenv("BADGE_JOB_TTL", "3600"))
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    def __init__(self, job_id):
+        super().__init__(f"Badge job {job_id} was cancelled")
+        self.job_id = job_id
+
+
+class QueueFull(Exception):
+    pass
+
+
+def is_retryable(error):
+    if isinstance(error, (requests.Timeout, requests.ConnectionError, httpx.TransportError)):
+        return True
+    return isinstance(error, BadgeError) and error.retryable
+
+
+class BadgeJob:
+    def __init__(self, details, dedupe_key=None):
+        self.id = uuid.uuid4().hex
+        # What the job makes, e.g. {"campaign_id": 1, "theme": "cute"}
+        self.details = details
+        self.dedupe_key = dedupe_key
+        self.status = "queued"
+        self.step = None
+        self.attempts = 0
+        # {"done": n, "total": m} for jobs that make several badges
+        self.progress = None
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.future = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def run_step(self, name, fn, retry_any=False):
+        """
+        Run one pipeline step, retrying transient failures with backoff.
+        retry_any retries every exception (for idempotent steps such as the DB update).
+        """
+        attempt = 0
+        while True:
+            self.check_cancelled()
+            attempt += 1
+            self._update(step=name, attempts=self.attempts + 1)
+            try:
+                return fn()
+            except JobCancelled:
+                raise
+            except Exception as e:
+                if attempt >= MAX_ATTEMPTS or not (retry_any or is_retryable(e)):
+                    raise
+                print(f"Badge job {self.id} {name} attempt {attempt} failed, retrying: {e}")
+                # Wakes up early when the job is cancelled
+                self._cancel.wait(BACKOFF_BASE * (2 ** (attempt - 1)))
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.updated_at = time.time()
+
+    def _finish(self, status, result=None, error=None):
+        self._update(status=status, result=result, error=error)
+        self._done.set()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            **self.details,
+            "status": self.status,
+            "step": self.step,
+            "progress": self.progress,
+            "attempts": self.attempts,
+            "cancel_requested": self.cancel_requested(),
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class BadgeJobs:
+    def __init__(self, workers=BADGE_WORKERS, max_queued=MAX_QUEUED):
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="badge-job")
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, details, pipeline, dedupe_key=None):
+        """
+        Queue pipeline(job) and return the job. A submission with the same
+        dedupe_key as an unfinished job returns that job instead.
+        Raises QueueFull when MAX_QUEUED jobs are already waiting.
+        """
+        with self._lock:
+            self._expire()
+            if dedupe_key is not None and dedupe_key in self._active:
+                return self._active[dedupe_key]
+            queued = sum(1 for job in self._jobs.values() if job.status == "queued")
+            if queued >= self.max_queued:
+                raise QueueFull(f"{queued} badge jobs are already waiting")
+            job = BadgeJob(details, dedupe_key)
+            self._jobs[job.id] = job
+            if dedupe_key is not None:
+                self._active[dedupe_key] = job
+            job.future = self._executor.submit(self._run, job, pipeline)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancel a job; returns it, or None when there is no such job
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        job._cancel.set()
+        if job.future.cancel():
+            # Never started
+            self._finish(job, "cancelled")
+        return job
+
+    def stats(self):
+        counts = {}
+        for job in list(self._jobs.values()):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {status: counts.get(status, 0) for status in ("queued", "running") + FINISHED}
+
+    def _run(self, job, pipeline):
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                job.check_cancelled()
+                job._update(status="running")
+                result = pipeline(job)
+                self._finish(job, "succeeded", result=result)
+            except JobCancelled as e:
+                if job.cancel_requested():
+                    self._finish(job, "cancelled")
+                elif e.job_id != job.id and attempts < MAX_ATTEMPTS:
+                    # The generation this job was waiting on belonged to a cancelled job
+                    continue
+                else:
+                    self._finish(job, "failed", error=str(e))
+            except Exception as e:
+                print(f"Badge job {job.id} failed at {job.step}: {e}")
+                self._finish(job, "failed", error=str(e))
+            return
+
+    def _finish(self, job, status, result=None, error=None):
+        with self._lock:
+            if self._active.get(job.dedupe_key) is job:
+                del self._active[job.dedupe_key]
+        job._finish(status, result=result, error=error)
+
+    def _expire(self):
+        cutoff = time.time() - JOB_TTL
+        for job_id, job in list(self._jobs.items()):
+            if job.status in FINISHED and job.updated_at < cutoff:
+                del self._jobs[job_id]
@@ -0,0 +1,146 @@
+"""
+Streamed transfer of generated badges from the image API to Supabase Storage.
+
+The image is read from the download in CHUNK_SIZE pieces and every piece goes
+straight on to Storage as a raw-body upload, so a badge is never held in memory
+or written and read back just to be uploaded. On the way through the bytes are
+hashed and, when a store is given (BADGE_KEEP_LOCAL), copied into the local
+image store under their content hash (see image_store.py).
+
+With BADGE_THUMBNAIL_SIZE set, a small derivative (WebP by default, see
+BADGE_THUMBNAIL_FORMAT) is uploaded next to the badge for emails and lists.
+Thumbnails need Pillow (`pip install Pillow`).
+"""
+
+import hashlib
+import io
+import mimetypes
+import os
+import uuid
+
+import httpx
+from dotenv import load_dotenv
+
+from badge import BadgeError, open_image
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are optional
+    Image = None
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+BADGE_BUCKET = "photos/badges"
+CHUNK_SIZE = 64 * 1024
+UPLOAD_TIMEOUT = float(os.getenv("BADGE_UPLOAD_TIMEOUT", "60"))
+KEEP_LOCAL = os.getenv("BADGE_KEEP_LOCAL", "true").lower() in ("1", "true", "yes")
+# Longest side of the thumbnail in pixels; 0 disables thumbnails
+THUMBNAIL_SIZE = int(os.getenv("BADGE_THUMBNAIL_SIZE", "0"))
+THUMBNAIL_FORMAT = os.getenv("BADGE_THUMBNAIL_FORMAT", "webp").lower()
+
+if THUMBNAIL_SIZE and Image is None:
+    raise RuntimeError("BADGE_THUMBNAIL_SIZE is set but Pillow is not installed")
+
+
+def public_url(path):
+    return f"{SUPABASE_URL}/storage/v1/object/public/{path}"
+
+
+def upload_stream(path, body, content_type, content_length=None):
+    """
+    Upload bytes, or an iterator of chunks, to Storage at `path` (bucket/name).
+    Uploads overwrite, so a retried step can send the same object again.
+    """
+    headers = {
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "apikey": SUPABASE_KEY,
+        "Content-Type": content_type,
+        "Cache-Control": "max-age=3600",
+        "x-upsert": "true",
+    }
+    # A known length avoids chunked transfer encoding
+    if content_length:
+        headers["Content-Length"] = str(content_length)
+    response = httpx.post(
+        f"{SUPABASE_URL}/storage/v1/object/{path}", content=body, headers=headers, timeout=UPLOAD_TIMEOUT
+    )
+    if response.status_code not in (200, 201):
+        retryable = response.status_code == 429 or response.status_code >= 500
+        raise BadgeError(f"Failed to upload badge: {response.text}", retryable=retryable)
+
+
+def make_thumbnail(source, size=THUMBNAIL_SIZE, image_format=THUMBNAIL_FORMAT):
+    """
+    Return (bytes, content type) of a copy of the image scaled to fit size x size
+    """
+    with Image.open(source) as image:
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        image.save(output, format=image_format.upper(), quality=80)
+    return output.getvalue(), Image.MIME.get(image_format.upper(), "application/octet-stream")
+
+
+def transfer_badge(image_url, name, store=None, thumbnail_size=THUMBNAIL_SIZE):
+    """
+    Stream a generated image into Storage as BADGE_BUCKET/name, keeping a local
+    copy in `store` (an ImageStore) when one is given. Returns
+    {"badge_url", "thumbnail_url", "local_path", "sha256", "bytes"}.
+    """
+    local_path = None
+    partial_path = os.path.join(store.directory, f"{uuid.uuid4().hex}.part") if store else None
+    # Without a local copy the thumbnail is made from the bytes kept here
+    buffer = io.BytesIO() if thumbnail_size and not store else None
+    digest = hashlib.sha256()
+    size = 0
+
+    img_resp = open_image(image_url)
+    content_type = img_resp.headers.get("Content-Type", "").split(";")[0].strip()
+    if not content_type.startswith("image/"):
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    copy = open(partial_path, "wb") if partial_path else None
+
+    def chunks():
+        nonlocal size
+        for chunk in img_resp.iter_content(CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+            if copy:
+                copy.write(chunk)
+            if buffer is not None:
+                buffer.write(chunk)
+            yield chunk
+
+    try:
+        # requests decodes Content-Encoding, so the header length only holds for identity responses
+        length = None if img_resp.headers.get("Content-Encoding") else img_resp.headers.get("Content-Length")
+        upload_stream(f"{BADGE_BUCKET}/{name}", chunks(), content_type, length)
+        if copy:
+            copy.close()
+            local_path = store.add(partial_path, digest.hexdigest(), os.path.splitext(name)[1])
+    except BaseException:
+        if copy:
+            copy.close()
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        raise
+    finally:
+        img_resp.close()
+
+    result = {
+        "badge_url": public_url(f"{BADGE_BUCKET}/{name}"),
+        "thumbnail_url": None,
+        "local_path": local_path,
+        "sha256": digest.hexdigest(),
+        "bytes": size,
+    }
+    if thumbnail_size:
+        if buffer is not None:
+            buffer.seek(0)
+        data, thumbnail_type = make_thumbnail(local_path or buffer, thumbnail_size)
+        thumbnail_name = f"{os.path.splitext(name)[0]}_{thumbnail_size}.{THUMBNAIL_FORMAT}"
+        upload_stream(f"{BADGE_BUCKET}/{thumbnail_name}", data, thumbnail_type)
+        result["thumbnail_url"] = public_url(f"{BADGE_BUCKET}/{thumbnail_name}")
+    return result
@@ -1,13 +1,31 @@
+import math
 import mimetypes
 import os
 import re
-
-from badge import generate_badge
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from badge import MODEL, SIZE, THEME_STYLES, badge_prompt, request_image
+from badge_cache import BadgeCache, badge_key
+from badge_jobs import BadgeJobs, JobCancelled, QueueFull
+from badge_storage import KEEP_LOCAL, transfer_badge
+from image_store import ImageStore
 from dotenv import load_dotenv
 from flask import Blueprint, Flask, jsonify, request
 from flask_cors import CORS
+from postgrest.exceptions import APIError
 from supabase import Client, create_client
 
+# Shared backend modules live one directory up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from campaign_stats import CachedStatistics
+from conditional import TableVersions
+from listing import ListSpec, list_page
+from read_cache import ReadThroughCache
+from service_client import client
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -16,16 +34,83 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Statistics are cached for CAMPAIGN_STATS_TTL seconds
+campaign_statistics = CachedStatistics(supabase)
+
+# Table versions behind the ETag of the campaign list
+table_versions = TableVersions(supabase)
+
 # Create and configure Flask app
 app = Flask(__name__)
 CORS(app)
 
 # Create Blueprint for campaign routes
 campaign_blueprint = Blueprint("campaign", __name__)
+table_versions.track_writes(campaign_blueprint)
+
+# Campaign reads are cached; every write below invalidates the affected entries
+campaign_cache = ReadThroughCache("campaigns")
+
+# Paging and filters of GET /campaign/
+CAMPAIGN_LIST = ListSpec(
+    "Campaigns", "campaign_id", equals=("campaign_id", "status"), date_column="end_date", amount_column="current_amount"
+)
+
+# Generated badges by prompt hash, so an identical request never pays for a second generation
+badge_cache = BadgeCache()
+# Local copies of generated badges, capped at BADGE_STORE_MAX_BYTES
+image_store = ImageStore()
+
+# Badges are generated by a bounded pool of background workers, never on a request thread
+badge_jobs = BadgeJobs()
+# How long PUT /generate-badge/<id> waits for its job before answering 202
+BADGE_SYNC_WAIT = float(os.getenv("BADGE_SYNC_WAIT", "2"))
+# Generations run at once by one batch job, and the most variants a batch may ask for
+BADGE_BATCH_CONCURRENCY = int(os.getenv("BADGE_BATCH_CONCURRENCY", "5"))
+BADGE_BATCH_MAX_VARIANTS = int(os.getenv("BADGE_BATCH_MAX_VARIANTS", "50"))
+
+# Campaign changes are pushed to the checker in the background
+checker_notifier = ThreadPoolExecutor(max_workers=2)
 
 def sanitize_filename(name):
     return re.sub(r"\s+", "_", name)
 
+def donation_amount(value):
+    """
+    Parse the amount of a donation; raises ValueError unless it is a finite number above 0
+    """
+    # bool is an int subclass, and Flask's JSON parser accepts NaN and Infinity
+    if isinstance(value, bool):
+        raise ValueError
+    amount = float(value)
+    if not math.isfinite(amount) or amount <= 0:
+        raise ValueError
+    return amount
+
+def invalidate_campaign_cache(campaign_id=None):
+    """
+    Drop a campaign's cached row and every cached campaign list
+    """
+    if campaign_id is not None:
+        campaign_cache.invalidate("campaign", campaign_id)
+    campaign_cache.invalidate("list")
+
+def notify_checker(campaign=None, campaign_id=None):
+    """
+    Tell the campaign checker that a campaign changed (or was deleted, when only
+    campaign_id is given) so it can reschedule its end date or close it at its goal
+    """
+    def send():
+        try:
+            if campaign is None:
+                client.delete("checker", f"/campaigns/{campaign_id}")
+            else:
+                client.post("checker", f"/campaigns/{campaign['campaign_id']}", json=campaign)
+        except Exception as e:
+            print(f"Could not notify campaign checker: {e}")
+
+    checker_notifier.submit(send)
+
 # Health Check
 @campaign_blueprint.route("/health", methods=["GET"])
 def health():
@@ -82,6 +167,8 @@ def create_campaign():
     response = supabase.table("Campaigns").insert(campaign_data).execute()
 
     if response.data:
+        invalidate_campaign_cache()
+        notify_checker(response.data[0])
         return (
             jsonify(
                 {"status": "success", "data": response.data, "school_logo": file_url}
@@ -93,21 +180,50 @@ def create_campaign():
 
 # View All Campaigns
 @campaign_blueprint.route("/", methods=["GET"])
+@table_versions.conditional("Campaigns")
 def view_all_campaigns():
-    response = supabase.table("Campaigns").select("*").execute()
-    if response.data:
-        return jsonify({"status": "success", "data": response.data}), 200
-    else:
-        return jsonify({"status": "error", "message": "No campaigns found"}), 404
+    try:
+        # Keyed by table version too, so the body always matches the ETag sent with it
+        page = campaign_cache.get_or_load(
+            "list",
+            f"{table_versions.get('Campaigns')}:{request.query_string.decode()}",
+            lambda: list_page(supabase, CAMPAIGN_LIST, request.args),
+        )
+        return jsonify({"status": "success", **page}), 200
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        print(f"Error listing campaigns: {e}")
+        return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
+
+# Campaign Cache Metrics
+@campaign_blueprint.route("/cache/stats", methods=["GET"])
+def view_cache_stats():
+    return jsonify({"status": "success", "data": campaign_cache.stats()}), 200
+
+# Campaign Statistics
+@campaign_blueprint.route("/stats", methods=["GET"])
+def view_campaign_statistics():
+    try:
+        stats, fetched_at = campaign_statistics.get()
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"Error getting statistics: {str(e)}"}), 500
+
+    age = int(time.monotonic() - fetched_at)
+    response = jsonify({"status": "success", "data": stats, "age_seconds": age})
+    response.headers["Cache-Control"] = f"public, max-age={max(0, int(campaign_statistics.ttl) - age)}"
+    return response, 200
 
 # View Campaign
 @campaign_blueprint.route("/<int:campaign_id>", methods=["GET"])
 def view_campaign(campaign_id):
-    response = (
-        supabase.table("Campaigns").select("*").eq("campaign_id", campaign_id).execute()
+    data = campaign_cache.get_or_load(
+        "campaign",
+        campaign_id,
+        lambda: supabase.table("Campaigns").select("*").eq("campaign_id", campaign_id).execute().data,
     )
-    if response.data:
-        return jsonify({"status": "success", "data": response.data}), 200
+    if data:
+        return jsonify({"status": "success", "data": data}), 200
     else:
         return jsonify({"status": "error", "message": "Campaign not found"}), 404
 
@@ -130,6 +246,8 @@ def patch_campaign(campaign_id):
         )
         
         if response.data:
+            invalidate_campaign_cache(campaign_id)
+            notify_checker(response.data[0])
             return jsonify({"status": "success", "data": response.data}), 200
         else:
             return jsonify({"status": "error", "message": "Failed to update campaign"}), 400
@@ -137,6 +255,73 @@ def patch_campaign(campaign_id):
     except Exception as e:
         return jsonify({"status": "error", "message": f"Error updating campaign: {str(e)}"}), 500
 
+# Increment Campaign current_amount (single atomic update in the database)
+@campaign_blueprint.route("/<int:campaign_id>/increment", methods=["POST"])
+def increment_campaign(campaign_id):
+    data = request.get_json() or {}
+    amount = data.get("amount")
+
+    try:
+        amount = donation_amount(amount)
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "amount must be a positive number"}), 400
+
+    try:
+        response = supabase.rpc(
+            "increment_campaign_amount",
+            {"p_campaign_id": campaign_id, "p_amount": amount},
+        ).execute()
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"Error incrementing campaign: {str(e)}"}), 500
+
+    if response.data:
+        invalidate_campaign_cache(campaign_id)
+        # Lets the checker close the campaign as soon as the goal is reached
+        notify_checker(response.data[0])
+        return jsonify({"status": "success", "data": response.data}), 200
+    else:
+        return jsonify({"status": "error", "message": "Campaign not found"}), 404
+
+# Record a paid donation and add it to the campaign in one transaction
+@campaign_blueprint.route("/<int:campaign_id>/donations", methods=["POST"])
+def record_paid_donation(campaign_id):
+    data = request.get_json() or {}
+    donor_id = data.get("donor_id")
+    payment_intent_id = data.get("payment_intent_id")
+
+    try:
+        amount = donation_amount(data.get("amount"))
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "amount must be a positive number"}), 400
+    if donor_id is None or not payment_intent_id:
+        return jsonify({"status": "error", "message": "donor_id and payment_intent_id are required"}), 400
+
+    try:
+        # See sql/payment_intents.sql; a repeated payment_intent_id records nothing
+        response = supabase.rpc(
+            "record_paid_donation",
+            {
+                "p_campaign_id": campaign_id,
+                "p_donor_id": donor_id,
+                "p_amount": amount,
+                "p_payment_intent_id": payment_intent_id,
+            },
+        ).execute()
+    except APIError as e:
+        if e.code == "P0002":
+            return jsonify({"status": "error", "message": "Campaign not found"}), 404
+        return jsonify({"status": "error", "message": f"Error recording donation: {e.message}"}), 500
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"Error recording donation: {str(e)}"}), 500
+
+    result = response.data
+    if result["duplicate"]:
+        return jsonify({"status": "success", "data": result}), 200
+
+    invalidate_campaign_cache(campaign_id)
+    notify_checker(result["campaign"])
+    return jsonify({"status": "success", "data": result}), 201
+
 # Update Campaign (PUT - for full form updates with files)
 @campaign_blueprint.route("/<int:campaign_id>", methods=["PUT"])
 def update_campaign(campaign_id):
@@ -191,6 +376,8 @@ def update_campaign(campaign_id):
         .execute()
     )
     if response.data:
+        invalidate_campaign_cache(campaign_id)
+        notify_checker(response.data[0])
         return (
             jsonify(
                 {"status": "success", "data": response.data, "school_logo": file_url}
@@ -207,6 +394,8 @@ def delete_campaign(campaign_id):
         supabase.table("Campaigns").delete().eq("campaign_id", campaign_id).execute()
     )
     if response.data:
+        invalidate_campaign_cache(campaign_id)
+        notify_checker(campaign_id=campaign_id)
         return (
             jsonify({"status": "success", "message": "Campaign deleted successfully"}),
             200,
@@ -214,139 +403,243 @@ def delete_campaign(campaign_id):
     else:
         return jsonify({"status": "error", "message": "Failed to delete campaign"}), 400
 
-import mimetypes
-import os
+# Badge Cache Metrics
+@campaign_blueprint.route("/generate-badge/cache/stats", methods=["GET"])
+def view_badge_cache_stats():
+    return jsonify({"status": "success", "data": {**badge_cache.stats(), "store": image_store.stats()}}), 200
 
-@campaign_blueprint.route("/generate-badge/<int:campaign_id>", methods=["PUT"])
-def create_badge(campaign_id):
-    # Step 1: Get theme from request body
-    data = request.get_json() or {}
-    theme = data.get('theme', 'prestigious')  # Default to prestigious if no theme provided
-    
-    # Step 2: Fetch campaign from Supabase to get description
-    campaign = (
+def fetch_badge_campaigns(campaign_ids):
+    """
+    Map campaign_id -> row (name, description, school_logo) with one query
+    """
+    response = (
         supabase.table("Campaigns")
-        .select("description, name, school_logo")
+        .select("campaign_id, description, name, school_logo")
+        .in_("campaign_id", list(campaign_ids))
+        .execute()
+    )
+    return {row["campaign_id"]: row for row in response.data or []}
+
+def build_badge_prompt(campaign_id, theme):
+    """
+    Return (prompt, base image URL) for a campaign's badge, or None when the campaign does not exist
+    """
+    campaign = fetch_badge_campaigns([campaign_id]).get(campaign_id)
+    if campaign is None:
+        return None
+    return badge_prompt(campaign, theme), campaign.get("school_logo")
+
+def save_badge(campaign_id, badge_url, thumbnail_url=None):
+    update_data = {"badge": badge_url}
+    # Only with BADGE_THUMBNAIL_SIZE set (see sql/badge_thumbnails.sql)
+    if thumbnail_url:
+        update_data["badge_thumbnail"] = thumbnail_url
+    response = (
+        supabase.table("Campaigns")
+        .update(update_data)
         .eq("campaign_id", campaign_id)
-        .single()
         .execute()
     )
+    if not response.data:
+        raise Exception("Failed to save badge")
+    invalidate_campaign_cache(campaign_id)
+    return response.data
+
+def make_badge(job, prompt, base_image, force=False):
+    """
+    Generate a badge and stream it into Storage as steps of `job`, or reuse the
+    badge cached for this exact prompt. Returns (cache entry, cached).
+    """
+    key = badge_key(prompt, base_image, MODEL, SIZE)
+    # Unique per generation, so a regenerated badge never reuses a cached URL
+    name = f"{time.time_ns()}_{key[:16]}.png"
+
+    def create():
+        image_url = job.run_step("generating", lambda: request_image(prompt, base_image))
+        stored = job.run_step(
+            "transferring",
+            lambda: transfer_badge(image_url, name, store=image_store if KEEP_LOCAL else None),
+            retry_any=True,
+        )
+        return {**stored, "model": MODEL, "size": SIZE}
+
+    entry, cached = badge_cache.get_or_create(key, create, force=force)
+    if cached and entry.get("sha256"):
+        image_store.touch(entry["sha256"])
+    return entry, cached
+
+def badge_pipeline(campaign_id, theme, prompt, base_image, force):
+    """
+    The steps of a badge job: make the badge, then store its URL on the campaign
+    """
+    def pipeline(job):
+        entry, cached = make_badge(job, prompt, base_image, force)
+        data = job.run_step(
+            "saving", lambda: save_badge(campaign_id, entry["badge_url"], entry["thumbnail_url"]), retry_any=True
+        )
+        print(f"Badge for campaign {campaign_id} ({theme}): {'cache hit' if cached else 'generated'}")
+        return {
+            "data": data,
+            "badge": entry["badge_url"],
+            "thumbnail": entry["thumbnail_url"],
+            "theme": theme,
+            "cached": cached,
+        }
 
-    if not campaign.data:
-        return jsonify({"status": "error", "message": "Campaign not found"}), 404
+    return pipeline
 
-    description = campaign.data.get("description")
-    name = campaign.data.get("name")
-    base_image = campaign.data.get("school_logo")
-    
-    # Step 3: Define theme-specific styling
-    theme_styles = {
-        'cute': {
-            'colors': 'soft pastel pink (#FFB6C1), bright pink (#FF69B4), and golden yellow (#FFD700)',
-            'style': 'playful and friendly with rounded corners, heart shapes, and cheerful decorative elements',
-            'mood': 'warm, inviting, and joyful with cute illustrations'
-        },
-        'prestigious': {
-            'colors': 'deep navy blue (#000080), rich gold (#FFD700), and crisp white',
-            'style': 'formal and elegant with sharp geometric borders, classical laurel wreaths, and premium typography',
-            'mood': 'authoritative, distinguished, and professional like an academic award'
-        },
-        'pretty': {
-            'colors': 'lavender (#E6E6FA), plum (#DDA0DD), and hot pink (#FF1493)',
-            'style': 'elegant and feminine with floral patterns, delicate swirls, and graceful curves',
-            'mood': 'sophisticated, beautiful, and refined with artistic flourishes'
-        },
-        'nature': {
-            'colors': 'forest green (#228B22), lime green (#32CD32), and light green (#90EE90)',
-            'style': 'organic and natural with leaf patterns, tree motifs, and earth-inspired elements',
-            'mood': 'fresh, sustainable, and environmentally conscious'
-        },
-        'modern': {
-            'colors': 'dark slate (#2C3E50), bright blue (#3498DB), and light gray (#ECF0F1)',
-            'style': 'clean and minimalist with geometric shapes, sharp lines, and contemporary design',
-            'mood': 'innovative, tech-forward, and sleek'
-        }
-    }
-    
-    # Get theme styling or default to prestigious
-    theme_info = theme_styles.get(theme, theme_styles['prestigious'])
-
-    # Step 4: Construct the AI prompt with theme-specific elements
-    prompt = (
-        f"Create a {theme} themed sponsor appreciation badge for '{name}' campaign. "
-        f"Design requirements: "
-        f"- Clean, elegant circular or shield-shaped badge on pure white background "
-        f"- Bold, readable text '{name}' as the main title in premium serif or sans-serif font "
-        f"- Subtitle text 'Sponsor Appreciation' or 'Thank You Sponsor' below the main title "
-        f"- Color scheme: {theme_info['colors']} "
-        f"- Style: {theme_info['style']} "
-        f"- Mood: {theme_info['mood']} "
-        f"- Professional border with decorative elements appropriate for {theme} theme "
-        f"- High contrast for text readability "
-        f"- Corporate/institutional aesthetic suitable for formal recognition "
-        f"- Campaign focus: {description} "
-        f"- Overall appearance: Premium certificate design, award-quality appearance "
-        f"- No complex backgrounds, maintain focus on text and elegant design elements "
-        f"- Theme consistency: Ensure all elements reflect the {theme} aesthetic"
-    )
+def batch_pipeline(variants, force):
+    """
+    Make every (campaign_id, theme, prompt, base_image) variant, BADGE_BATCH_CONCURRENCY
+    at a time. Nothing is saved on the campaigns; the admin picks a variant.
+    """
+    def pipeline(job):
+        job.progress = {"done": 0, "total": len(variants)}
+        progress_lock = threading.Lock()
 
-    # Debug: Print the values we're about to use
-    print(f"DEBUG - Campaign: {name}")
-    print(f"DEBUG - Description: {description}")
-    print(f"DEBUG - Selected Theme: {theme}")
-    print(f"DEBUG - Base image URL: {base_image}")
-    print(f"DEBUG - Base image type: {type(base_image)}")
-    formatted_name = sanitize_filename(name)
+        def make_variant(variant):
+            campaign_id, theme, prompt, base_image = variant
+            result = {"campaign_id": campaign_id, "theme": theme}
+            try:
+                entry, cached = make_badge(job, prompt, base_image, force)
+                result.update(badge=entry["badge_url"], thumbnail=entry["thumbnail_url"], cached=cached)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                # One failed theme does not fail the other variants
+                result["error"] = str(e)
+            with progress_lock:
+                job.progress["done"] += 1
+            return result
+
+        with ThreadPoolExecutor(max_workers=BADGE_BATCH_CONCURRENCY) as pool:
+            results = list(pool.map(make_variant, variants))
+        if all("error" in result for result in results):
+            raise Exception(f"Every badge variant failed: {results[0]['error']}")
+        return {"variants": results}
+
+    return pipeline
+
+def submit_badge_job(campaign_id):
+    """
+    Build the prompt and queue a badge job; returns (job, None) or (None, error response)
+    """
+    data = request.get_json(silent=True) or {}
+    theme = data.get('theme', 'prestigious')  # Default to prestigious if no theme provided
+    force = str(data.get("force", request.args.get("force", ""))).lower() in ("1", "true", "yes")
 
-    try:
-        image_path = generate_badge(
-            prompt, base_image_url=base_image, output_filename=f"{formatted_name}_{theme}_badge.png"
-        )
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
-
-    # Step 5: Upload to Supabase
-    bucket = "photos/badges"
-    # Create unique filename to avoid duplicates
-    import time
-    timestamp = str(int(time.time()))
-    original_filename = os.path.basename(image_path)
-    safe_filename = f"{timestamp}_{original_filename}"
-    
-    with open(image_path, "rb") as f:
-        file_data = f.read()
-    content_type, _ = mimetypes.guess_type(image_path)
-    if not content_type:
-        content_type = "application/octet-stream"
+    built = build_badge_prompt(campaign_id, theme)
+    if built is None:
+        return None, (jsonify({"status": "error", "message": "Campaign not found"}), 404)
+    prompt, base_image = built
 
     try:
-        supabase.storage.from_(bucket).upload(
-            safe_filename, file_data, {"content-type": content_type}
+        job = badge_jobs.submit(
+            {"campaign_id": campaign_id, "theme": theme},
+            badge_pipeline(campaign_id, theme, prompt, base_image, force),
+            # A repeat click while a job for the same badge is running joins that job
+            dedupe_key=None if force else (campaign_id, badge_key(prompt, base_image, MODEL, SIZE)),
         )
-        badge_url = supabase.storage.from_(bucket).get_public_url(safe_filename)
-    except Exception as e:
-        print(f"Badge upload error: {e}")
-        # If upload fails due to duplicate, try to get existing file URL
-        try:
-            badge_url = supabase.storage.from_(bucket).get_public_url(safe_filename)
-        except:
-            return jsonify({"status": "error", "message": f"Failed to upload badge: {str(e)}"}), 500
-
-    # Step 6: Update DB with badge URL
-    response = (
-        supabase.table("Campaigns")
-        .update({"badge": badge_url})
-        .eq("campaign_id", campaign_id)
-        .execute()
+    except QueueFull as e:
+        return None, (jsonify({"status": "error", "message": str(e)}), 503, {"Retry-After": "30"})
+    return job, None
+
+def job_response(job, status_code=200):
+    return jsonify({"status": "success", "data": job.to_dict()}), status_code
+
+# Submit a badge job; poll the returned job until it finishes
+@campaign_blueprint.route("/generate-badge/<int:campaign_id>/jobs", methods=["POST"])
+def create_badge_job(campaign_id):
+    job, error = submit_badge_job(campaign_id)
+    if error:
+        return error
+    body, status_code = job_response(job, 202)
+    return body, status_code, {"Location": f"/campaign/generate-badge/jobs/{job.id}"}
+
+# Generate several themes for one or more campaigns in one job; returns every variant URL
+@campaign_blueprint.route("/generate-badge/batch", methods=["POST"])
+def create_badge_batch():
+    data = request.get_json(silent=True) or {}
+    campaign_ids = data.get("campaign_ids")
+    if campaign_ids is None and data.get("campaign_id") is not None:
+        campaign_ids = [data["campaign_id"]]
+    themes = data.get("themes", "all")
+    if themes == "all":
+        themes = list(THEME_STYLES)
+    force = str(data.get("force", "")).lower() in ("1", "true", "yes")
+
+    if not isinstance(campaign_ids, list) or not campaign_ids or not all(isinstance(i, int) for i in campaign_ids):
+        return jsonify({"status": "error", "message": "campaign_ids must be a non-empty list of integers"}), 400
+    if not isinstance(themes, list) or not themes:
+        return jsonify({"status": "error", "message": "themes must be a non-empty list or \"all\""}), 400
+    unknown = [theme for theme in themes if theme not in THEME_STYLES]
+    if unknown:
+        return jsonify({"status": "error", "message": f"Unknown themes: {', '.join(map(str, unknown))}"}), 400
+    campaign_ids = list(dict.fromkeys(campaign_ids))
+    themes = list(dict.fromkeys(themes))
+    if len(campaign_ids) * len(themes) > BADGE_BATCH_MAX_VARIANTS:
+        return jsonify({"status": "error", "message": f"At most {BADGE_BATCH_MAX_VARIANTS} variants per batch"}), 400
+
+    # Every campaign is read once, whatever the number of themes
+    campaigns = fetch_badge_campaigns(campaign_ids)
+    missing = [campaign_id for campaign_id in campaign_ids if campaign_id not in campaigns]
+    if missing:
+        return jsonify({"status": "error", "message": f"Campaigns not found: {', '.join(map(str, missing))}"}), 404
+
+    variants = [
+        (campaign_id, theme, badge_prompt(campaigns[campaign_id], theme), campaigns[campaign_id].get("school_logo"))
+        for campaign_id in campaign_ids
+        for theme in themes
+    ]
+    dedupe_key = None if force else ("batch",) + tuple(
+        badge_key(prompt, base_image, MODEL, SIZE) for _, _, prompt, base_image in variants
     )
-
-    if response.data:
-        return (
-            jsonify({"status": "success", "data": response.data, "badge": badge_url, "theme": theme}),
-            200,
+    try:
+        job = badge_jobs.submit(
+            {"campaign_ids": campaign_ids, "themes": themes}, batch_pipeline(variants, force), dedupe_key=dedupe_key
         )
-    else:
-        return jsonify({"status": "error", "message": "Failed to create badge"}), 400
+    except QueueFull as e:
+        return jsonify({"status": "error", "message": str(e)}), 503, {"Retry-After": "30"}
+
+    # Fully cached batches finish right away
+    if job.wait(BADGE_SYNC_WAIT):
+        return job_response(job)
+    body, status_code = job_response(job, 202)
+    return body, status_code, {"Location": f"/campaign/generate-badge/jobs/{job.id}"}
+
+# Badge Job Metrics
+@campaign_blueprint.route("/generate-badge/jobs/stats", methods=["GET"])
+def view_badge_job_stats():
+    return jsonify({"status": "success", "data": badge_jobs.stats()}), 200
+
+@campaign_blueprint.route("/generate-badge/jobs/<job_id>", methods=["GET"])
+def view_badge_job(job_id):
+    job = badge_jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return job_response(job)
+
+@campaign_blueprint.route("/generate-badge/jobs/<job_id>", methods=["DELETE"])
+def cancel_badge_job(job_id):
+    job = badge_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    if job.status in ("succeeded", "failed"):
+        return jsonify({"status": "error", "message": f"Job already {job.status}", "data": job.to_dict()}), 409
+    return job_response(job)
+
+# Generate a badge and wait up to BADGE_SYNC_WAIT seconds for it; slower
+# generations answer 202 with the job to poll instead of holding the worker
+@campaign_blueprint.route("/generate-badge/<int:campaign_id>", methods=["PUT"])
+def create_badge(campaign_id):
+    job, error = submit_badge_job(campaign_id)
+    if error:
+        return error
+    if not job.wait(BADGE_SYNC_WAIT):
+        return job_response(job, 202)
+    if job.status == "succeeded":
+        return jsonify({"status": "success", **job.result}), 200
+    return jsonify({"status": "error", "message": job.error or f"Badge job {job.status}"}), 500
 
 # Register the campaign Blueprint with the app
 app.register_blueprint(campaign_blueprint, url_prefix="/campaign")
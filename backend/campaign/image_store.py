@@ -0,0 +1,226 @@
+"""
+Bounded on-disk store for the local copies of generated badges.
+
+Images are saved under OUTPUT_DIR as <sha256 of the content><ext>, so an image
+is stored once however many badges point at it and names never collide across
+campaigns. An `images` table in the badge index (BADGE_CACHE_PATH) records the
+size and last use of every image; once the store holds more than
+BADGE_STORE_MAX_BYTES, the least recently used images are deleted. Badges are
+served from Supabase Storage, so any local copy can be evicted.
+
+Reconcile the store with the badges campaigns actually use:
+
+    python image_store.py cleanup [--dry-run] [--include-unindexed]
+
+Images no campaign's `badge` points at are deleted once they have not been
+used for BADGE_STORE_GRACE_HOURS (unpicked batch variants stay that long), index
+rows whose file is gone are dropped, and files the index does not know about
+(such as badges saved before the store existed) are listed, and only deleted
+with --include-unindexed.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+
+from dotenv import load_dotenv
+
+from badge import OUTPUT_DIR
+from badge_cache import BADGE_CACHE_PATH, BadgeCache
+
+load_dotenv()
+
+MAX_BYTES = int(os.getenv("BADGE_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+GRACE_SECONDS = float(os.getenv("BADGE_STORE_GRACE_HOURS", "24")) * 3600
+# Partial downloads older than this were left behind by a crash
+PARTIAL_SECONDS = 3600
+
+SCHEMA = """
+create table if not exists images (
+    sha256 text primary key,
+    filename text not null,
+    bytes integer not null,
+    created_at real not null,
+    last_used_at real not null
+);
+create index if not exists images_last_used_idx on images (last_used_at);
+"""
+
+
+class ImageStore:
+    def __init__(self, directory=OUTPUT_DIR, index_path=BADGE_CACHE_PATH, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def add(self, source_path, sha256, ext=".png"):
+        """
+        Move a finished file into the store under its content hash and return its
+        path; a file with the same content already in the store is reused
+        """
+        filename = f"{sha256}{ext}"
+        path = os.path.join(self.directory, filename)
+        if os.path.exists(path):
+            os.remove(source_path)
+        else:
+            os.replace(source_path, path)
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "insert into images (sha256, filename, bytes, created_at, last_used_at) values (?, ?, ?, ?, ?)"
+                " on conflict (sha256) do update set last_used_at = excluded.last_used_at",
+                (sha256, filename, os.path.getsize(path), now, now),
+            )
+        self.evict(keep=sha256)
+        return path
+
+    def path(self, sha256):
+        """
+        Path of a stored image, or None when it is not (or no longer) on disk
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute("select filename from images where sha256 = ?", (sha256,)).fetchone()
+        if row is None:
+            return None
+        path = os.path.join(self.directory, row["filename"])
+        return path if os.path.exists(path) else None
+
+    def touch(self, sha256):
+        with closing(self._connect()) as conn:
+            conn.execute("update images set last_used_at = ? where sha256 = ?", (time.time(), sha256))
+
+    def evict(self, keep=None):
+        """
+        Delete least recently used images until the store fits in max_bytes.
+        `keep` (a sha256) is never evicted. Returns the number of images removed.
+        """
+        removed = 0
+        with self._lock, closing(self._connect()) as conn:
+            total = conn.execute("select coalesce(sum(bytes), 0) from images").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            for row in conn.execute("select * from images order by last_used_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                if row["sha256"] == keep:
+                    continue
+                self._delete(conn, row)
+                total -= row["bytes"]
+                removed += 1
+        self.evictions += removed
+        return removed
+
+    def reconcile(self, keep, grace_seconds=GRACE_SECONDS, include_unindexed=False, dry_run=False):
+        """
+        Drop images whose sha256 is not in `keep` (and that were not used during
+        the grace period), index rows without a file and, optionally, files the index
+        does not know. Returns a report of what was (or would be) removed.
+        """
+        now = time.time()
+        report = {"kept": 0, "unreferenced": [], "missing": [], "unindexed": [], "partial": []}
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute("select * from images").fetchall()
+            for row in rows:
+                if not os.path.exists(os.path.join(self.directory, row["filename"])):
+                    report["missing"].append(row["filename"])
+                    if not dry_run:
+                        conn.execute("delete from images where sha256 = ?", (row["sha256"],))
+                elif row["sha256"] not in keep and now - row["last_used_at"] > grace_seconds:
+                    report["unreferenced"].append(row["filename"])
+                    if not dry_run:
+                        self._delete(conn, row)
+                else:
+                    report["kept"] += 1
+
+            indexed = {row["filename"] for row in rows}
+            index_files = os.path.basename(self.index_path)
+            for filename in sorted(os.listdir(self.directory)):
+                path = os.path.join(self.directory, filename)
+                if filename in indexed or filename.startswith(index_files) or not os.path.isfile(path):
+                    continue
+                if filename.endswith(".part"):
+                    if now - os.path.getmtime(path) > PARTIAL_SECONDS:
+                        report["partial"].append(filename)
+                        if not dry_run:
+                            os.remove(path)
+                    continue
+                report["unindexed"].append(filename)
+                if include_unindexed and not dry_run:
+                    os.remove(path)
+        if not dry_run:
+            self.evict()
+        return report
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            row = conn.execute("select count(*) as images, coalesce(sum(bytes), 0) as bytes from images").fetchone()
+        return {
+            "images": row["images"],
+            "bytes": row["bytes"],
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+    def _delete(self, conn, row):
+        try:
+            os.remove(os.path.join(self.directory, row["filename"]))
+        except FileNotFoundError:
+            pass
+        conn.execute("delete from images where sha256 = ?", (row["sha256"],))
+
+
+def referenced_hashes(supabase, badge_cache):
+    """
+    sha256 of every stored image that is some campaign's current badge
+    """
+    # Shared backend modules live one directory up
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from listing import ListSpec, iter_chunks
+
+    urls = set()
+    for rows in iter_chunks(supabase, ListSpec("Campaigns", "campaign_id"), {}, 1000, ["campaign_id", "badge"]):
+        urls.update(row["badge"] for row in rows if row.get("badge"))
+    return badge_cache.hashes_for(urls)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile generated_images with Campaigns.badge")
+    parser.add_argument("command", choices=["cleanup"])
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be removed")
+    parser.add_argument(
+        "--include-unindexed", action="store_true", help="also delete files the store's index does not know"
+    )
+    args = parser.parse_args()
+
+    from supabase import create_client
+
+    client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    store = ImageStore()
+    keep = referenced_hashes(client, BadgeCache())
+    report = store.reconcile(keep, include_unindexed=args.include_unindexed, dry_run=args.dry_run)
+
+    prefix = "Would remove" if args.dry_run else "Removed"
+    print(f"Kept {report['kept']} images ({len(keep)} referenced by campaigns)")
+    print(f"{prefix} {len(report['unreferenced'])} unreferenced images and {len(report['partial'])} partial downloads")
+    print(f"{prefix} {len(report['missing'])} index entries without a file")
+    if report["unindexed"]:
+        action = "deleted" if args.include_unindexed and not args.dry_run else "left in place (see --include-unindexed)"
+        print(f"{len(report['unindexed'])} files not in the index, {action}:")
+        for filename in report["unindexed"]:
+            print(f"  {filename}")
+    print(f"Store: {store.stats()}")
@@ -0,0 +1,108 @@
+"""
+In-memory deadline scheduler for open campaigns.
+
+Campaigns are kept in a min-heap keyed by end_date and a single thread sleeps
+until the earliest one is due, so each campaign is closed when its end date
+passes instead of at the next daily scan. Rescheduling or cancelling a campaign
+leaves its old heap entry behind; stale entries are skipped when they surface.
+"""
+
+import heapq
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class CampaignScheduler:
+    def __init__(self, on_due):
+        self.on_due = on_due
+        self._heap = []
+        self._deadlines = {}
+        # When each campaign was last scheduled or cancelled (time.monotonic())
+        self._changed_at = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def schedule(self, campaign_id, end_date):
+        """
+        Schedule (or move) a campaign's deadline; end_date is a timezone-aware datetime
+        """
+        due_at = end_date.timestamp()
+        with self._cond:
+            self._push(campaign_id, due_at)
+            self._cond.notify()
+
+    def cancel(self, campaign_id):
+        with self._cond:
+            self._deadlines.pop(campaign_id, None)
+            self._changed_at[campaign_id] = time.monotonic()
+
+    def merge(self, deadlines, read_at):
+        """
+        Schedule {campaign_id: end_date} as read from the database at `read_at`
+        (a time.monotonic() value). Campaigns scheduled or cancelled after the
+        read are left alone, since their entry is newer than what was read, and
+        campaigns missing from `deadlines` keep their entries.
+        """
+        with self._cond:
+            for campaign_id, end_date in deadlines.items():
+                if self._changed_at.get(campaign_id, float("-inf")) <= read_at:
+                    self._push(campaign_id, end_date.timestamp())
+            self._cond.notify()
+
+    def _push(self, campaign_id, due_at):
+        self._changed_at[campaign_id] = time.monotonic()
+        if self._deadlines.get(campaign_id) == due_at:
+            return
+        self._deadlines[campaign_id] = due_at
+        heapq.heappush(self._heap, (due_at, campaign_id))
+
+    def status(self):
+        with self._cond:
+            self._drop_stale()
+            next_due = None
+            if self._heap:
+                due_at, campaign_id = self._heap[0]
+                next_due = {
+                    "campaign_id": campaign_id,
+                    "end_date": datetime.fromtimestamp(due_at, timezone.utc).isoformat(),
+                }
+            return {"scheduled": len(self._deadlines), "next_due": next_due}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="campaign-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+
+    def _drop_stale(self):
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    self._drop_stale()
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - datetime.now(timezone.utc).timestamp()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stopped:
+                    return
+                _, campaign_id = heapq.heappop(self._heap)
+                del self._deadlines[campaign_id]
+
+            try:
+                self.on_due(campaign_id)
+            except Exception as e:
+                print(f"Error handling due campaign {campaign_id}: {e}")
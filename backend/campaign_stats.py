@@ -0,0 +1,41 @@
+"""
+Campaign statistics shared by checker.py and the campaign service.
+
+Everything is computed by the campaign_statistics SQL function
+(sql/campaign_statistics.sql) in one round trip, so the cost does not grow
+with the number of rows sent back to Python.
+"""
+
+import os
+import threading
+import time
+
+VELOCITY_DAYS = int(os.getenv("CAMPAIGN_STATS_VELOCITY_DAYS", "7"))
+STATS_TTL = float(os.getenv("CAMPAIGN_STATS_TTL", "60"))
+
+
+def fetch_campaign_statistics(supabase, velocity_days=VELOCITY_DAYS):
+    if not isinstance(velocity_days, int) or velocity_days <= 0:
+        raise ValueError("velocity_days must be a positive integer")
+    response = supabase.rpc("campaign_statistics", {"p_velocity_days": velocity_days}).execute()
+    return response.data
+
+
+class CachedStatistics:
+    """
+    Keeps the last statistics for `ttl` seconds so repeated requests skip the database
+    """
+
+    def __init__(self, supabase, ttl=STATS_TTL):
+        self.supabase = supabase
+        self.ttl = ttl
+        self._value = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._value is None or time.monotonic() - self._fetched_at >= self.ttl:
+                self._value = fetch_campaign_statistics(self.supabase)
+                self._fetched_at = time.monotonic()
+            return self._value, self._fetched_at
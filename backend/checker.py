@@ -1,13 +1,20 @@
 from multiprocessing import context
 import os
 import schedule
+import threading
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from supabase import create_client, Client
 import logging
 from zoneinfo import ZoneInfo
-import requests
+from flask import Blueprint, Flask, jsonify, request
+from flask_cors import CORS
+from campaign_scheduler import CampaignScheduler
+from campaign_stats import fetch_campaign_statistics
+from outbox import Outbox
+from read_cache import ReadThroughCache
 
 # Load environment variables
 load_dotenv()
@@ -28,214 +35,417 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Badge emails are queued here and sent by the email service
+outbox = Outbox()
+
+# Same cache as the campaign service; only reachable from here when it is shared (REDIS_URL)
+campaign_cache = ReadThroughCache("campaigns")
+
+# Rows fetched per request when loading a campaign's donors
+RECIPIENT_PAGE_SIZE = 1000
+
+# Campaigns processed in parallel by one check
+CHECKER_WORKERS = int(os.getenv("CHECKER_WORKERS", "4"))
+
+# Full reconcile sweep interval; between sweeps campaigns are closed by events
+RECONCILE_INTERVAL_HOURS = float(os.getenv("CHECKER_RECONCILE_HOURS", "24"))
+CHECKER_PORT = int(os.getenv("CHECKER_PORT", "8088"))
+
+# Event-driven closes run here so callers never wait on them
+close_pool = ThreadPoolExecutor(max_workers=CHECKER_WORKERS)
+
+# Create and configure Flask app for campaign events
+app = Flask(__name__)
+CORS(app)
+checker_blueprint = Blueprint("checker", __name__)
+
 def check_open_campaigns():
     """
-    Query the database for campaigns that are currently open
+    Query the database for campaigns that are currently open, close the ones that
+    are due and send their badges. Safe to re-run: a campaign is only closed by the
+    run that claims it, and badges are only marked sent once they were queued.
     """
     try:
         logger.info("🔍 Starting daily campaign check...")
-        
-        # Get current date
-        current_date = datetime.now().isoformat()
-        
+
         # Query for open campaigns
-        # Assuming campaigns have 'status', 'start_date', 'end_date' fields
         response = supabase.table('Campaigns').select('*').filter('status', 'eq', 'open').execute()
-        
-        if response.data:
-            open_campaigns = response.data
+        open_campaigns = response.data or []
+
+        # Campaigns closed by an earlier run that crashed before sending badges
+        pending = (
+            supabase.table('Campaigns')
+            .select('*')
+            .eq('status', 'finished')
+            .is_('badges_sent_at', 'null')
+            .execute()
+        )
+        unsent_campaigns = pending.data or []
+
+        if open_campaigns:
             logger.info(f"✅ Found {len(open_campaigns)} open campaigns")
-            
-            # Process each open campaign
-            for campaign in open_campaigns:
-                process_campaign(campaign)
-                
         else:
             logger.info("📭 No open campaigns found")
-            
+        if unsent_campaigns:
+            logger.info(f"📨 Found {len(unsent_campaigns)} finished campaigns still waiting for badges")
+
+        # Process campaigns concurrently with a bounded pool
+        with ThreadPoolExecutor(max_workers=CHECKER_WORKERS) as pool:
+            closed = list(pool.map(process_campaign, open_campaigns))
+            list(pool.map(send_badges, unsent_campaigns))
+
+        # Campaigns that are still open
+        return [campaign for campaign, was_closed in zip(open_campaigns, closed) if not was_closed]
+
     except Exception as e:
         logger.error(f"❌ Error checking campaigns: {str(e)}")
+        return None
+
+def parse_end_date(end_date):
+    """
+    Parse an end_date from the database into a datetime (UTC if no timezone is given)
+    """
+    # Handle different datetime formats from database
+    if end_date.endswith('Z'):
+        end_date_str = end_date[:-1] + '+00:00'
+    elif '+' not in end_date and 'T' in end_date:
+        end_date_str = end_date + '+00:00'
+    else:
+        end_date_str = end_date
+
+    end_date_obj = datetime.fromisoformat(end_date_str)
+    if end_date_obj.tzinfo is None:
+        end_date_obj = end_date_obj.replace(tzinfo=timezone.utc)
+    return end_date_obj
+
+def goal_reached(campaign):
+    goal_amount = float(campaign.get('goal_amount') or 0)
+    current_amount = float(campaign.get('current_amount') or 0)
+    return goal_amount > 0 and current_amount >= goal_amount
 
 def process_campaign(campaign):
     """
-    Process an individual campaign - check if it needs updates
+    Process an individual campaign - close it if it is due, then send badges once.
+    Returns True when the campaign is no longer open.
     """
     try:
         campaign_id = campaign.get('campaign_id')
         title = campaign.get('name', 'Untitled Campaign')
         end_date = campaign.get('end_date')
-        current_amount = campaign.get('current_amount', 0)
-        goal_amount = campaign.get('goal_amount', 0)
-        
+        current_amount = float(campaign.get('current_amount') or 0)
+        goal_amount = float(campaign.get('goal_amount') or 0)
+
         logger.info(f"🎯 Processing campaign: {title} (ID: {campaign_id})")
-        
+
+        closed = None
+
         # Check if campaign should be closed due to end date
         if end_date:
             try:
-                # Handle different datetime formats from database
-                if end_date.endswith('Z'):
-                    end_date_str = end_date[:-1] + '+00:00'
-                elif '+' not in end_date and 'T' in end_date:
-                    end_date_str = end_date + '+00:00'
-                else:
-                    end_date_str = end_date
-                
-                end_date_obj = datetime.fromisoformat(end_date_str)
-                
-                # Get current time with same timezone
-                current_time = datetime.now(end_date_obj.tzinfo) if end_date_obj.tzinfo else datetime.now()
-                
-                if current_time >= end_date_obj:
-                    close_expired_campaign(campaign_id, title)
-                    send_email(campaign)
-                    return
-                    
+                if datetime.now(timezone.utc) >= parse_end_date(end_date):
+                    closed = close_expired_campaign(campaign_id, title)
             except (ValueError, TypeError) as date_error:
                 logger.error(f"❌ Error parsing end_date '{end_date}' for campaign {campaign_id}: {date_error}")
-        
+
         # Check if campaign has reached its goal
-        if goal_amount > 0 and current_amount >= goal_amount:
-            close_completed_campaign(campaign_id, title)
-            send_email(campaign)
-            return
-        
+        if closed is None and goal_reached(campaign):
+            closed = close_completed_campaign(campaign_id, title)
+
+        if closed:
+            send_badges(closed)
+            return True
+
         # Log campaign status
         progress = (current_amount / goal_amount * 100) if goal_amount > 0 else 0
         logger.info(f"  📊 Progress: ${current_amount:.2f} / ${goal_amount:.2f} ({progress:.1f}%)")
-        
+        return False
+
     except Exception as e:
         logger.error(f"❌ Error processing campaign {campaign.get('campaign_id', 'unknown')}: {str(e)}")
         logger.error(f"Campaign data: {campaign}")  # Debug info
+        return False
+
+def claim_campaign(campaign_id, due_before=None, at_goal=False):
+    """
+    Move a campaign from open to finished. Only one caller can win the transition;
+    returns the updated campaign row for the winner and None for everyone else.
+    With due_before, the campaign is only claimed if its end_date has passed; with
+    at_goal, only if the row in the database has reached its goal, whatever the
+    (possibly stale) copy the caller was given says.
+    """
+    if at_goal:
+        # Comparing two columns needs SQL (see sql/campaign_close.sql)
+        query = supabase.rpc('close_campaign_at_goal', {'p_campaign_id': campaign_id})
+    else:
+        query = (
+            supabase.table('Campaigns')
+            .update({'status': 'finished'})
+            .eq('campaign_id', campaign_id)
+            .eq('status', 'open')
+        )
+        if due_before:
+            query = query.lte('end_date', due_before)
+    response = query.execute()
+    if response.data and campaign_cache.shared:
+        campaign_cache.invalidate("campaign", campaign_id)
+        campaign_cache.invalidate("list")
+    return response.data[0] if response.data else None
 
 def close_expired_campaign(campaign_id, title):
     """
     Close a campaign that has passed its end date
     """
     try:
-        # Update campaign status to finished
-        response = supabase.table('Campaigns').update({
-            'status': 'finished'
-        }).eq('campaign_id', campaign_id).execute()
-        
-        if response.data:
+        campaign_data = claim_campaign(campaign_id, due_before=datetime.now(timezone.utc).isoformat())
+        if campaign_data:
             logger.info(f"⏰ Closed expired campaign: {title}")
-            # Send badge emails to all donors
-            campaign_data = response.data[0]  # Get the updated campaign data
-            send_email(campaign_data)
         else:
-            logger.error(f"❌ Failed to close expired campaign: {title}")
-            
+            logger.info(f"↩️ Campaign already closed elsewhere: {title}")
+        return campaign_data
+
     except Exception as e:
         logger.error(f"❌ Error closing expired campaign {campaign_id}: {str(e)}")
+        return None
 
 def close_completed_campaign(campaign_id, title):
     """
     Close a campaign that has reached its goal
     """
     try:
-        # Update campaign status to finished
-        response = supabase.table('Campaigns').update({
-            'status': 'finished'
-        }).eq('campaign_id', campaign_id).execute()
-        
-        if response.data:
+        campaign_data = claim_campaign(campaign_id, at_goal=True)
+        if campaign_data:
             logger.info(f"🎉 Closed finished campaign: {title}")
-            # Send badge emails to all donors
-            campaign_data = response.data[0]  # Get the updated campaign data
-            send_email(campaign_data)
             # You could trigger celebration notifications here
         else:
-            logger.error(f"❌ Failed to close finished campaign: {title}")
+            logger.info(f"↩️ Campaign already closed elsewhere or below its goal: {title}")
+        return campaign_data
 
     except Exception as e:
         logger.error(f"❌ Error closing finished campaign {campaign_id}: {str(e)}")
+        return None
+
+def send_badges(campaign):
+    """
+    Send badge emails for a finished campaign and record that they were sent
+    """
+    campaign_id = campaign.get('campaign_id')
+    if campaign.get('badges_sent_at'):
+        return
+
+    if not send_email(campaign):
+        # Leave badges_sent_at empty so the next run retries this campaign
+        return
+
+    try:
+        supabase.table('Campaigns').update({
+            'badges_sent_at': datetime.now(timezone.utc).isoformat()
+        }).eq('campaign_id', campaign_id).is_('badges_sent_at', 'null').execute()
+        logger.info(f"🏅 Badges sent for campaign {campaign_id}")
+    except Exception as e:
+        logger.error(f"❌ Error marking badges sent for campaign {campaign_id}: {str(e)}")
 
 def get_campaign_statistics():
     """
     Get overall campaign statistics for daily reporting
     """
     try:
-        # Count campaigns by status
-        total_campaigns = supabase.table('Campaigns').select('campaign_id').execute()
-        open_campaigns = supabase.table('Campaigns').select('campaign_id').filter('status', 'eq', 'open').execute()
-        closed_campaigns = supabase.table('Campaigns').select('campaign_id').filter('status', 'eq', 'closed').execute()
-        finished_campaigns = supabase.table('Campaigns').select('campaign_id').filter('status', 'eq', 'finished').execute()
-
-        total_count = len(total_campaigns.data) if total_campaigns.data else 0
-        open_count = len(open_campaigns.data) if open_campaigns.data else 0
-        finished_count = len(finished_campaigns.data) if finished_campaigns.data else 0
-        closed_count = len(closed_campaigns.data) if closed_campaigns.data else 0
-        
+        stats = fetch_campaign_statistics(supabase)
+        status_counts = stats.get("status_counts") or {}
+        attainment = stats.get("attainment_distribution") or {}
+        velocity = stats.get("velocity") or {}
+
         logger.info(f"📈 Campaign Statistics:")
-        logger.info(f"  📊 Total: {total_count}")
-        logger.info(f"  🟢 Open: {open_count}")
-        logger.info(f"  ⛔ Closed: {closed_count}")
-        logger.info(f"  ✅ Finished: {finished_count}")
-        
+        logger.info(f"  📊 Total: {stats.get('total', 0)}")
+        logger.info(f"  🟢 Open: {status_counts.get('open', 0)}")
+        logger.info(f"  ⛔ Closed: {status_counts.get('closed', 0)}")
+        logger.info(f"  ✅ Finished: {status_counts.get('finished', 0)}")
+        logger.info(f"  💰 Raised: ${float(stats.get('total_raised') or 0):.2f} of ${float(stats.get('total_goal') or 0):.2f}")
+        logger.info(f"  🎯 Goal attainment: " + ", ".join(f"{k}%: {v}" for k, v in attainment.items()))
+        logger.info(
+            f"  🚀 Velocity: {velocity.get('donations_last_24h', 0)} donations in 24h, "
+            f"{velocity.get('donations_per_day', 0)}/day over {velocity.get('window_days', 0)} days"
+        )
+
     except Exception as e:
         logger.error(f"❌ Error getting statistics: {str(e)}")
 
+def close_due_campaign(campaign_id):
+    """
+    Called by the deadline scheduler when a campaign's end_date passes
+    """
+    campaign = close_expired_campaign(campaign_id, f"campaign {campaign_id}")
+    if campaign:
+        send_badges(campaign)
+
+def close_goal_reached_campaign(campaign):
+    """
+    Called right after a donation pushed a campaign to its goal
+    """
+    closed = close_completed_campaign(campaign.get('campaign_id'), campaign.get('name', 'Untitled Campaign'))
+    if closed:
+        deadline_scheduler.cancel(closed.get('campaign_id'))
+        send_badges(closed)
+
+deadline_scheduler = CampaignScheduler(on_due=lambda campaign_id: close_pool.submit(close_due_campaign, campaign_id))
+
+def schedule_campaign(campaign):
+    """
+    Track an open campaign's end_date in the scheduler (or stop tracking it)
+    """
+    campaign_id = campaign.get('campaign_id')
+    if campaign.get('status') != 'open' or not campaign.get('end_date'):
+        deadline_scheduler.cancel(campaign_id)
+        return False
+    deadline_scheduler.schedule(campaign_id, parse_end_date(campaign['end_date']))
+    return True
+
 def daily_check():
     """
-    Main daily check function
+    Periodic reconcile sweep: closes anything the events missed and merges the
+    open campaigns' deadlines into the scheduler
     """
-    logger.info("🌅 Starting daily campaign check routine")
-    check_open_campaigns()
+    logger.info("🌅 Starting campaign reconcile sweep")
+    read_at = time.monotonic()
+    still_open = check_open_campaigns()
+    if still_open is not None:
+        deadlines = {}
+        for campaign in still_open:
+            try:
+                if campaign.get('end_date'):
+                    deadlines[campaign['campaign_id']] = parse_end_date(campaign['end_date'])
+            except (ValueError, TypeError) as date_error:
+                logger.error(f"❌ Error parsing end_date for campaign {campaign.get('campaign_id')}: {date_error}")
+        # Events that arrived during the sweep are newer than its snapshot and win
+        deadline_scheduler.merge(deadlines, read_at)
+        logger.info(f"⏳ Merged {len(deadlines)} campaign deadlines from the sweep")
     get_campaign_statistics()
-    logger.info("🌙 Daily campaign check completed\n" + "="*50)
+    logger.info("🌙 Reconcile sweep completed\n" + "="*50)
+
+# Health Check
+@checker_blueprint.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "alive"}), 200
+
+# Scheduler Status
+@checker_blueprint.route("/status", methods=["GET"])
+def scheduler_status():
+    return jsonify({"status": "success", "data": deadline_scheduler.status()}), 200
+
+# Campaign created, updated or incremented (body: the campaign row)
+@checker_blueprint.route("/campaigns/<int:campaign_id>", methods=["POST"])
+def campaign_changed(campaign_id):
+    campaign = request.get_json() or {}
+    campaign["campaign_id"] = campaign_id
+
+    try:
+        scheduled = schedule_campaign(campaign)
+    except (ValueError, TypeError) as e:
+        return jsonify({"status": "error", "message": f"Invalid end_date: {str(e)}"}), 400
+
+    closing = campaign.get('status') == 'open' and goal_reached(campaign)
+    if closing:
+        close_pool.submit(close_goal_reached_campaign, campaign)
+
+    return jsonify({"status": "success", "scheduled": scheduled, "closing": closing}), 202
+
+# Campaign deleted
+@checker_blueprint.route("/campaigns/<int:campaign_id>", methods=["DELETE"])
+def campaign_deleted(campaign_id):
+    deadline_scheduler.cancel(campaign_id)
+    return jsonify({"status": "success"}), 200
+
+app.register_blueprint(checker_blueprint, url_prefix="/checker")
+
+def run_reconcile_loop():
+    while True:
+        schedule.run_pending()
+        time.sleep(60)  # Check every minute
 
 def run_scheduler():
     """
-    Set up and run the daily scheduler
+    Start the deadline scheduler, the periodic reconcile sweep and the event endpoints
     """
     logger.info("🚀 Campaign Checker started")
-    logger.info("⏰ Scheduled to run daily at 9:00 AM")
-    
-    # Schedule daily check at 9:00 AM
-    # schedule.every().day.at("23:18").do(daily_check)
-    
-    # Optional: Run immediately on startup for testing
+    logger.info(f"⏰ Reconcile sweep every {RECONCILE_INTERVAL_HOURS:g} hours")
+
+    deadline_scheduler.start()
+
+    # Load the deadlines and catch up on anything missed while stopped
     daily_check()
-    
+
+    schedule.every(RECONCILE_INTERVAL_HOURS).hours.do(daily_check)
+    threading.Thread(target=run_reconcile_loop, name="reconcile", daemon=True).start()
+
+    # Campaign events from the campaign service
+    app.run(host="0.0.0.0", port=CHECKER_PORT)
+
+def get_campaign_recipients(campaign_id):
+    """
+    Return one recipient per distinct donor email for a campaign.
+    DonorCampaignTotals already has one row per (donor, campaign), and the donor's
+    name and email are joined in the same query. Pages are read by keyset on
+    donor_id, so each page is an index range scan instead of skipping the rows
+    of every earlier page.
+    """
+    recipients = {}
+    last_donor_id = None
     while True:
-        schedule.run_pending()
-        time.sleep(60)  # Check every minute
+        query = (
+            supabase.table("DonorCampaignTotals")
+            .select("donor_id, Donors(name, email)")
+            .eq("campaign_id", campaign_id)
+        )
+        if last_donor_id is not None:
+            query = query.gt("donor_id", last_donor_id)
+        response = query.order("donor_id").limit(RECIPIENT_PAGE_SIZE).execute()
+        rows = response.data or []
+        for row in rows:
+            donor = row.get("Donors") or {}
+            email = (donor.get("email") or "").strip().lower()
+            if email and email not in recipients:
+                recipients[email] = {"donor_id": row["donor_id"], "name": donor.get("name"), "email": email}
+        if len(rows) < RECIPIENT_PAGE_SIZE:
+            break
+        last_donor_id = rows[-1]["donor_id"]
+    return list(recipients.values())
 
 def send_email(campaign):
-
+    """
+    Queue badge emails for every distinct donor of a campaign in one batch.
+    Returns True once every email is in the outbox.
+    """
     email_type = "badge"
+    campaign_id = campaign.get('campaign_id')
 
-    # Get All Donors
-    donors = supabase.table("Donations").select("donor_id").filter("campaign_id", "eq", campaign.get('campaign_id')).execute()
-
-    for donor in donors.data:
-        donor_id = donor['donor_id']  
-        donor_response = requests.get(f"http://127.0.0.1:8081/donor/{donor_id}").json() 
-        donor_data = donor_response.get("data", [{}])[0] if donor_response.get("data") else {}
-        
-        context = {
-            "donor_name": donor_data.get("name", "Valued Donor"),
-            "badge_earned": campaign.get("badge"),
-            "campaign_name": campaign.get("name"),
+    try:
+        recipients = get_campaign_recipients(campaign_id)
+    except Exception as e:
+        logger.error(f"❌ Error loading donors for campaign {campaign_id}: {str(e)}")
+        return False
+
+    messages = [
+        {
+            "email_type": email_type,
+            "to_email": recipient["email"],
+            "context": {
+                "donor_name": recipient.get("name") or "Valued Donor",
+                # The thumbnail is much smaller than the 1024x1024 badge, when there is one
+                "badge_earned": campaign.get("badge_thumbnail") or campaign.get("badge"),
+                "campaign_name": campaign.get("name"),
+            },
+            "dedupe_key": f"badge:{campaign_id}:{recipient['email']}",
         }
-        
-        # Send email to this donor
-        try:
-            email_payload = {
-                "to_email": donor_data.get("email"),
-                "email_type": email_type,
-                "context": context
-            }
-            
-            email_response = requests.post("http://127.0.0.1:8087/email/send-email", json=email_payload)
-            if email_response.status_code == 200:
-                logger.info(f"✅ Badge email sent to {donor_data.get('name', 'Unknown')} ({donor_data.get('email')})")
-            else:
-                logger.error(f"❌ Failed to send badge email to {donor_data.get('email')}: {email_response.text}")
-                
-        except Exception as email_error:
-            logger.error(f"❌ Error sending email to donor {donor_id}: {str(email_error)}")
+        for recipient in recipients
+    ]
 
+    # Sent by the email service's outbox workers over pooled SMTP connections
+    try:
+        queued = outbox.enqueue_many(messages) if messages else 0
+        logger.info(f"✅ Queued {queued} badge emails for campaign {campaign_id} ({len(recipients)} donors)")
+        return True
+    except Exception as email_error:
+        logger.error(f"❌ Error queueing badge emails for campaign {campaign_id}: {str(email_error)}")
+        return False
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,105 @@
+"""
+Conditional GET support for the list endpoints.
+
+Each list gets a weak ETag built from its table's version, the id of the
+last transaction that wrote it (sql/table_versions.sql), so checking whether
+a client's copy is current costs one primary-key lookup instead of
+re-reading the table. A matching
+If-None-Match is answered with 304 and no body. If the version table is not
+available the ETag falls back to a hash of the response body, which still
+saves the transfer.
+"""
+
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import make_response, request
+
+# Seconds browsers and proxies may reuse a list without revalidating (0 = always revalidate)
+LIST_CACHE_MAX_AGE = int(os.getenv("LIST_CACHE_MAX_AGE", "0"))
+# Seconds a fetched table version is reused before asking the database again
+TABLE_VERSION_TTL = float(os.getenv("TABLE_VERSION_TTL", "1"))
+
+
+def cache_control(max_age, public=True):
+    scope = "public" if public else "private"
+    if max_age <= 0:
+        return f"{scope}, no-cache"
+    return f"{scope}, max-age={max_age}"
+
+
+class TableVersions:
+    def __init__(self, supabase, ttl=TABLE_VERSION_TTL):
+        self.supabase = supabase
+        self.ttl = ttl
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, table):
+        """
+        Current version of a table, or None when it cannot be read
+        """
+        with self._lock:
+            cached = self._versions.get(table)
+            if cached and time.monotonic() - cached[1] < self.ttl:
+                return cached[0]
+        try:
+            response = (
+                self.supabase.table("TableVersions").select("version").eq("table_name", table).execute()
+            )
+        except Exception as e:
+            print(f"Could not read version of {table}: {e}")
+            return None
+        version = response.data[0]["version"] if response.data else 0
+        with self._lock:
+            self._versions[table] = (version, time.monotonic())
+        return version
+
+    def forget(self):
+        with self._lock:
+            self._versions.clear()
+
+    def track_writes(self, blueprint):
+        """
+        Drop the cached versions after every successful write handled by the
+        blueprint, so a client refetching right after its own write never gets a 304
+        """
+        @blueprint.after_request
+        def forget_versions(response):
+            if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+                self.forget()
+            return response
+
+    def conditional(self, table, max_age=LIST_CACHE_MAX_AGE, public=True):
+        """
+        Decorate a list view with a weak ETag and Cache-Control, answering
+        a matching If-None-Match with 304
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                version = self.get(table)
+                etag = f"{table}-{version}" if version is not None else None
+                headers = {"Cache-Control": cache_control(max_age, public)}
+
+                if etag and request.if_none_match.contains_weak(etag):
+                    response = make_response("", 304)
+                    response.set_etag(etag, weak=True)
+                    response.headers.update(headers)
+                    return response
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if etag:
+                    response.set_etag(etag, weak=True)
+                else:
+                    response.add_etag(weak=True)
+                response.headers.update(headers)
+                return response.make_conditional(request)
+
+            return wrapper
+
+        return decorator
@@ -0,0 +1,184 @@
+"""
+Bulk import of donations collected offline (events, cash, cheques).
+
+An upload of (email, name, campaign_id, amount) rows is imported in a
+handful of set-based steps instead of one request per donation:
+
+    1. parse and validate every row
+    2. check the referenced campaigns with one query per chunk of ids
+    3. resolve donors by normalized email with one upsert per chunk
+    4. insert the donations with multi-row inserts of IMPORT_CHUNK_SIZE rows
+    5. add each campaign's imported total to current_amount once
+
+Rows that fail validation, or whose chunk fails to insert, are reported by
+row number; everything else is imported.
+"""
+
+import csv
+import io
+import json
+import os
+from decimal import Decimal, InvalidOperation
+
+from postgrest.types import ReturnMethod
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+# Keeps every .in_() filter well inside URL length limits
+LOOKUP_CHUNK_SIZE = 200
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def detect_format(filename, content_type):
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in (content_type or ""):
+        return "ndjson"
+    return "csv"
+
+
+def read_records(stream, import_format):
+    """
+    Yield (row_number, record) from a binary stream; row numbers count data rows from 1
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if import_format == "csv":
+        for number, record in enumerate(csv.DictReader(text), start=1):
+            yield number, record
+        return
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record
+
+
+def validate_record(record):
+    """
+    Return a clean (normalized email, name, campaign_id, amount) tuple or raise ValueError
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Row is not a JSON object")
+    email = str(record.get("email") or "").strip().lower()
+    if "@" not in email:
+        raise ValueError("email is missing or invalid")
+    name = str(record.get("name") or "").strip() or None
+    try:
+        campaign_id = int(record.get("campaign_id"))
+    except (TypeError, ValueError):
+        raise ValueError("campaign_id must be an integer")
+    try:
+        amount = Decimal(str(record.get("amount")).strip())
+    except InvalidOperation:
+        raise ValueError("amount must be a number")
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError("amount must be greater than 0")
+    return email, name, campaign_id, amount
+
+
+def existing_campaigns(supabase, campaign_ids):
+    found = set()
+    for ids in chunked(sorted(campaign_ids), LOOKUP_CHUNK_SIZE):
+        response = supabase.table("Campaigns").select("campaign_id").in_("campaign_id", ids).execute()
+        found.update(row["campaign_id"] for row in response.data)
+    return found
+
+
+def resolve_donors(supabase, donors):
+    """
+    Map normalized email -> donor_id for {normalized email: name}, creating the
+    donors that do not exist yet with the upsert_donors function (see
+    sql/donor_upsert.sql). Returns (mapping, created count).
+    """
+    donor_ids = {}
+    created = 0
+    for batch in chunked(list(donors), IMPORT_CHUNK_SIZE):
+        payload = [{"email": email, "name": donors[email]} for email in batch]
+        try:
+            response = supabase.rpc("upsert_donors", {"p_donors": payload}).execute()
+        except Exception as e:
+            # The rows of these donors are reported as failed
+            print(f"Error upserting donor chunk: {e}")
+            continue
+        for row in response.data:
+            donor_ids[row["email"]] = row["donor_id"]
+            created += bool(row["created"])
+    return donor_ids, created
+
+
+def import_donations(supabase, records, increment_campaign):
+    """
+    Import (row_number, record) pairs.
+
+    increment_campaign(campaign_id, amount) is called once per campaign with
+    the total that was imported for it. Returns the summary and per-row errors.
+    """
+    errors = []
+    valid = []
+    for number, record in records:
+        try:
+            valid.append((number,) + validate_record(record))
+        except ValueError as e:
+            errors.append({"row": number, "error": str(e)})
+    total_rows = len(valid) + len(errors)
+
+    campaigns = existing_campaigns(supabase, {row[3] for row in valid})
+    rows = []
+    for row in valid:
+        if row[3] in campaigns:
+            rows.append(row)
+        else:
+            errors.append({"row": row[0], "error": f"Campaign {row[3]} does not exist"})
+
+    donors = {}
+    for _, email, name, _, _ in rows:
+        donors.setdefault(email, name)
+    donor_ids, donors_created = resolve_donors(supabase, donors)
+    resolved = []
+    for row in rows:
+        if row[1] in donor_ids:
+            resolved.append(row)
+        else:
+            errors.append({"row": row[0], "error": f"Could not create donor {row[1]}"})
+
+    imported = 0
+    campaign_totals = {}
+    for batch in chunked(resolved, IMPORT_CHUNK_SIZE):
+        donations = [
+            {"donor_id": donor_ids[email], "campaign_id": campaign_id, "amount": str(amount)}
+            for _, email, _, campaign_id, amount in batch
+        ]
+        try:
+            supabase.table("Donations").insert(donations, returning=ReturnMethod.minimal).execute()
+        except Exception as e:
+            print(f"Error inserting donation chunk: {e}")
+            errors.extend({"row": row[0], "error": f"Insert failed: {e}"} for row in batch)
+            continue
+        imported += len(batch)
+        for _, _, _, campaign_id, amount in batch:
+            campaign_totals[campaign_id] = campaign_totals.get(campaign_id, Decimal(0)) + amount
+
+    failed_increments = []
+    for campaign_id, amount in campaign_totals.items():
+        if not increment_campaign(campaign_id, float(amount)):
+            failed_increments.append(campaign_id)
+
+    errors.sort(key=lambda error: error["row"])
+    summary = {
+        "rows": total_rows,
+        "imported": imported,
+        "failed": len(errors),
+        "donors_created": donors_created,
+        "campaign_totals": {str(cid): float(amount) for cid, amount in campaign_totals.items()},
+        "failed_campaign_increments": failed_increments,
+    }
+    return summary, errors
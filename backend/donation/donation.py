@@ -1,8 +1,20 @@
 import os
-from flask import Blueprint, Flask, jsonify, request
+import sys
+from flask import Blueprint, Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 from supabase import create_client, Client
+from postgrest.exceptions import APIError
+from bulk_import import IMPORT_FORMATS, detect_format, import_donations, read_records
+from export import DEFAULT_FIELDS, EXPORT_CHUNK_SIZE, FORMATS, export_stream
+from leaderboard import DEFAULT_LIMIT, build_leaderboard
+from totals import get_campaign_totals, get_donor_campaign_totals, get_donor_totals, rebuild_totals
+
+# Shared backend modules live one directory up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conditional import TableVersions
+from listing import ListSpec, iter_chunks, list_page, parse_fields
+from service_client import client
 
 # Load environment variables from .env
 load_dotenv()
@@ -12,12 +24,21 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Table versions behind the ETag of the donation list
+table_versions = TableVersions(supabase)
+
+# Paging and filters of GET /donation/
+DONATION_LIST = ListSpec(
+    "Donations", "donation_id", equals=("campaign_id", "donor_id"), date_column="donated_at", amount_column="amount"
+)
+
 # Create and configure Flask app
 app = Flask(__name__)
 CORS(app)
 
 # Create Blueprint for donation routes
 donation_blueprint = Blueprint("donation", __name__)
+table_versions.track_writes(donation_blueprint)
 
 # Health Check
 @donation_blueprint.route('/health', methods=['GET'])
@@ -55,6 +76,9 @@ def create_donation():
             "donor_id": donor_id_value,
             "amount": amount_value,
         }
+        # Set for donations paid with a PaymentIntent (unique, see sql/payment_intents.sql)
+        if data.get("payment_intent_id"):
+            donation_data["payment_intent_id"] = data["payment_intent_id"]
         
         print(f"Inserting donation data into Supabase: {donation_data}")
         
@@ -65,6 +89,12 @@ def create_donation():
             return jsonify({"status": "success", "data": response.data}), 201
         else:
             return jsonify({"status": "error", "message": "Failed to create donation - no data returned"}), 400
+
+    except APIError as e:
+        if e.code == "23505":
+            return jsonify({"status": "error", "message": "Donation for this payment already exists"}), 409
+        print(f"Error creating donation: {e}")
+        return jsonify({"status": "error", "message": f"Server error: {e.message}"}), 500
             
     except Exception as e:
         print(f"Error creating donation: {e}")
@@ -72,12 +102,101 @@ def create_donation():
     
 # View All Donations
 @donation_blueprint.route('/', methods=['GET'])
+@table_versions.conditional("Donations", public=False)
 def view_donations():
-    response = supabase.table("Donations").select("*").execute()
-    if response.data:
-        return jsonify({"status": "success", "data": response.data}), 200
+    try:
+        page = list_page(supabase, DONATION_LIST, request.args)
+        return jsonify({"status": "success", **page}), 200
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        print(f"Error listing donations: {e}")
+        return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
+
+# Export Donations (streamed in chunks for finance reporting)
+@donation_blueprint.route('/export', methods=['GET'])
+def export_donations():
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in FORMATS:
+        return jsonify({"status": "error", "message": "format must be ndjson or csv"}), 400
+    compress = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+
+    try:
+        fields = parse_fields(request.args.get("fields"), DONATION_LIST.key) or DEFAULT_FIELDS
+        chunks = iter_chunks(supabase, DONATION_LIST, request.args, EXPORT_CHUNK_SIZE, fields)
+        # Run the first query now so bad filters are reported as a 400, not a broken stream
+        first = next(chunks, None)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    def all_chunks():
+        if first is not None:
+            yield first
+            yield from chunks
+
+    headers = {"Content-Disposition": f"attachment; filename=donations.{export_format}"}
+    if compress:
+        # A transfer encoding: clients that decode it save the plain file under the plain name
+        headers["Content-Encoding"] = "gzip"
+    return Response(
+        stream_with_context(export_stream(all_chunks(), export_format, fields, compress)),
+        mimetype=FORMATS[export_format],
+        headers=headers,
+    )
+
+def increment_campaign(campaign_id, amount):
+    """
+    Add an imported total through the campaign service so its cache and the checker stay current
+    """
+    try:
+        response = client.post("campaign", f"/{campaign_id}/increment", json={"amount": amount})
+        if response.status_code == 200:
+            return True
+        print(f"Failed to increment campaign {campaign_id}: {response.text}")
+    except Exception as e:
+        print(f"Campaign service unavailable while incrementing {campaign_id}: {e}")
+    return False
+
+# Import Donations (CSV or NDJSON upload of email, name, campaign_id, amount)
+@donation_blueprint.route('/import', methods=['POST'])
+def import_donation_file():
+    upload = request.files.get("file")
+    if upload:
+        stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
     else:
-        return jsonify({"status": "error", "message": "Failed to retrieve donations"}), 400
+        stream, filename, content_type = request.stream, None, request.mimetype
+    import_format = request.args.get("format") or detect_format(filename, content_type)
+    if import_format not in IMPORT_FORMATS:
+        return jsonify({"status": "error", "message": "format must be csv or ndjson"}), 400
+
+    try:
+        summary, errors = import_donations(supabase, read_records(stream, import_format), increment_campaign)
+    except UnicodeDecodeError:
+        return jsonify({"status": "error", "message": "File must be UTF-8 encoded"}), 400
+    except Exception as e:
+        print(f"Error importing donations: {e}")
+        return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
+
+    status_code = 200 if summary["imported"] or not errors else 400
+    return jsonify({"status": "success" if status_code == 200 else "error", "data": summary, "errors": errors}), status_code
+
+# Leaderboard (aggregated in the database)
+@donation_blueprint.route('/leaderboard', methods=['GET'])
+def view_leaderboard():
+    try:
+        result = build_leaderboard(
+            supabase,
+            limit=request.args.get("limit", DEFAULT_LIMIT, type=int),
+            campaign_id=request.args.get("campaign_id", type=int),
+            window=request.args.get("window", "all"),
+            cursor=request.args.get("cursor"),
+        )
+        return jsonify({"status": "success", "data": result}), 200
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        print(f"Error building leaderboard: {e}")
+        return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
     
 # View Donations
 @donation_blueprint.route('/<int:donation_id>', methods=['GET'])
@@ -92,11 +211,13 @@ def view_donor_donations(donation_id):
 @donation_blueprint.route('/<int:donation_id>', methods=['PUT'])
 def update_donation(donation_id):
     data = request.json
-    response = supabase.table("Donations").update({
-        "campaign_id": data.get("campaign_id"),
-        "donor_id": data.get("donor_id"),
-        "amount": data.get("amount"),
-    }).eq("donation_id", donation_id).execute()
+    # Only send the fields that were provided so the running totals stay correct
+    update_data = {
+        key: data[key] for key in ("campaign_id", "donor_id", "amount") if key in data
+    }
+    if not update_data:
+        return jsonify({"status": "error", "message": "No data provided"}), 400
+    response = supabase.table("Donations").update(update_data).eq("donation_id", donation_id).execute()
     if response.data:
         return jsonify({"status": "success", "data": response.data}), 200
     else:
@@ -111,6 +232,41 @@ def delete_donation(donation_id):
     else:
         return jsonify({"status": "error", "message": "Failed to delete donation"}), 400
     
+# Running Totals (maintained on every donation write)
+@donation_blueprint.route('/totals/donor/<int:donor_id>', methods=['GET'])
+def view_donor_totals(donor_id):
+    totals = get_donor_totals(supabase, donor_id)
+    if totals:
+        return jsonify({"status": "success", "data": totals}), 200
+    else:
+        return jsonify({"status": "error", "message": "No donations found for donor"}), 404
+
+@donation_blueprint.route('/totals/campaign/<int:campaign_id>', methods=['GET'])
+def view_campaign_totals(campaign_id):
+    totals = get_campaign_totals(supabase, campaign_id)
+    if totals:
+        return jsonify({"status": "success", "data": totals}), 200
+    else:
+        return jsonify({"status": "error", "message": "No donations found for campaign"}), 404
+
+@donation_blueprint.route('/totals/donor/<int:donor_id>/campaign/<int:campaign_id>', methods=['GET'])
+def view_donor_campaign_totals(donor_id, campaign_id):
+    totals = get_donor_campaign_totals(supabase, donor_id, campaign_id)
+    if totals:
+        return jsonify({"status": "success", "data": totals}), 200
+    else:
+        return jsonify({"status": "error", "message": "No donations found for donor and campaign"}), 404
+
+# Rebuild Running Totals from scratch
+@donation_blueprint.route('/totals/rebuild', methods=['POST'])
+def rebuild_donation_totals():
+    try:
+        rebuild_totals(supabase)
+        return jsonify({"status": "success", "message": "Totals rebuilt"}), 200
+    except Exception as e:
+        print(f"Error rebuilding totals: {e}")
+        return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
+
 app.register_blueprint(donation_blueprint, url_prefix='/donation')
 
 if __name__ == '__main__':
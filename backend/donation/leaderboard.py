@@ -0,0 +1,127 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+RECENT_LIMIT = 10
+
+def window_start(window):
+    """
+    Convert a time window name (all, year, month, week) into an ISO start timestamp
+    """
+    now = datetime.now(timezone.utc)
+    if window == "year":
+        start = datetime(now.year, 1, 1, tzinfo=timezone.utc)
+    elif window == "month":
+        start = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+    elif window == "week":
+        start = now - timedelta(days=7)
+    else:
+        return None
+    return start.isoformat()
+
+
+def encode_cursor(row):
+    raw = json.dumps({"total": row["total"], "donor_id": row["donor_id"]})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return data["total"], data["donor_id"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def campaign_names(supabase, campaign_ids):
+    """
+    {campaign_id: name} for just the campaigns that appear on the page
+    """
+    if not campaign_ids:
+        return {}
+    rows = (
+        supabase.table("Campaigns")
+        .select("campaign_id, name")
+        .in_("campaign_id", sorted(campaign_ids))
+        .execute()
+        .data
+        or []
+    )
+    return {row["campaign_id"]: row.get("name") for row in rows}
+
+
+def build_leaderboard(supabase, limit=DEFAULT_LIMIT, campaign_id=None, window="all", cursor=None):
+    """
+    Build one page of the leaderboard from the database-side aggregates.
+
+    The first page also carries the recent donations, per-campaign totals and a
+    summary of the whole leaderboard; follow-up pages (with a cursor) only return
+    more top donors.
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    since = window_start(window)
+    campaign_ids = [campaign_id] if campaign_id is not None else None
+    after_total, after_donor_id = decode_cursor(cursor) if cursor else (None, None)
+
+    # Fetch one extra row to know whether another page exists
+    top = supabase.rpc("leaderboard_top_donors", {
+        "p_limit": limit + 1,
+        "p_campaign_ids": campaign_ids,
+        "p_since": since,
+        "p_after_total": after_total,
+        "p_after_donor_id": after_donor_id,
+    }).execute().data or []
+
+    next_cursor = encode_cursor(top[limit - 1]) if len(top) > limit else None
+    top = top[:limit]
+
+    recent, totals, summary = [], [], None
+    if not cursor:
+        recent = supabase.rpc("leaderboard_recent_donations", {
+            "p_limit": RECENT_LIMIT,
+            "p_campaign_ids": campaign_ids,
+            "p_since": since,
+        }).execute().data or []
+        totals = supabase.rpc("leaderboard_campaign_totals", {
+            "p_campaign_ids": campaign_ids,
+            "p_since": since,
+        }).execute().data or []
+        summary_rows = supabase.rpc("leaderboard_summary", {
+            "p_campaign_ids": campaign_ids,
+            "p_since": since,
+        }).execute().data or []
+        summary = summary_rows[0] if summary_rows else {"donor_count": 0, "total": 0, "donation_count": 0, "campaign_count": 0}
+
+    # Names for only the campaigns this response mentions
+    mentioned = {cid for row in top for cid in row.get("campaign_ids") or []}
+    mentioned.update(row["campaign_id"] for row in recent + totals if row.get("campaign_id") is not None)
+    names = campaign_names(supabase, mentioned)
+
+    top_donors = [
+        {
+            "donor_id": row["donor_id"],
+            "name": row.get("name"),
+            "email": row.get("email"),
+            "total": row["total"],
+            "donation_count": row["donation_count"],
+            "campaigns": [names[cid] for cid in row.get("campaign_ids") or [] if cid in names],
+            "latest_at": row.get("latest_at"),
+        }
+        for row in top
+    ]
+
+    result = {"top_donors": top_donors, "next_cursor": next_cursor}
+    if cursor:
+        return result
+
+    for row in recent:
+        row["campaign_name"] = names.get(row.get("campaign_id"))
+    for row in totals:
+        row["name"] = names.get(row.get("campaign_id"))
+
+    result["recent_donations"] = recent
+    result["campaign_totals"] = totals
+    result["summary"] = summary
+    return result
@@ -0,0 +1,59 @@
+import os
+import sys
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+# Running totals are maintained by the donations_totals trigger (see sql/donation_totals.sql),
+# so every lookup here is a single primary-key read.
+
+
+def get_donor_totals(supabase, donor_id):
+    response = (
+        supabase.table("DonorTotals")
+        .select("donor_id, total, donation_count, campaign_count, last_donated_at")
+        .eq("donor_id", donor_id)
+        .execute()
+    )
+    return response.data[0] if response.data else None
+
+
+def get_campaign_totals(supabase, campaign_id):
+    response = (
+        supabase.table("CampaignTotals")
+        .select("campaign_id, total, donation_count, donor_count, last_donated_at")
+        .eq("campaign_id", campaign_id)
+        .execute()
+    )
+    return response.data[0] if response.data else None
+
+
+def get_donor_campaign_totals(supabase, donor_id, campaign_id):
+    response = (
+        supabase.table("DonorCampaignTotals")
+        .select("donor_id, campaign_id, total, donation_count, last_donated_at")
+        .eq("donor_id", donor_id)
+        .eq("campaign_id", campaign_id)
+        .execute()
+    )
+    return response.data[0] if response.data else None
+
+
+def rebuild_totals(supabase):
+    """
+    Recompute every running total from the Donations table
+    """
+    supabase.rpc("rebuild_donation_totals", {}).execute()
+
+
+if __name__ == "__main__":
+    # Usage: python totals.py rebuild
+    if len(sys.argv) != 2 or sys.argv[1] != "rebuild":
+        print("Usage: python totals.py rebuild")
+        sys.exit(1)
+
+    load_dotenv()
+    client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    print("Rebuilding donation totals...")
+    rebuild_totals(client)
+    print("✅ Donation totals rebuilt")
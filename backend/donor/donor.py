@@ -1,9 +1,16 @@
 import os
+import sys
 from flask import Blueprint, Flask, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+# Shared backend modules live one directory up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conditional import TableVersions
+from listing import ListSpec, list_page
+from donor_index import DonorIndex, normalize_email
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -12,12 +19,49 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Table versions behind the ETag of the donor list
+table_versions = TableVersions(supabase)
+
+# Paging and filters of GET /donor/
+DONOR_LIST = ListSpec("Donors", "donor_id", equals=("donor_id",))
+
+# Repeat donors are resolved from memory (normalized email -> donor_id)
+donor_index = DonorIndex()
+
+# Largest batch accepted by POST /donor/upsert-batch
+UPSERT_BATCH_LIMIT = 1000
+
+def upsert_donors(donors):
+    """
+    Resolve [{"email", "name"}] to {normalized email: (donor_id, created)},
+    creating missing donors in one upsert_donors call (see sql/donor_upsert.sql)
+    """
+    resolved = {}
+    pending = {}
+    for donor in donors:
+        email = normalize_email(donor.get("email"))
+        if not email or email in resolved or email in pending:
+            continue
+        donor_id = donor_index.get(email)
+        if donor_id is not None:
+            resolved[email] = (donor_id, False)
+        else:
+            pending[email] = {"email": email, "name": donor.get("name")}
+
+    if pending:
+        response = supabase.rpc("upsert_donors", {"p_donors": list(pending.values())}).execute()
+        for row in response.data:
+            donor_index.put(row["email"], row["donor_id"])
+            resolved[row["email"]] = (row["donor_id"], row["created"])
+    return resolved
+
 # Create and configure Flask app
 app = Flask(__name__)
 CORS(app)
 
 # Create Blueprint for donor routes
 donor_blueprint = Blueprint("donor", __name__)
+table_versions.track_writes(donor_blueprint)
 
 # Health Check
 @donor_blueprint.route('/health', methods=['GET'])
@@ -39,12 +83,16 @@ def create_donor():
 
 # View All Donors
 @donor_blueprint.route('/', methods=['GET'])
+@table_versions.conditional("Donors", public=False)
 def get_donors():
-    response = supabase.table("Donors").select("*").execute()
-    if response.data:
-        return jsonify({"status": "success", "data": response.data}), 200
-    else:
-        return jsonify({"status": "error", "message": "No donors found"}), 404
+    try:
+        page = list_page(supabase, DONOR_LIST, request.args)
+        return jsonify({"status": "success", **page}), 200
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        print(f"Error listing donors: {e}")
+        return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
 
 # View Donor
 @donor_blueprint.route('/<int:donor_id>', methods=['GET'])
@@ -55,6 +103,46 @@ def get_donor(donor_id):
     else:
         return jsonify({"status": "error", "message": "Donor not found"}), 404
 
+# Upsert Donor (find or create by email in one call)
+@donor_blueprint.route('/upsert', methods=['POST'])
+def upsert_donor():
+    data = request.json or {}
+    email = normalize_email(data.get("email"))
+    if not email:
+        return jsonify({"status": "error", "message": "email is required"}), 400
+    try:
+        donor_id, created = upsert_donors([data])[email]
+    except Exception as e:
+        print(f"Error upserting donor {email}: {e}")
+        return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
+    return jsonify({"status": "success", "data": {"donor_id": donor_id, "email": email, "created": created}}), 201 if created else 200
+
+# Upsert Donors in a batch
+@donor_blueprint.route('/upsert-batch', methods=['POST'])
+def upsert_donor_batch():
+    donors = (request.json or {}).get("donors")
+    if not isinstance(donors, list) or not donors:
+        return jsonify({"status": "error", "message": "donors must be a non-empty list"}), 400
+    if len(donors) > UPSERT_BATCH_LIMIT:
+        return jsonify({"status": "error", "message": f"At most {UPSERT_BATCH_LIMIT} donors per batch"}), 400
+    if not all(isinstance(donor, dict) for donor in donors):
+        return jsonify({"status": "error", "message": "Each donor must be an object with an email"}), 400
+    try:
+        resolved = upsert_donors(donors)
+    except Exception as e:
+        print(f"Error upserting donor batch: {e}")
+        return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
+    data = [
+        {"email": email, "donor_id": donor_id, "created": created}
+        for email, (donor_id, created) in resolved.items()
+    ]
+    return jsonify({"status": "success", "data": data}), 200
+
+# Donor Index Metrics
+@donor_blueprint.route('/index/stats', methods=['GET'])
+def view_index_stats():
+    return jsonify({"status": "success", "data": donor_index.stats()}), 200
+
 # Update Donor
 @donor_blueprint.route('/<int:donor_id>', methods=['PUT'])
 def update_donor(donor_id):
@@ -64,6 +152,7 @@ def update_donor(donor_id):
         "email": data.get("email"),
     }).eq("donor_id", donor_id).execute()
     if response.data:
+        donor_index.forget_donor(donor_id)
         return jsonify({"status": "success", "data": response.data}), 200
     else:
         return jsonify({"status": "error", "message": "Failed to update donor"}), 400
@@ -73,6 +162,7 @@ def update_donor(donor_id):
 def delete_donor(donor_id):
     response = supabase.table("Donors").delete().eq("donor_id", donor_id).execute()
     if response.data:
+        donor_index.forget_donor(donor_id)
         return jsonify({"status": "success", "message": "Donor deleted successfully"}), 200
     else:
         return jsonify({"status": "error", "message": "Failed to delete donor"}), 400
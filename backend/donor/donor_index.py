@@ -0,0 +1,57 @@
+"""
+In-memory LRU index from normalized email to donor_id.
+
+A donor's id never changes, so repeat donors are resolved without touching
+the database. Entries are dropped when a donor is deleted or changes email.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+DONOR_INDEX_SIZE = int(os.getenv("DONOR_INDEX_SIZE", "50000"))
+
+
+def normalize_email(email):
+    return str(email or "").strip().lower()
+
+
+class DonorIndex:
+    def __init__(self, max_entries=DONOR_INDEX_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, email):
+        with self._lock:
+            donor_id = self.entries.get(email)
+            if donor_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(email)
+            return donor_id
+
+    def put(self, email, donor_id):
+        with self._lock:
+            self.entries[email] = donor_id
+            self.entries.move_to_end(email)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def forget_donor(self, donor_id):
+        with self._lock:
+            for email in [e for e, d in self.entries.items() if d == donor_id]:
+                del self.entries[email]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0,
+        }
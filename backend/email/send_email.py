@@ -1,12 +1,19 @@
+import math
 import os
-import smtplib
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from email.message import EmailMessage
 from email.utils import formataddr
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
 from dotenv import load_dotenv
 from flask import Blueprint, Flask, jsonify, request
 from flask_cors import CORS
 
+# Shared backend modules live one directory up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outbox import Outbox, OutboxWorker
+from smtp_pool import RateLimiter, SMTPConnectionPool
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -18,58 +25,83 @@ CORS(app)
 email_blueprint = Blueprint("email", __name__)
 
 # ---------- Configuration ----------
-SMTP_HOST = "smtp.gmail.com"
-SMTP_PORT = 587
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
 FROM_NAME = "Project Reach Team"
 FROM_EMAIL = SMTP_USER
-TEMPLATE_DIR = "templates"
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+# Set EMAIL_TEMPLATE_RELOAD=true in development to pick up template edits without a restart
+TEMPLATE_RELOAD = os.getenv("EMAIL_TEMPLATE_RELOAD", "false").lower() == "true"
+# Optional directory for compiled template bytecode, for a faster cold start
+TEMPLATE_BYTECODE_CACHE = os.getenv("JINJA_BYTECODE_CACHE")
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+BATCH_MAX_CONCURRENCY = SMTP_POOL_SIZE
+# Limits of a batch that does not set concurrency / rate_per_second itself
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv("SMTP_BATCH_CONCURRENCY", str(SMTP_POOL_SIZE)))
+BATCH_DEFAULT_RATE = float(os.getenv("SMTP_RATE_PER_SECOND", "10"))
+if BATCH_DEFAULT_CONCURRENCY <= 0 or not (0 < BATCH_DEFAULT_RATE < math.inf):
+    raise ValueError("SMTP_BATCH_CONCURRENCY and SMTP_RATE_PER_SECOND must be positive")
+
+# Subject and template for each email type
+EMAIL_TYPES = {
+    "thanks": ("Thank You for Your Donation!", "thanks.html"),
+    "post_event": ("Campaign Update - PROJECT REACH", "post_event.html"),
+    "badge": ("Congratulations - You've Earned a Badge!", "badge.html"),
+}
+
+def create_template_environment():
+    bytecode_cache = None
+    if TEMPLATE_BYTECODE_CACHE:
+        os.makedirs(TEMPLATE_BYTECODE_CACHE, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(TEMPLATE_BYTECODE_CACHE)
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(["html", "xml"]),
+        auto_reload=TEMPLATE_RELOAD,
+        bytecode_cache=bytecode_cache,
+    )
+
+# One environment for the whole process; every template is compiled once at startup
+template_env = create_template_environment()
+compiled_templates = {
+    template_file: template_env.get_template(template_file)
+    for _, template_file in EMAIL_TYPES.values()
+}
+
+def get_template(template_file):
+    if TEMPLATE_RELOAD:
+        # The environment checks the file's mtime and recompiles it when it changed
+        return template_env.get_template(template_file)
+    return compiled_templates[template_file]
+
+outbox = Outbox()
+
+# Long-lived SMTP connections shared by the endpoints and the outbox workers
+smtp_pool = SMTPConnectionPool(
+    SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, size=SMTP_POOL_SIZE, starttls=SMTP_STARTTLS
+)
 
 def send_email(message: EmailMessage):
-    use_ssl = (SMTP_PORT == 465)
-    if use_ssl:
-        with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT) as smtp:
-            smtp.login(SMTP_USER, SMTP_PASS)
-            smtp.send_message(message)
-    else:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as smtp:
-            smtp.ehlo()
-            smtp.starttls()
-            smtp.ehlo()  # Call ehlo() again after starttls()
-            smtp.login(SMTP_USER, SMTP_PASS)
-            smtp.send_message(message)
+    smtp_pool.send(message)
 
 # Health Check
 @email_blueprint.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy"}), 200
 
-# Send Email
-@email_blueprint.route('/send-email', methods=['POST'])
-def send_email_template_endpoint():
-    data = request.json
-    email_type = data.get('email_type')
-    to_email = data.get('to_email')
-    context = data.get('context', {})
+def build_message(email_type, to_email, context):
+    """
+    Render the template for email_type and build the message to send
+    """
+    if email_type not in EMAIL_TYPES:
+        raise ValueError(f"Unknown email_type: {email_type}")
+    subject, template_file = EMAIL_TYPES[email_type]
 
-    # Select template based on email_type
-    if email_type == "thanks":
-        subject = "Thank You for Your Donation!"
-        template_file = "thanks.html"
-    elif email_type == "post_event":
-        subject = "Campaign Update - PROJECT REACH"
-        template_file = "post_event.html"
-    elif email_type == "badge":
-        subject = "Congratulations - You've Earned a Badge!"
-        template_file = "badge.html"
-
-    env = Environment(
-        loader=FileSystemLoader(TEMPLATE_DIR),
-        autoescape=select_autoescape(["html", "xml"])
-    )
-    template = env.get_template(template_file)
-    html_body = template.render(**context)
+    html_body = get_template(template_file).render(**context)
 
     msg = EmailMessage()
     msg["Subject"] = subject
@@ -77,6 +109,23 @@ def send_email_template_endpoint():
     msg["To"] = to_email
     msg.set_content("This is a fallback plain text message.")
     msg.add_alternative(html_body, subtype="html")
+    return msg
+
+def send_outbox_message(message):
+    send_email(build_message(message["email_type"], message["to_email"], message["context"]))
+
+# Send Email
+@email_blueprint.route('/send-email', methods=['POST'])
+def send_email_template_endpoint():
+    data = request.json
+    email_type = data.get('email_type')
+    to_email = data.get('to_email')
+    context = data.get('context', {})
+
+    try:
+        msg = build_message(email_type, to_email, context)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
     try:
         send_email(msg)
@@ -85,7 +134,99 @@ def send_email_template_endpoint():
         print(f"Error sending email: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def positive_number(value, name, default, integer=False):
+    """
+    Parse an optional positive number from a request body, or return `default`
+    when it is missing; raises ValueError with a client message
+    """
+    if value is None:
+        return default
+    # bool is an int subclass, but true is not a rate
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{name} must be a positive number")
+    try:
+        number = int(value) if integer else float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a positive number")
+    if not math.isfinite(number) or number <= 0:
+        raise ValueError(f"{name} must be a positive number")
+    return number
+
+# Send Many Emails over reused connections
+@email_blueprint.route('/send-batch', methods=['POST'])
+def send_batch_endpoint():
+    data = request.json or {}
+    email_type = data.get('email_type')
+    messages = data.get('messages') or []
+
+    try:
+        concurrency = positive_number(data.get('concurrency'), 'concurrency', BATCH_DEFAULT_CONCURRENCY, integer=True)
+        concurrency = min(concurrency, BATCH_MAX_CONCURRENCY)
+        limiter = RateLimiter(positive_number(data.get('rate_per_second'), 'rate_per_second', BATCH_DEFAULT_RATE))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    if email_type not in EMAIL_TYPES:
+        return jsonify({"status": "error", "message": f"Unknown email_type: {email_type}"}), 400
+    if not messages:
+        return jsonify({"status": "error", "message": "messages is required"}), 400
+
+    def send_one(item):
+        to_email = item.get('to_email')
+        try:
+            msg = build_message(email_type, to_email, item.get('context', {}))
+            limiter.wait()
+            send_email(msg)
+            return None
+        except Exception as e:
+            print(f"Error sending email to {to_email}: {e}")
+            return {"to_email": to_email, "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        failures = [result for result in pool.map(send_one, messages) if result]
+
+    return jsonify({
+        "status": "success" if not failures else "partial",
+        "sent": len(messages) - len(failures),
+        "failed": failures,
+    }), 200
+
+# Queue Email (sent in the background by the outbox workers)
+@email_blueprint.route('/enqueue', methods=['POST'])
+def enqueue_email_endpoint():
+    data = request.json or {}
+    email_type = data.get('email_type')
+    to_email = data.get('to_email')
+
+    if email_type not in EMAIL_TYPES:
+        return jsonify({"status": "error", "message": f"Unknown email_type: {email_type}"}), 400
+    if not to_email:
+        return jsonify({"status": "error", "message": "to_email is required"}), 400
+
+    queued = outbox.enqueue(email_type, to_email, data.get('context', {}), data.get('dedupe_key'))
+    return jsonify({"status": "success", "queued": queued}), 202
+
+# Outbox Metrics
+@email_blueprint.route('/outbox/stats', methods=['GET'])
+def outbox_stats():
+    return jsonify({"status": "success", "data": outbox.stats()}), 200
+
+# Dead Letters
+@email_blueprint.route('/outbox/dead', methods=['GET'])
+def outbox_dead_letters():
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify({"status": "success", "data": outbox.dead_letters(limit)}), 200
+
+@email_blueprint.route('/outbox/dead/<int:message_id>/retry', methods=['POST'])
+def outbox_retry_dead_letter(message_id):
+    if outbox.retry_dead(message_id):
+        return jsonify({"status": "success", "message": "Message queued again"}), 200
+    else:
+        return jsonify({"status": "error", "message": "Dead letter not found"}), 404
+
 app.register_blueprint(email_blueprint, url_prefix="/email")
 
 if __name__ == '__main__':
+    # Drain the outbox in the background while serving requests
+    OutboxWorker(outbox, send_outbox_message, workers=OUTBOX_WORKERS).start()
     app.run(host='0.0.0.0', port=8087)
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+Pool of long-lived SMTP connections.
+
+Opening a connection costs a TCP connect, EHLO, STARTTLS and login, so
+connections are kept open and reused across messages. A connection that
+was dropped by the server is discarded and the message is retried on a
+fresh one.
+"""
+
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+DISCONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)
+
+
+def is_connection_error(error):
+    """
+    True when the connection can no longer be trusted. SMTPException subclasses
+    OSError, so message-level SMTP errors have to be told apart from socket errors.
+    """
+    if isinstance(error, DISCONNECT_ERRORS):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the threads of one batch; rate_per_second must be positive
+    """
+
+    def __init__(self, rate_per_second):
+        self.rate = rate_per_second
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class SMTPConnectionPool:
+    def __init__(self, host, port, user=None, password=None, size=4, starttls=True, idle_timeout=60, timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.use_ssl = port == 465
+        self.starttls = starttls and not self.use_ssl
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            smtp.ehlo()
+            if self.starttls:
+                smtp.starttls()
+                smtp.ehlo()  # Call ehlo() again after starttls()
+        if self.user:
+            smtp.login(self.user, self.password)
+        return smtp
+
+    @staticmethod
+    def _close(smtp):
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def _checkout(self):
+        # Reuse the most recently returned connection; probe it if it sat idle for a while
+        while True:
+            try:
+                smtp, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - last_used < self.idle_timeout:
+                return smtp
+            try:
+                if smtp.noop()[0] == 250:
+                    return smtp
+            except OSError:
+                pass
+            self._close(smtp)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection; it goes back to the pool unless it failed
+        """
+        with self._slots:
+            smtp = self._checkout()
+            try:
+                yield smtp
+            except Exception as e:
+                if is_connection_error(e):
+                    self._close(smtp)
+                    raise
+                # Message-level error (e.g. rejected recipient); reset and keep the connection
+                try:
+                    smtp.rset()
+                    self._idle.put((smtp, time.monotonic()))
+                except OSError:
+                    self._close(smtp)
+                raise
+            else:
+                self._idle.put((smtp, time.monotonic()))
+
+    def send(self, message, retries=1):
+        """
+        Send a message, reconnecting and retrying if the connection was dropped
+        """
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as smtp:
+                    smtp.send_message(message)
+                return
+            except Exception as e:
+                if attempt == retries or not is_connection_error(e):
+                    raise
+
+    def close(self):
+        while True:
+            try:
+                smtp, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(smtp)
@@ -0,0 +1,314 @@
+"""
+Idempotency keys for endpoints that must not run twice (donate, charges).
+
+A client sends an `Idempotency-Key` header; the first request with a key runs
+and its response is stored in a local SQLite file for IDEMPOTENCY_TTL seconds.
+Retries with the same key get the stored response back (with an
+`Idempotent-Replayed: true` header) instead of charging or recording again.
+A retry that arrives while the first request is still running waits for it
+and returns the same response. Reusing a key with a different body is a 422.
+
+Server errors (5xx) are not stored, so the request can be retried with the
+same key. A view with several side effects can record each finished step
+under the key (see KeyProgress); the retry then skips those steps, so a
+failure after the charge does not charge or record anything twice. The store
+is shared by every service on the host, keyed by scope.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from functools import wraps
+
+from dotenv import load_dotenv
+from flask import Response, g, jsonify, make_response, request
+
+load_dotenv()
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "idempotency.db")
+IDEMPOTENCY_PATH = os.getenv("IDEMPOTENCY_PATH", DEFAULT_PATH)
+# How long a completed response is replayed
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# How long a request may stay in flight before its key can be taken over (e.g. after a crash)
+LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+# How long a duplicate waits for the request in flight before giving up with 409
+WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+SCHEMA = """
+create table if not exists idempotency (
+    scope text not null,
+    key text not null,
+    fingerprint text not null,
+    status text not null,
+    status_code integer,
+    content_type text,
+    body text,
+    locked_until real,
+    steps text,
+    expires_at real not null,
+    primary key (scope, key)
+);
+create index if not exists idempotency_expires_idx on idempotency (expires_at);
+"""
+
+
+class IdempotencyStore:
+    def __init__(self, path=IDEMPOTENCY_PATH, ttl=IDEMPOTENCY_TTL, lock_seconds=LOCK_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self._changed = threading.Condition()
+        self._last_purge = 0.0
+        with closing(self._connect()) as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.executescript(SCHEMA)
+            # Stores created before step progress was recorded
+            columns = {row["name"] for row in conn.execute("pragma table_info(idempotency)")}
+            if "steps" not in columns:
+                conn.execute("alter table idempotency add column steps text")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def begin(self, scope, key, fingerprint):
+        """
+        Claim a key. Returns ("new", None) when the caller should run the request,
+        ("done", row) with the stored response, ("in_flight", None) while another
+        request holds the key, or ("mismatch", None) when the body differs.
+        """
+        now = time.time()
+        self._purge(now)
+        conn = self._connect()
+        try:
+            conn.execute("begin immediate")
+            row = conn.execute(
+                "select * from idempotency where scope = ? and key = ?", (scope, key)
+            ).fetchone()
+            if row and row["expires_at"] > now:
+                if row["fingerprint"] != fingerprint:
+                    conn.execute("commit")
+                    return "mismatch", None
+                if row["status"] == "done":
+                    conn.execute("commit")
+                    return "done", row
+                if row["locked_until"] > now:
+                    conn.execute("commit")
+                    return "in_flight", None
+            # A retry keeps the steps its earlier attempts finished; an expired key starts over
+            conn.execute(
+                "insert into idempotency (scope, key, fingerprint, status, locked_until, expires_at)"
+                " values (?, ?, ?, 'in_flight', ?, ?)"
+                " on conflict (scope, key) do update set fingerprint = excluded.fingerprint,"
+                " status = 'in_flight', status_code = null, body = null, content_type = null,"
+                " locked_until = excluded.locked_until, expires_at = excluded.expires_at,"
+                " steps = case when idempotency.expires_at > ? then idempotency.steps end",
+                (scope, key, fingerprint, now + self.lock_seconds, now + self.ttl, now),
+            )
+            conn.execute("commit")
+            return "new", None
+        except Exception:
+            conn.execute("rollback")
+            raise
+        finally:
+            conn.close()
+
+    def complete(self, scope, key, status_code, body, content_type="application/json"):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "update idempotency set status = 'done', status_code = ?, body = ?, content_type = ?,"
+                " locked_until = null, expires_at = ? where scope = ? and key = ?",
+                (status_code, body, content_type, time.time() + self.ttl, scope, key),
+            )
+        self._notify()
+
+    def release(self, scope, key):
+        """
+        Let an in-flight key be retried. A key with finished steps is kept
+        (unlocked) so the retry can skip them; otherwise it is forgotten.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "delete from idempotency where scope = ? and key = ? and status = 'in_flight' and steps is null",
+                (scope, key),
+            )
+            conn.execute(
+                "update idempotency set locked_until = 0 where scope = ? and key = ? and status = 'in_flight'",
+                (scope, key),
+            )
+        self._notify()
+
+    def load_steps(self, scope, key):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "select steps from idempotency where scope = ? and key = ?", (scope, key)
+            ).fetchone()
+        return json.loads(row["steps"]) if row and row["steps"] else {}
+
+    def save_step(self, scope, key, step, result):
+        """
+        Record that `step` finished with `result` (anything JSON can encode)
+        """
+        conn = self._connect()
+        try:
+            conn.execute("begin immediate")
+            row = conn.execute(
+                "select steps from idempotency where scope = ? and key = ?", (scope, key)
+            ).fetchone()
+            if row is None:
+                conn.execute("commit")
+                return
+            steps = json.loads(row["steps"]) if row["steps"] else {}
+            steps[step] = result
+            conn.execute(
+                "update idempotency set steps = ? where scope = ? and key = ?", (json.dumps(steps), scope, key)
+            )
+            conn.execute("commit")
+        except Exception:
+            conn.execute("rollback")
+            raise
+        finally:
+            conn.close()
+
+    def wait(self, scope, key, fingerprint, timeout=WAIT_SECONDS):
+        """
+        Wait for the request holding a key to finish, then claim or replay it like begin()
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            state, row = self.begin(scope, key, fingerprint)
+            remaining = deadline - time.monotonic()
+            if state != "in_flight" or remaining <= 0:
+                return state, row
+            # Woken right away by requests in this process; polls for other processes
+            with self._changed:
+                self._changed.wait(min(remaining, 0.2))
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _purge(self, now):
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        with closing(self._connect()) as conn:
+            conn.execute("delete from idempotency where expires_at <= ?", (now,))
+
+
+def idempotent(store, scope):
+    """
+    Decorate a view so requests carrying an Idempotency-Key run at most once per key.
+    Requests without the header run as before.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({"success": False, "error": f"{HEADER} is too long"}), 400
+
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            state, row = store.wait(scope, key, fingerprint)
+            if state == "mismatch":
+                return jsonify({"success": False, "error": f"{HEADER} was already used with a different request"}), 422
+            if state == "in_flight":
+                return jsonify({"success": False, "error": "A request with this key is still in progress"}), 409
+            if state == "done":
+                response = Response(row["body"], status=row["status_code"], content_type=row["content_type"])
+                response.headers["Idempotent-Replayed"] = "true"
+                return response
+
+            g.idempotency = (store, scope, key)
+            g.idempotency_pending = False
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                store.release(scope, key)
+                raise
+            if g.idempotency_pending:
+                return response
+            if response.status_code >= 500:
+                store.release(scope, key)
+            else:
+                store.complete(scope, key, response.status_code, response.get_data(as_text=True), response.content_type)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def current_key():
+    """
+    The Idempotency-Key of the request being handled, if any
+    """
+    idempotency = g.get("idempotency")
+    return idempotency[2] if idempotency else None
+
+
+class KeyProgress:
+    """
+    The steps a keyed request has finished, kept across retries with the same key.
+    Safe to use from any thread, such as an event loop running the request's work.
+    """
+
+    def __init__(self, store, scope, key):
+        self.store = store
+        self.scope = scope
+        self.key = key
+        self.steps = store.load_steps(scope, key)
+
+    def done(self, step):
+        return step in self.steps
+
+    def result(self, step):
+        return self.steps.get(step)
+
+    def save(self, step, result):
+        self.steps[step] = result
+        self.store.save_step(self.scope, self.key, step, result)
+
+
+def current_progress():
+    """
+    Step progress of the request being handled, or None without an Idempotency-Key
+    """
+    idempotency = g.get("idempotency")
+    return KeyProgress(*idempotency) if idempotency else None
+
+
+def complete_later(future):
+    """
+    Keep the current key in flight and store the result of `future` (a
+    concurrent future resolving to (body, status_code)) once it finishes.
+    Used when a view gives up waiting but the work carries on in the background.
+    """
+    idempotency = g.get("idempotency")
+    if not idempotency:
+        return
+    store, scope, key = idempotency
+    g.idempotency_pending = True
+
+    def store_result(done):
+        try:
+            body, status_code = done.result()
+        except Exception:
+            store.release(scope, key)
+            return
+        if status_code >= 500:
+            store.release(scope, key)
+        else:
+            store.complete(scope, key, status_code, json.dumps(body))
+
+    future.add_done_callback(store_result)
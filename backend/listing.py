@@ -0,0 +1,167 @@
+"""
+Paginated list queries shared by the campaign, donor and donation services.
+
+Lists are paged by keyset on the table's primary key: a page asks for rows
+with a key greater than the last one seen, which stays an index range scan
+however deep the client pages (unlike OFFSET). Every list endpoint returns
+the same envelope:
+
+    {"status": "success", "data": [...], "next_cursor": "...", "limit": 100}
+
+`next_cursor` is null on the last page. Query parameters:
+
+    limit           page size (default LIST_PAGE_SIZE, at most LIST_MAX_PAGE_SIZE)
+    cursor          next_cursor of the previous page
+    fields          comma-separated columns to return (the key is always included)
+    campaign_id, donor_id, status
+                    exact-match filters, where the table has the column
+    from, to        range on the table's date column, where it has one (donated_at
+                    for donations, end_date for campaigns; ISO dates or
+                    timestamps; `to` is exclusive)
+    min_amount, max_amount
+                    amount range, where the table has an amount column
+"""
+
+import base64
+import json
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+
+from postgrest.exceptions import APIError
+
+DEFAULT_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", "500"))
+
+COLUMN_PATTERN = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+@dataclass(frozen=True)
+class ListSpec:
+    table: str
+    key: str
+    equals: tuple = ()
+    date_column: str = None
+    amount_column: str = None
+
+
+def encode_cursor(key_value):
+    raw = json.dumps({"after": key_value})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())["after"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if value in (None, ""):
+        return default
+    try:
+        return max(1, min(int(value), maximum))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+
+
+def parse_fields(value, key):
+    """
+    Turn `fields=a,b` into a select list; None means every column
+    """
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    for field in fields:
+        if not COLUMN_PATTERN.match(field):
+            raise ValueError(f"Invalid field: {field}")
+    if key not in fields:
+        fields.insert(0, key)
+    return fields
+
+
+def parse_timestamp(value, name):
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO date or timestamp")
+
+
+def parse_amount(value, name):
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+def apply_filters(query, spec, args):
+    """
+    Apply the filters from the query string that this table supports
+    """
+    for column in spec.equals:
+        value = args.get(column)
+        if value not in (None, ""):
+            query = query.eq(column, value)
+    if spec.date_column:
+        if args.get("from"):
+            query = query.gte(spec.date_column, parse_timestamp(args["from"], "from"))
+        if args.get("to"):
+            query = query.lt(spec.date_column, parse_timestamp(args["to"], "to"))
+    if spec.amount_column:
+        if args.get("min_amount"):
+            query = query.gte(spec.amount_column, parse_amount(args["min_amount"], "min_amount"))
+        if args.get("max_amount"):
+            query = query.lte(spec.amount_column, parse_amount(args["max_amount"], "max_amount"))
+    return query
+
+
+def fetch_rows(supabase, spec, args, fields, after, limit):
+    """
+    Rows with a key greater than `after`, in key order
+    """
+    query = supabase.table(spec.table).select(",".join(fields) if fields else "*")
+    query = apply_filters(query, spec, args)
+    if after is not None:
+        query = query.gt(spec.key, after)
+    try:
+        return query.order(spec.key).limit(limit).execute().data or []
+    except APIError as e:
+        # Unknown columns and malformed filter values are client errors
+        if e.code in ("42703", "22P02", "22007", "22008", "PGRST100"):
+            raise ValueError(e.message)
+        raise
+
+
+def iter_chunks(supabase, spec, args, chunk_size, fields=None):
+    """
+    Yield every matching row in key order, one chunk (list of rows) per query,
+    so a full-table walk never holds more than chunk_size rows
+    """
+    after = None
+    while True:
+        rows = fetch_rows(supabase, spec, args, fields, after, chunk_size)
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1][spec.key]
+
+
+def list_page(supabase, spec, args):
+    """
+    Fetch one page for a list endpoint; raises ValueError for bad parameters
+    """
+    limit = parse_limit(args.get("limit"))
+    fields = parse_fields(args.get("fields"), spec.key)
+    after = decode_cursor(args["cursor"]) if args.get("cursor") else None
+
+    # One extra row tells whether another page follows
+    rows = fetch_rows(supabase, spec, args, fields, after, limit + 1)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][spec.key])
+    return {"data": rows, "next_cursor": next_cursor, "limit": limit}
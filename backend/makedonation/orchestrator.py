@@ -0,0 +1,355 @@
+"""
+Async orchestration of the donate flow.
+
+The downstream calls run on one long-lived asyncio event loop in a background
+thread with a pooled httpx.AsyncClient. The Flask view hands each donation to
+that loop and waits only for the steps the response depends on:
+
+    charge -> (campaign increment || donor upsert) -> donation record
+
+The campaign row returned by the increment is reused for the email, and the
+thank-you email is written to the outbox (see outbox.py) instead of waiting on SMTP.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import uuid
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outbox import Outbox
+from service_client import CONNECT_TIMEOUT, POOL_SIZE, RETRIES, SERVICE_URLS, get_timeout
+
+# Maximum time a donation request waits for the orchestrated calls
+DONATE_TIMEOUT = float(os.getenv("DONATE_TIMEOUT", "60"))
+
+_loop = None
+_client = None
+_loop_lock = threading.Lock()
+_outbox = Outbox()
+
+
+class DonationError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _start_loop():
+    global _loop, _client
+    with _loop_lock:
+        if _loop is not None:
+            return _loop
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="donate-orchestrator", daemon=True).start()
+
+        async def make_client():
+            return httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(retries=RETRIES),
+                limits=httpx.Limits(max_connections=POOL_SIZE * len(SERVICE_URLS), max_keepalive_connections=POOL_SIZE),
+            )
+
+        _client = asyncio.run_coroutine_threadsafe(make_client(), loop).result()
+        _loop = loop
+        return _loop
+
+
+def submit(coro):
+    """
+    Schedule a coroutine on the orchestrator loop and return its concurrent future
+    """
+    loop = _start_loop()
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+
+def run(coro, timeout=DONATE_TIMEOUT):
+    """
+    Run a coroutine on the orchestrator loop and block until it finishes
+    """
+    return submit(coro).result(timeout)
+
+
+async def _call(method, service, path="", **kwargs):
+    _, read_timeout = get_timeout(service)
+    kwargs.setdefault("timeout", httpx.Timeout(read_timeout, connect=CONNECT_TIMEOUT))
+    return await _client.request(method, f"{SERVICE_URLS[service]}{path}", **kwargs)
+
+
+def _first_row(response_json):
+    data = response_json.get("data") if isinstance(response_json, dict) else None
+    if isinstance(data, list):
+        return data[0] if data else {}
+    return data or {}
+
+
+async def charge_card(charge, idempotency_key):
+    print("Forwarding to Stripe service:", charge)
+    try:
+        # The stripe service replays the first result for a repeated key and passes it on to Stripe
+        payment = await _call(
+            "POST", "stripe", "/charges", json=charge, headers={"Idempotency-Key": f"charge-{idempotency_key}"}
+        )
+    except httpx.TransportError:
+        raise DonationError("Stripe service is not available. Please start the Stripe service on port 8085.", 503)
+
+    print(f"Stripe service status code: {payment.status_code}")
+    if payment.status_code != 200:
+        raise DonationError(
+            f"Stripe service returned status {payment.status_code}: {payment.text}", payment.status_code
+        )
+
+    try:
+        payment_data = payment.json()
+    except ValueError:
+        raise DonationError(f"Invalid JSON response from Stripe service: {payment.text}", 500)
+
+    if not payment_data.get("success"):
+        raise DonationError(payment_data.get("error", "Payment failed"), 400)
+    return payment_data
+
+
+async def increment_campaign(campaign_id, amount):
+    """
+    Add the amount to the campaign and return the updated campaign row.
+    The card is already charged when this runs, so a failure is a 5xx: it is
+    not stored under the idempotency key and a keyed retry runs the increment again.
+    """
+    try:
+        response = await _call("POST", "campaign", f"/{campaign_id}/increment", json={"amount": amount})
+    except httpx.TransportError:
+        raise DonationError("Campaign service is not available. Please start the campaign service.", 503)
+
+    if response.status_code != 200:
+        raise DonationError(f"Failed to increment campaign {campaign_id}: {response.text}", 502)
+    return _first_row(response.json())
+
+
+async def resolve_donor(email, name):
+    """
+    Return the donor_id for this email, creating the donor when it does not exist yet
+    """
+    try:
+        donor_response = await _call("POST", "donor", "/upsert", json={"email": email, "name": name})
+    except httpx.TransportError:
+        raise DonationError("Donor service is not available. Please start the donor service.", 503)
+
+    if donor_response.status_code not in (200, 201):
+        raise DonationError(f"Failed to resolve donor: {donor_response.text}", donor_response.status_code)
+    donor_id = _first_row(donor_response.json()).get("donor_id")
+    if not donor_id:
+        raise DonationError(f"Failed to extract donor ID from response: {donor_response.text}", 500)
+    return donor_id
+
+
+async def record_donation(campaign_id, donor_id, amount):
+    donation = {"campaign_id": campaign_id, "donor_id": donor_id, "amount": amount}
+    print(f"Creating donation with data: {donation}")
+    try:
+        donation_response = await _call("POST", "donation", json=donation)
+    except httpx.TransportError:
+        raise DonationError("Donation service is not available. Please start the donation service.", 503)
+
+    if donation_response.status_code != 201:
+        raise DonationError(f"Failed to create donation: {donation_response.text}", donation_response.status_code)
+    return donation_response.json()
+
+
+async def queue_thank_you(email, name, amount, campaign_id, campaign, donation):
+    """
+    Write the thank-you email to the outbox; the email service sends it later
+    """
+    try:
+        if not campaign:
+            campaign = _first_row((await _call("GET", "campaign", f"/{campaign_id}")).json())
+        context = {
+            "donor_name": name,
+            "donation_amount": amount,
+            "campaign_name": campaign.get("name"),
+        }
+        donation_id = _first_row(donation).get("donation_id")
+        dedupe_key = f"thanks:{donation_id}" if donation_id else None
+        await asyncio.to_thread(_outbox.enqueue, "thanks", email, context, dedupe_key)
+    except Exception as e:
+        # The donation is already recorded; a missing thank-you must not fail it
+        print(f"Error queueing thank-you email to {email}: {e}")
+
+
+async def run_step(progress, step, coro):
+    """
+    Await one step of a keyed request, or return its saved result when an
+    earlier attempt with the same key already finished it. Results that are
+    None are not saved, so a retry runs the step again.
+    """
+    if progress is None:
+        return await coro
+    if progress.done(step):
+        coro.close()
+        return progress.result(step)
+    result = await coro
+    if result is not None:
+        await asyncio.to_thread(progress.save, step, result)
+    return result
+
+
+async def donate_flow(data, idempotency_key=None, progress=None):
+    """
+    Run one donation and return (response_body, status_code). Without a
+    client key the charge still gets a fresh one, which covers internal retries.
+    With `progress` (see idempotency.KeyProgress) each step that finishes is
+    recorded under the key, so a retry after a failure picks up where it stopped
+    instead of incrementing the campaign or recording the donation again.
+    """
+    campaign_id = data.get("campaign_id")
+    name = data.get("name")
+    email = data.get("email")
+    amount = data.get("amount")
+
+    try:
+        await run_step(progress, "charge", charge_card(data.get("charge"), idempotency_key or uuid.uuid4().hex))
+
+        # The campaign total and the donor record do not depend on each other
+        campaign, donor_id = await asyncio.gather(
+            run_step(progress, "increment", increment_campaign(campaign_id, amount)),
+            run_step(progress, "donor", resolve_donor(email, name)),
+        )
+        if not donor_id:
+            return {"success": False, "error": "Failed to obtain donor ID"}, 500
+
+        donation = await run_step(progress, "donation", record_donation(campaign_id, donor_id, amount))
+
+        await queue_thank_you(email, name, amount, campaign_id, campaign, donation)
+        return {"success": True, "data": donation}, 201
+
+    except DonationError as e:
+        return {"success": False, "error": e.message}, e.status_code
+    except Exception as e:
+        return {"success": False, "error": f"Unexpected error: {str(e)}"}, 500
+
+
+async def create_payment_intent(data, idempotency_key):
+    """
+    Create a PaymentIntent for a donation; the browser confirms it with the
+    client secret and the webhook records the donation (see complete_flow)
+    """
+    try:
+        amount = float(data.get("amount"))
+    except (TypeError, ValueError):
+        return {"success": False, "error": "amount must be a number"}, 400
+    if amount <= 0 or not data.get("campaign_id") or not data.get("email"):
+        return {"success": False, "error": "campaign_id, email and a positive amount are required"}, 400
+
+    intent = {
+        "amount": round(amount * 100),
+        "currency": data.get("currency", "sgd"),
+        "description": data.get("description"),
+        # Stripe metadata values are strings
+        "metadata": {
+            "campaign_id": str(data["campaign_id"]),
+            "email": data["email"],
+            "name": data.get("name") or "",
+        },
+    }
+    try:
+        response = await _call(
+            "POST", "stripe", "/payment-intents", json=intent, headers={"Idempotency-Key": f"intent-{idempotency_key}"}
+        )
+    except httpx.TransportError:
+        return {"success": False, "error": "Stripe service is not available. Please start the Stripe service on port 8085."}, 503
+
+    body = response.json()
+    if response.status_code != 200:
+        return {"success": False, "error": body.get("error", "Failed to create payment")}, response.status_code
+    return {
+        "success": True,
+        "payment_intent_id": body["payment_intent_id"],
+        "client_secret": body["client_secret"],
+    }, 200
+
+
+async def fetch_payment_intent(payment_intent_id):
+    """
+    Read the PaymentIntent back from Stripe, so a completion never relies on
+    what its caller says about the payment
+    """
+    try:
+        response = await _call("GET", "stripe", f"/payment-intents/{payment_intent_id}")
+    except httpx.TransportError:
+        raise DonationError("Stripe service is not available. Please start the Stripe service on port 8085.", 503)
+
+    if response.status_code != 200:
+        raise DonationError(f"Failed to read payment {payment_intent_id}: {response.text}", response.status_code)
+    return response.json()
+
+
+async def record_paid_donation(campaign_id, donor_id, amount, payment_intent_id):
+    """
+    Record the donation and add it to the campaign in one database transaction.
+    Returns {"duplicate", "donation", "campaign"}; duplicate is true when the
+    intent was already recorded, in which case nothing changed.
+    """
+    paid = {"donor_id": donor_id, "amount": amount, "payment_intent_id": payment_intent_id}
+    try:
+        response = await _call("POST", "campaign", f"/{campaign_id}/donations", json=paid)
+    except httpx.TransportError:
+        raise DonationError("Campaign service is not available. Please start the campaign service.", 503)
+
+    if response.status_code not in (200, 201):
+        raise DonationError(f"Failed to record donation: {response.text}", response.status_code)
+    return response.json()["data"]
+
+
+async def complete_flow(data):
+    """
+    Record a donation whose PaymentIntent succeeded and return (response_body, status_code).
+    The intent is re-read from Stripe: it must have succeeded, and the campaign and
+    amount are taken from it (a caller that states them must agree). Safe to
+    repeat: a second completion of the same intent changes nothing. Only a
+    payment that can never become a donation gets a 4xx; downstream failures are 5xx.
+    """
+    payment_intent_id = data.get("payment_intent_id")
+    if not payment_intent_id:
+        return {"success": False, "error": "payment_intent_id is required"}, 400
+
+    try:
+        intent = await fetch_payment_intent(payment_intent_id)
+        if intent.get("status") != "succeeded":
+            return {"success": False, "error": f"Payment {payment_intent_id} has not succeeded"}, 409
+
+        metadata = intent.get("metadata") or {}
+        campaign_id = metadata.get("campaign_id")
+        email = metadata.get("email")
+        name = metadata.get("name")
+        # The amount actually received, in the currency's major unit
+        amount = intent.get("amount_received", 0) / 100
+        if not (campaign_id and email and amount > 0):
+            return {"success": False, "error": f"Payment {payment_intent_id} is not a donation"}, 400
+        if data.get("campaign_id") is not None and str(data["campaign_id"]) != campaign_id:
+            return {"success": False, "error": "campaign_id does not match the payment"}, 400
+        try:
+            stated_amount = None if data.get("amount") is None else float(data["amount"])
+        except (TypeError, ValueError):
+            return {"success": False, "error": "amount must be a number"}, 400
+        if stated_amount is not None and stated_amount != amount:
+            return {"success": False, "error": "amount does not match the payment"}, 400
+
+        donor_id = await resolve_donor(email, name)
+        result = await record_paid_donation(campaign_id, donor_id, amount, payment_intent_id)
+        if result["duplicate"]:
+            # Already completed by an earlier delivery of the event
+            return {"success": True, "duplicate": True}, 200
+
+        donation = {"data": result["donation"]}
+        await queue_thank_you(email, name, amount, campaign_id, result["campaign"], donation)
+        return {"success": True, "data": donation["data"]}, 201
+
+    except DonationError as e:
+        # A downstream 4xx (intent not found yet, donor service, deleted campaign)
+        # may clear up, and the card is already charged: answer 502 so the
+        # response is not stored under the idempotency key and a redelivery retries
+        return {"success": False, "error": e.message}, max(e.status_code, 502)
+    except Exception as e:
+        return {"success": False, "error": f"Unexpected error: {str(e)}"}, 500
@@ -0,0 +1,243 @@
+"""
+Persistent outbox for emails.
+
+Producers (the donate flow, checker.py) enqueue emails into a local SQLite file
+and return immediately; the email service drains the queue with a pool of
+worker threads. Failed sends are retried with exponential backoff and moved to
+a dead-letter state after OUTBOX_MAX_ATTEMPTS.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox.db")
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", DEFAULT_PATH)
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "5"))
+BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "3600"))
+# How long a claimed message may stay "sending" before another worker may take it over
+LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+
+SCHEMA = """
+create table if not exists outbox (
+    id integer primary key autoincrement,
+    email_type text not null,
+    to_email text not null,
+    context text not null,
+    dedupe_key text unique,
+    status text not null default 'pending',
+    attempts integer not null default 0,
+    next_attempt_at real not null,
+    locked_until real,
+    last_error text,
+    created_at real not null,
+    updated_at real not null
+);
+create index if not exists outbox_due_idx on outbox (status, next_attempt_at);
+"""
+
+
+class Outbox:
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, email_type, to_email, context, dedupe_key=None):
+        """
+        Queue one email. Messages with a dedupe_key that is already queued are skipped.
+        Returns True when a new message was queued.
+        """
+        return self.enqueue_many([
+            {"email_type": email_type, "to_email": to_email, "context": context, "dedupe_key": dedupe_key}
+        ]) == 1
+
+    def enqueue_many(self, messages):
+        """
+        Queue many emails in one transaction and return how many were new
+        """
+        now = time.time()
+        rows = [
+            (m["email_type"], m["to_email"], json.dumps(m.get("context") or {}), m.get("dedupe_key"), now, now, now)
+            for m in messages
+        ]
+        conn = self._connect()
+        try:
+            conn.execute("begin immediate")
+            before = conn.total_changes
+            conn.executemany(
+                "insert or ignore into outbox "
+                "(email_type, to_email, context, dedupe_key, next_attempt_at, created_at, updated_at) "
+                "values (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            inserted = conn.total_changes - before
+            conn.execute("commit")
+            return inserted
+        except Exception:
+            conn.execute("rollback")
+            raise
+        finally:
+            conn.close()
+
+    def claim(self, limit=1, lease_seconds=LEASE_SECONDS):
+        """
+        Atomically take up to `limit` due messages for sending
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("begin immediate")
+            rows = conn.execute(
+                "select * from outbox "
+                "where (status = 'pending' and next_attempt_at <= ?) "
+                "   or (status = 'sending' and locked_until <= ?) "
+                "order by next_attempt_at, id limit ?",
+                (now, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "update outbox set status = 'sending', locked_until = ?, updated_at = ? where id = ?",
+                [(now + lease_seconds, now, row["id"]) for row in rows],
+            )
+            conn.execute("commit")
+        except Exception:
+            conn.execute("rollback")
+            raise
+        finally:
+            conn.close()
+        return [self._as_message(row) for row in rows]
+
+    def mark_sent(self, message_id):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "update outbox set status = 'sent', locked_until = null, last_error = null, "
+                "attempts = attempts + 1, updated_at = ? where id = ?",
+                (time.time(), message_id),
+            )
+
+    def mark_failed(self, message_id, error):
+        """
+        Record a failed attempt and schedule a retry, or dead-letter the message
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            row = conn.execute("select attempts from outbox where id = ?", (message_id,)).fetchone()
+            if row is None:
+                return
+            attempts = row["attempts"] + 1
+            if attempts >= MAX_ATTEMPTS:
+                status, next_attempt_at = "dead", now
+            else:
+                status = "pending"
+                next_attempt_at = now + min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempts - 1)))
+            conn.execute(
+                "update outbox set status = ?, attempts = ?, next_attempt_at = ?, locked_until = null, "
+                "last_error = ?, updated_at = ? where id = ?",
+                (status, attempts, next_attempt_at, str(error)[:1000], now, message_id),
+            )
+
+    def stats(self):
+        """
+        Queue depth by status plus the age of the oldest pending message
+        """
+        with closing(self._connect()) as conn:
+            counts = {
+                row["status"]: row["count"]
+                for row in conn.execute("select status, count(*) as count from outbox group by status")
+            }
+            oldest = conn.execute(
+                "select min(created_at) as oldest from outbox where status in ('pending', 'sending')"
+            ).fetchone()["oldest"]
+        return {
+            "pending": counts.get("pending", 0),
+            "sending": counts.get("sending", 0),
+            "sent": counts.get("sent", 0),
+            "dead": counts.get("dead", 0),
+            "depth": counts.get("pending", 0) + counts.get("sending", 0),
+            "oldest_pending_age_seconds": round(time.time() - oldest, 1) if oldest else 0,
+        }
+
+    def dead_letters(self, limit=100):
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "select * from outbox where status = 'dead' order by updated_at desc limit ?", (limit,)
+            ).fetchall()
+        return [self._as_message(row) for row in rows]
+
+    def retry_dead(self, message_id):
+        """
+        Move a dead-lettered message back into the queue
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "update outbox set status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ? "
+                "where id = ? and status = 'dead'",
+                (now, now, message_id),
+            )
+            return cursor.rowcount == 1
+
+    @staticmethod
+    def _as_message(row):
+        message = dict(row)
+        message["context"] = json.loads(message["context"])
+        return message
+
+
+class OutboxWorker:
+    """
+    Pool of threads draining the outbox with send_fn(message)
+    """
+
+    def __init__(self, outbox, send_fn, workers=2, poll_interval=1.0):
+        self.outbox = outbox
+        self.send_fn = send_fn
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                messages = self.outbox.claim(limit=1)
+            except sqlite3.Error as e:
+                print(f"Outbox claim error: {e}")
+                messages = []
+
+            if not messages:
+                self._stop.wait(self.poll_interval)
+                continue
+
+            message = messages[0]
+            try:
+                self.send_fn(message)
+                self.outbox.mark_sent(message["id"])
+            except Exception as e:
+                print(f"Error sending outbox message {message['id']} to {message['to_email']}: {e}")
+                self.outbox.mark_failed(message["id"], e)
@@ -0,0 +1,163 @@
+"""
+Read-through cache for hot database reads.
+
+Entries live in groups (e.g. one entry per campaign id in "campaign", one
+entry per query string in "list") so a write can drop a single row's entry
+and every list that may contain it. The default backend is an in-process
+TTL + LRU map; set REDIS_URL to share the cache (and its invalidations)
+between processes.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+try:
+    import redis
+except ImportError:  # Optional: only needed for the shared backend
+    redis = None
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL")
+DEFAULT_TTL = float(os.getenv("READ_CACHE_TTL", "30"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", "1000"))
+
+
+class LocalBackend:
+    shared = False
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.evictions = 0
+
+    def get(self, group, key):
+        entry = self.entries.get((group, key))
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self.entries[(group, key)]
+            return None
+        self.entries.move_to_end((group, key))
+        return entry
+
+    def set(self, group, key, value, ttl):
+        self.entries[(group, key)] = (value, time.monotonic() + ttl)
+        self.entries.move_to_end((group, key))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, group, key=None):
+        if key is not None:
+            self.entries.pop((group, key), None)
+            return
+        for entry_key in [k for k in self.entries if k[0] == group]:
+            del self.entries[entry_key]
+
+    def size(self):
+        return len(self.entries)
+
+
+class RedisBackend:
+    """
+    Each group is a Redis hash, so dropping a whole group is a single DEL
+    """
+
+    shared = True
+
+    def __init__(self, url, namespace):
+        if redis is None:
+            raise RuntimeError("REDIS_URL is set but the redis package is not installed")
+        self.client = redis.Redis.from_url(url)
+        self.namespace = namespace
+        self.evictions = 0
+
+    def _hash(self, group):
+        return f"{self.namespace}:{group}"
+
+    def get(self, group, key):
+        raw = self.client.hget(self._hash(group), key)
+        if raw is None:
+            return None
+        value, expires_at = json.loads(raw)
+        if expires_at <= time.time():
+            self.client.hdel(self._hash(group), key)
+            return None
+        return value, expires_at
+
+    def set(self, group, key, value, ttl):
+        pipe = self.client.pipeline()
+        pipe.hset(self._hash(group), key, json.dumps([value, time.time() + ttl]))
+        pipe.expire(self._hash(group), int(ttl) + 1)
+        pipe.execute()
+
+    def delete(self, group, key=None):
+        if key is not None:
+            self.client.hdel(self._hash(group), key)
+        else:
+            self.client.delete(self._hash(group))
+
+    def size(self):
+        return None
+
+
+class ReadThroughCache:
+    def __init__(self, namespace, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, redis_url=REDIS_URL):
+        self.ttl = ttl
+        if redis_url:
+            self.backend = RedisBackend(redis_url, namespace)
+        else:
+            self.backend = LocalBackend(max_entries)
+        self.shared = self.backend.shared
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, group, key, loader):
+        """
+        Return the cached value, or call loader() and cache its result.
+        Falsy results (e.g. no rows) are not cached.
+        """
+        key = str(key)
+        with self._lock:
+            entry = self.backend.get(group, key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self.invalidations
+
+        value = loader()
+        with self._lock:
+            # Skip caching if a write invalidated the cache while we were loading
+            if value and generation == self.invalidations:
+                self.backend.set(group, key, value, self.ttl)
+        return value
+
+    def invalidate(self, group, key=None):
+        """
+        Drop one entry, or the whole group when key is None
+        """
+        with self._lock:
+            self.backend.delete(group, None if key is None else str(key))
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": "redis" if self.shared else "local",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0,
+            "invalidations": self.invalidations,
+            "evictions": self.backend.evictions,
+            "entries": self.backend.size(),
+            "ttl_seconds": self.ttl,
+        }
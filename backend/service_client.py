@@ -0,0 +1,105 @@
+"""
+Shared HTTP client for calls between backend services.
+
+Every inter-service call goes through one pooled requests.Session, so
+connections to the donor, campaign, donation, stripe, email, checker and
+makedonation services are kept alive and reused instead of opening a new TCP
+connection per call.
+"""
+
+import os
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Read before the settings below, whichever service imports this first
+load_dotenv()
+
+# Base URLs of the services (override with e.g. DONOR_SERVICE_URL)
+SERVICE_URLS = {
+    "donor": os.getenv("DONOR_SERVICE_URL", "http://127.0.0.1:8081/donor"),
+    "campaign": os.getenv("CAMPAIGN_SERVICE_URL", "http://127.0.0.1:8080/campaign"),
+    "donation": os.getenv("DONATION_SERVICE_URL", "http://127.0.0.1:8084/donation"),
+    "stripe": os.getenv("STRIPE_SERVICE_URL", "http://127.0.0.1:8085/stripeservice"),
+    "email": os.getenv("EMAIL_SERVICE_URL", "http://127.0.0.1:8087/email"),
+    "checker": os.getenv("CHECKER_SERVICE_URL", "http://127.0.0.1:8088/checker"),
+    "makedonation": os.getenv("MAKEDONATION_SERVICE_URL", "http://127.0.0.1:8086/makedonation"),
+}
+
+# (connect, read) timeouts in seconds per service (override with e.g. STRIPE_SERVICE_TIMEOUT=30)
+DEFAULT_TIMEOUTS = {
+    "donor": 5,
+    "campaign": 5,
+    "donation": 5,
+    "stripe": 30,
+    "email": 30,
+    "checker": 2,
+    "makedonation": 30,
+}
+CONNECT_TIMEOUT = float(os.getenv("SERVICE_CONNECT_TIMEOUT", "2"))
+
+POOL_SIZE = int(os.getenv("SERVICE_POOL_SIZE", "20"))
+RETRIES = int(os.getenv("SERVICE_RETRIES", "3"))
+BACKOFF_FACTOR = float(os.getenv("SERVICE_BACKOFF_FACTOR", "0.2"))
+
+# Only idempotent methods are retried after the request was sent;
+# connection failures are retried for every method since nothing reached the service
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS"])
+
+
+def get_timeout(service):
+    read_timeout = float(os.getenv(f"{service.upper()}_SERVICE_TIMEOUT", DEFAULT_TIMEOUTS[service]))
+    return (CONNECT_TIMEOUT, read_timeout)
+
+
+class ServiceClient:
+    def __init__(self, pool_size=POOL_SIZE, retries=RETRIES, backoff_factor=BACKOFF_FACTOR):
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=len(SERVICE_URLS),
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, service, path=""):
+        return f"{SERVICE_URLS[service]}{path}"
+
+    def request(self, method, service, path="", **kwargs):
+        kwargs.setdefault("timeout", get_timeout(service))
+        return self.session.request(method, self.url(service, path), **kwargs)
+
+    def get(self, service, path="", **kwargs):
+        return self.request("GET", service, path, **kwargs)
+
+    def post(self, service, path="", **kwargs):
+        return self.request("POST", service, path, **kwargs)
+
+    def put(self, service, path="", **kwargs):
+        return self.request("PUT", service, path, **kwargs)
+
+    def patch(self, service, path="", **kwargs):
+        return self.request("PATCH", service, path, **kwargs)
+
+    def delete(self, service, path="", **kwargs):
+        return self.request("DELETE", service, path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+# Shared client used by every service in this process
+client = ServiceClient()
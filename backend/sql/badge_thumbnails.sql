@@ -0,0 +1,5 @@
+-- Small copy of each campaign's badge (WebP by default), set by the campaign
+-- service when BADGE_THUMBNAIL_SIZE is configured. Badge emails use it instead
+-- of the full-size badge when it is present.
+
+alter table "Campaigns" add column if not exists badge_thumbnail text;
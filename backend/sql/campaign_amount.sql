@@ -0,0 +1,15 @@
+-- Atomic increment of Campaigns.current_amount used by POST /campaign/<id>/increment.
+-- The read-modify-write happens inside a single UPDATE, so concurrent donations
+-- to the same campaign can never overwrite each other.
+
+create or replace function increment_campaign_amount(
+    p_campaign_id bigint,
+    p_amount numeric
+)
+returns setof "Campaigns"
+language sql as $$
+    update "Campaigns"
+    set current_amount = coalesce(current_amount, 0) + p_amount
+    where campaign_id = p_campaign_id
+    returning *;
+$$;
@@ -0,0 +1,10 @@
+-- Marker used by checker.py so badge emails are sent once per finished campaign,
+-- even if the checker crashes and is re-run.
+
+alter table "Campaigns" add column if not exists badges_sent_at timestamptz;
+
+create index if not exists campaigns_status_idx on "Campaigns" (status);
+
+-- Campaigns that finished before the marker existed already had their badge
+-- emails sent by the old checker; mark them so they are not sent again.
+update "Campaigns" set badges_sent_at = now() where status = 'finished' and badges_sent_at is null;
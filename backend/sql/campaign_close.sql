@@ -0,0 +1,15 @@
+-- Goal close used by checker.py. The goal check and the status change are one
+-- UPDATE, so a campaign is only closed if the row itself has reached its goal,
+-- not a stale copy sent with an event, and only one caller wins the transition.
+
+create or replace function close_campaign_at_goal(p_campaign_id bigint)
+returns setof "Campaigns"
+language sql as $$
+    update "Campaigns"
+    set status = 'finished'
+    where campaign_id = p_campaign_id
+      and status = 'open'
+      and goal_amount > 0
+      and coalesce(current_amount, 0) >= goal_amount
+    returning *;
+$$;
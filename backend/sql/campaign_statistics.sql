@@ -0,0 +1,78 @@
+-- Campaign statistics in one call, used by checker.py and GET /campaign/stats.
+-- Status counts, totals and goal attainment come from one grouped pass over
+-- "Campaigns"; donation velocity is a range scan on the donated_at index.
+-- `active` counts open campaigns whose end_date has not passed, the same rows
+-- GET /campaign/?status=open&from=<now> lists.
+
+create index if not exists donations_donated_at_idx on "Donations" (donated_at desc);
+
+create or replace function campaign_statistics(p_velocity_days integer default 7)
+returns json
+language plpgsql stable as $$
+begin
+    -- The velocity figures divide by the window length
+    if p_velocity_days is null or p_velocity_days <= 0 then
+        raise exception 'p_velocity_days must be a positive number of days'
+            using errcode = '22023';
+    end if;
+
+    return (
+        with per_campaign as (
+            select status,
+                   status = 'open' and end_date > now() as running,
+                   coalesce(current_amount, 0) as raised,
+                   goal_amount,
+                   case
+                       when coalesce(goal_amount, 0) <= 0 then null
+                       else coalesce(current_amount, 0) / goal_amount
+                   end as attainment
+            from "Campaigns"
+        ), campaigns as (
+            select count(*) as total,
+                   count(*) filter (where running) as active,
+                   coalesce(sum(raised), 0) as total_raised,
+                   coalesce(sum(goal_amount), 0) as total_goal,
+                   count(*) filter (where attainment < 0.25) as "0-25",
+                   count(*) filter (where attainment >= 0.25 and attainment < 0.5) as "25-50",
+                   count(*) filter (where attainment >= 0.5 and attainment < 0.75) as "50-75",
+                   count(*) filter (where attainment >= 0.75 and attainment < 1) as "75-100",
+                   count(*) filter (where attainment >= 1) as "100+",
+                   count(*) filter (where attainment is null) as "no_goal"
+            from per_campaign
+        ), statuses as (
+            select coalesce(json_object_agg(coalesce(status, 'unknown'), count), '{}'::json) as counts
+            from (select status, count(*) as count from per_campaign group by status) s
+        ), velocity as (
+            select count(*) filter (where donated_at >= now() - interval '1 day') as donations_24h,
+                   count(*) as donations_window,
+                   coalesce(sum(amount), 0) as amount_window
+            from "Donations"
+            where donated_at >= now() - make_interval(days => p_velocity_days)
+        )
+        select json_build_object(
+            'total', c.total,
+            'status_counts', s.counts,
+            'active', c.active,
+            'total_raised', c.total_raised,
+            'total_goal', c.total_goal,
+            'attainment_distribution', json_build_object(
+                '0-25', c."0-25",
+                '25-50', c."25-50",
+                '50-75', c."50-75",
+                '75-100', c."75-100",
+                '100+', c."100+",
+                'no_goal', c."no_goal"
+            ),
+            'velocity', json_build_object(
+                'window_days', p_velocity_days,
+                'donations_last_24h', v.donations_24h,
+                'donations_in_window', v.donations_window,
+                'amount_in_window', v.amount_window,
+                'donations_per_day', round(v.donations_window::numeric / p_velocity_days, 2),
+                'amount_per_day', round(v.amount_window::numeric / p_velocity_days, 2)
+            )
+        )
+        from campaigns c, statuses s, velocity v
+    );
+end;
+$$;
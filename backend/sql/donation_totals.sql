@@ -0,0 +1,162 @@
+-- Running totals per donor, per campaign and per (donor, campaign).
+-- A trigger on "Donations" keeps them up to date inside the same transaction
+-- as every insert, update and delete, so reading a total is a primary-key lookup.
+
+create table if not exists "DonorTotals" (
+    donor_id bigint primary key references "Donors" (donor_id) on delete cascade,
+    total numeric not null default 0,
+    donation_count bigint not null default 0,
+    campaign_count bigint not null default 0,
+    last_donated_at timestamptz,
+    updated_at timestamptz not null default now()
+);
+
+create table if not exists "CampaignTotals" (
+    campaign_id bigint primary key references "Campaigns" (campaign_id) on delete cascade,
+    total numeric not null default 0,
+    donation_count bigint not null default 0,
+    donor_count bigint not null default 0,
+    last_donated_at timestamptz,
+    updated_at timestamptz not null default now()
+);
+
+create table if not exists "DonorCampaignTotals" (
+    donor_id bigint not null references "Donors" (donor_id) on delete cascade,
+    campaign_id bigint not null references "Campaigns" (campaign_id) on delete cascade,
+    total numeric not null default 0,
+    donation_count bigint not null default 0,
+    last_donated_at timestamptz,
+    updated_at timestamptz not null default now(),
+    primary key (donor_id, campaign_id)
+);
+
+-- For tables created before last_donated_at was added
+alter table "DonorTotals" add column if not exists last_donated_at timestamptz;
+alter table "CampaignTotals" add column if not exists last_donated_at timestamptz;
+alter table "DonorCampaignTotals" add column if not exists last_donated_at timestamptz;
+
+create index if not exists donor_totals_rank_idx on "DonorTotals" (total desc, donor_id desc);
+create index if not exists donor_campaign_totals_campaign_idx on "DonorCampaignTotals" (campaign_id, total desc);
+-- Keyset pages of a campaign's donors (checker.get_campaign_recipients)
+create index if not exists donor_campaign_totals_campaign_donor_idx on "DonorCampaignTotals" (campaign_id, donor_id);
+
+-- Apply one donation's contribution (p_count = 1) or removal (p_count = -1).
+-- Adding a donation can only move last_donated_at forward; removing one
+-- recomputes it from what is left, which deletes are rare enough to afford.
+drop function if exists apply_donation_delta(bigint, bigint, numeric, integer);
+create or replace function apply_donation_delta(
+    p_donor_id bigint,
+    p_campaign_id bigint,
+    p_amount numeric,
+    p_count integer,
+    p_donated_at timestamptz
+)
+returns void
+language plpgsql as $$
+declare
+    pair_count bigint;
+    donor_delta integer := 0;
+begin
+    if p_donor_id is null or p_campaign_id is null then
+        return;
+    end if;
+
+    insert into "DonorCampaignTotals" as t (donor_id, campaign_id, total, donation_count, last_donated_at)
+    values (p_donor_id, p_campaign_id, p_amount * p_count, p_count, case when p_count > 0 then p_donated_at end)
+    on conflict (donor_id, campaign_id) do update
+        set total = t.total + excluded.total,
+            donation_count = t.donation_count + excluded.donation_count,
+            last_donated_at = case
+                when p_count > 0 then greatest(t.last_donated_at, excluded.last_donated_at)
+                else (select max(d.donated_at) from "Donations" d
+                      where d.donor_id = p_donor_id and d.campaign_id = p_campaign_id)
+            end,
+            updated_at = now()
+    returning donation_count into pair_count;
+
+    -- The pair appearing or disappearing changes the distinct counts
+    if p_count > 0 and pair_count = p_count then
+        donor_delta := 1;
+    elsif p_count < 0 and pair_count <= 0 then
+        donor_delta := -1;
+        delete from "DonorCampaignTotals"
+        where donor_id = p_donor_id and campaign_id = p_campaign_id;
+    end if;
+
+    insert into "DonorTotals" as t (donor_id, total, donation_count, campaign_count, last_donated_at)
+    values (p_donor_id, p_amount * p_count, p_count, donor_delta, case when p_count > 0 then p_donated_at end)
+    on conflict (donor_id) do update
+        set total = t.total + excluded.total,
+            donation_count = t.donation_count + excluded.donation_count,
+            campaign_count = t.campaign_count + excluded.campaign_count,
+            last_donated_at = case
+                when p_count > 0 then greatest(t.last_donated_at, excluded.last_donated_at)
+                else (select max(c.last_donated_at) from "DonorCampaignTotals" c
+                      where c.donor_id = p_donor_id)
+            end,
+            updated_at = now();
+
+    insert into "CampaignTotals" as t (campaign_id, total, donation_count, donor_count, last_donated_at)
+    values (p_campaign_id, p_amount * p_count, p_count, donor_delta, case when p_count > 0 then p_donated_at end)
+    on conflict (campaign_id) do update
+        set total = t.total + excluded.total,
+            donation_count = t.donation_count + excluded.donation_count,
+            donor_count = t.donor_count + excluded.donor_count,
+            last_donated_at = case
+                when p_count > 0 then greatest(t.last_donated_at, excluded.last_donated_at)
+                else (select max(c.last_donated_at) from "DonorCampaignTotals" c
+                      where c.campaign_id = p_campaign_id)
+            end,
+            updated_at = now();
+end;
+$$;
+
+create or replace function donations_totals_trigger()
+returns trigger
+language plpgsql as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform apply_donation_delta(old.donor_id, old.campaign_id, coalesce(old.amount, 0)::numeric, -1, old.donated_at);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform apply_donation_delta(new.donor_id, new.campaign_id, coalesce(new.amount, 0)::numeric, 1, new.donated_at);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists donations_totals on "Donations";
+create trigger donations_totals
+after insert or update of donor_id, campaign_id, amount, donated_at or delete on "Donations"
+for each row execute function donations_totals_trigger();
+
+-- Recompute every total from scratch to repair drift
+create or replace function rebuild_donation_totals()
+returns void
+language plpgsql as $$
+begin
+    lock table "Donations" in share mode;
+
+    delete from "DonorCampaignTotals";
+    delete from "DonorTotals";
+    delete from "CampaignTotals";
+
+    insert into "DonorCampaignTotals" (donor_id, campaign_id, total, donation_count, last_donated_at)
+    select donor_id, campaign_id, sum(coalesce(amount, 0)::numeric), count(*), max(donated_at)
+    from "Donations"
+    where donor_id is not null and campaign_id is not null
+    group by donor_id, campaign_id;
+
+    insert into "DonorTotals" (donor_id, total, donation_count, campaign_count, last_donated_at)
+    select donor_id, sum(total), sum(donation_count), count(*), max(last_donated_at)
+    from "DonorCampaignTotals"
+    group by donor_id;
+
+    insert into "CampaignTotals" (campaign_id, total, donation_count, donor_count, last_donated_at)
+    select campaign_id, sum(total), sum(donation_count), count(*), max(last_donated_at)
+    from "DonorCampaignTotals"
+    group by campaign_id;
+end;
+$$;
+
+select rebuild_donation_totals();
@@ -0,0 +1,46 @@
+-- Donor upsert keyed on the normalized (trimmed, lowercased) email, used by
+-- POST /donor/upsert, POST /donor/upsert-batch, the donate flow and the bulk
+-- import. The unique index makes two concurrent first-time donations from the
+-- same address resolve to one donor instead of creating a duplicate.
+--
+-- Creating the index fails if duplicates already exist; list them with
+--   select lower(btrim(email)), array_agg(donor_id) from "Donors"
+--   group by 1 having count(*) > 1;
+-- and merge them before running this file.
+
+create unique index if not exists donors_email_normalized_key on "Donors" (lower(btrim(email)));
+
+-- p_donors is a JSON array of {"email": ..., "name": ...}; one row comes back per distinct email
+create or replace function upsert_donors(p_donors jsonb)
+returns table (
+    email text,
+    donor_id bigint,
+    created boolean
+)
+language sql as $$
+    with input as (
+        select distinct on (lower(btrim(d ->> 'email')))
+               lower(btrim(d ->> 'email')) as email,
+               nullif(btrim(d ->> 'name'), '') as name
+        from jsonb_array_elements(p_donors) as d
+        where coalesce(btrim(d ->> 'email'), '') <> ''
+        order by lower(btrim(d ->> 'email'))
+    )
+    -- "do update" (not "do nothing") so existing donors are returned too, even
+    -- when a concurrent transaction inserted them after this statement started
+    insert into "Donors" as t (email, name)
+    select email, name from input
+    on conflict ((lower(btrim(email)))) do update
+        set name = coalesce(t.name, excluded.name)
+    returning lower(btrim(t.email)), t.donor_id, (t.xmax = 0);
+$$;
+
+create or replace function upsert_donor(p_email text, p_name text default null)
+returns table (
+    email text,
+    donor_id bigint,
+    created boolean
+)
+language sql as $$
+    select * from upsert_donors(jsonb_build_array(jsonb_build_object('email', p_email, 'name', p_name)));
+$$;
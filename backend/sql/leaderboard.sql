@@ -0,0 +1,190 @@
+-- Leaderboard aggregation functions used by GET /donation/leaderboard.
+-- Run this in the Supabase SQL editor after donation_totals.sql; the donation
+-- service calls these via RPC.
+
+create index if not exists donations_donor_id_idx on "Donations" (donor_id);
+create index if not exists donations_campaign_id_idx on "Donations" (campaign_id);
+create index if not exists donations_donated_at_idx on "Donations" (donated_at desc);
+
+-- Top donors by total, keyset-paginated on (total desc, donor_id desc).
+-- Without a time window the running totals from donation_totals.sql are used,
+-- so only the requested page is read instead of every donation.
+create or replace function leaderboard_top_donors(
+    p_limit integer,
+    p_campaign_ids bigint[] default null,
+    p_since timestamptz default null,
+    p_after_total numeric default null,
+    p_after_donor_id bigint default null
+)
+returns table (
+    donor_id bigint,
+    name text,
+    email text,
+    total numeric,
+    donation_count bigint,
+    campaign_ids bigint[],
+    latest_at timestamptz
+)
+language plpgsql stable as $$
+begin
+    if p_since is null then
+        return query
+        with ranked as (
+            select t.donor_id, t.total, t.donation_count
+            from "DonorTotals" t
+            where p_campaign_ids is null
+            union all
+            select t.donor_id, sum(t.total), sum(t.donation_count)::bigint
+            from "DonorCampaignTotals" t
+            where p_campaign_ids is not null and t.campaign_id = any(p_campaign_ids)
+            group by t.donor_id
+        ), page as (
+            select r.*
+            from ranked r
+            where p_after_total is null
+               or r.total < p_after_total
+               or (r.total = p_after_total and r.donor_id < p_after_donor_id)
+            order by r.total desc, r.donor_id desc
+            limit p_limit
+        )
+        select p.donor_id, dn.name::text, dn.email::text, p.total, p.donation_count,
+               (select array_agg(c.campaign_id order by c.total desc)
+                from "DonorCampaignTotals" c
+                where c.donor_id = p.donor_id
+                  and (p_campaign_ids is null or c.campaign_id = any(p_campaign_ids))),
+               (select max(c.last_donated_at)
+                from "DonorCampaignTotals" c
+                where c.donor_id = p.donor_id
+                  and (p_campaign_ids is null or c.campaign_id = any(p_campaign_ids)))
+        from page p
+        join "Donors" dn on dn.donor_id = p.donor_id
+        order by p.total desc, p.donor_id desc;
+        return;
+    end if;
+
+    return query
+    select d.donor_id,
+           dn.name::text,
+           dn.email::text,
+           sum(d.amount)::numeric as total,
+           count(*) as donation_count,
+           array_agg(distinct d.campaign_id) as campaign_ids,
+           max(d.donated_at) as latest_at
+    from "Donations" d
+    join "Donors" dn on dn.donor_id = d.donor_id
+    where (p_campaign_ids is null or d.campaign_id = any(p_campaign_ids))
+      and d.donated_at >= p_since
+    group by d.donor_id, dn.name, dn.email
+    having p_after_total is null
+        or sum(d.amount)::numeric < p_after_total
+        or (sum(d.amount)::numeric = p_after_total and d.donor_id < p_after_donor_id)
+    order by total desc, d.donor_id desc
+    limit p_limit;
+end;
+$$;
+
+-- Most recent donations with the donor name attached
+drop function if exists leaderboard_recent_donations(integer, bigint[], timestamptz);
+create or replace function leaderboard_recent_donations(
+    p_limit integer,
+    p_campaign_ids bigint[] default null,
+    p_since timestamptz default null
+)
+returns table (
+    donation_id bigint,
+    donor_id bigint,
+    name text,
+    campaign_id bigint,
+    amount numeric,
+    donated_at timestamptz
+)
+language sql stable as $$
+    select d.donation_id, d.donor_id, dn.name::text, d.campaign_id, d.amount::numeric, d.donated_at
+    from "Donations" d
+    join "Donors" dn on dn.donor_id = d.donor_id
+    where (p_campaign_ids is null or d.campaign_id = any(p_campaign_ids))
+      and (p_since is null or d.donated_at >= p_since)
+    order by d.donated_at desc
+    limit p_limit;
+$$;
+
+-- Totals per campaign
+create or replace function leaderboard_campaign_totals(
+    p_campaign_ids bigint[] default null,
+    p_since timestamptz default null
+)
+returns table (
+    campaign_id bigint,
+    total numeric,
+    donor_count bigint,
+    donation_count bigint
+)
+language plpgsql stable as $$
+begin
+    if p_since is null then
+        return query
+        select t.campaign_id, t.total, t.donor_count, t.donation_count
+        from "CampaignTotals" t
+        where p_campaign_ids is null or t.campaign_id = any(p_campaign_ids)
+        order by t.total desc;
+        return;
+    end if;
+
+    return query
+    select d.campaign_id,
+           sum(d.amount)::numeric as total,
+           count(distinct d.donor_id) as donor_count,
+           count(*) as donation_count
+    from "Donations" d
+    where (p_campaign_ids is null or d.campaign_id = any(p_campaign_ids))
+      and d.donated_at >= p_since
+    group by d.campaign_id
+    order by total desc;
+end;
+$$;
+
+-- Headline numbers for the whole leaderboard (not just the loaded page):
+-- distinct donors, amount raised, donations and campaigns with donations
+create or replace function leaderboard_summary(
+    p_campaign_ids bigint[] default null,
+    p_since timestamptz default null
+)
+returns table (
+    donor_count bigint,
+    total numeric,
+    donation_count bigint,
+    campaign_count bigint
+)
+language plpgsql stable as $$
+begin
+    if p_since is null and p_campaign_ids is null then
+        return query
+        select (select count(*) from "DonorTotals" t where t.donation_count > 0),
+               coalesce(sum(c.total), 0),
+               coalesce(sum(c.donation_count), 0)::bigint,
+               count(*) filter (where c.donation_count > 0)
+        from "CampaignTotals" c;
+        return;
+    end if;
+
+    if p_since is null then
+        return query
+        select count(distinct t.donor_id),
+               coalesce(sum(t.total), 0),
+               coalesce(sum(t.donation_count), 0)::bigint,
+               count(distinct t.campaign_id)
+        from "DonorCampaignTotals" t
+        where t.campaign_id = any(p_campaign_ids);
+        return;
+    end if;
+
+    return query
+    select count(distinct d.donor_id),
+           coalesce(sum(d.amount), 0)::numeric,
+           count(*),
+           count(distinct d.campaign_id)
+    from "Donations" d
+    where (p_campaign_ids is null or d.campaign_id = any(p_campaign_ids))
+      and d.donated_at >= p_since;
+end;
+$$;
@@ -0,0 +1,7 @@
+-- Indexes for the paginated list endpoints (listing.py). Pages are ordered by
+-- primary key, so each filter column is indexed together with the key and a
+-- filtered page stays a single index range scan.
+
+create index if not exists donations_campaign_page_idx on "Donations" (campaign_id, donation_id);
+create index if not exists donations_donor_page_idx on "Donations" (donor_id, donation_id);
+create index if not exists campaigns_status_page_idx on "Campaigns" (status, campaign_id);
@@ -0,0 +1,49 @@
+-- Links donations to the Stripe PaymentIntent that paid for them. The unique
+-- index makes completing a donation from the payment_intent.succeeded webhook
+-- safe to repeat: a redelivered event cannot record the donation twice.
+
+alter table "Donations" add column if not exists payment_intent_id text;
+
+create unique index if not exists donations_payment_intent_key on "Donations" (payment_intent_id);
+
+-- Record a paid donation and add it to the campaign in one transaction, used by
+-- POST /campaign/<id>/donations. A repeated payment_intent_id records nothing
+-- and returns duplicate = true; if the campaign update fails the insert is
+-- rolled back too, so the next delivery of the event can still complete it.
+create or replace function record_paid_donation(
+    p_campaign_id bigint,
+    p_donor_id bigint,
+    p_amount numeric,
+    p_payment_intent_id text
+)
+returns json
+language plpgsql as $$
+declare
+    v_donation "Donations";
+    v_campaign "Campaigns";
+begin
+    insert into "Donations" (campaign_id, donor_id, amount, payment_intent_id)
+    values (p_campaign_id, p_donor_id, p_amount, p_payment_intent_id)
+    on conflict (payment_intent_id) do nothing
+    returning * into v_donation;
+
+    if not found then
+        return json_build_object(
+            'duplicate', true,
+            'donation', (select row_to_json(d) from "Donations" d where d.payment_intent_id = p_payment_intent_id),
+            'campaign', null
+        );
+    end if;
+
+    update "Campaigns"
+    set current_amount = coalesce(current_amount, 0) + p_amount
+    where campaign_id = p_campaign_id
+    returning * into v_campaign;
+
+    if not found then
+        raise exception 'Campaign % not found', p_campaign_id using errcode = 'P0002';
+    end if;
+
+    return json_build_object('duplicate', false, 'donation', row_to_json(v_donation), 'campaign', row_to_json(v_campaign));
+end;
+$$;
@@ -0,0 +1,70 @@
+-- Per-table versions used for the ETags of the list endpoints
+-- (GET /campaign/, /donor/, /donation/). Every transaction that writes a table
+-- stamps that table's row with its own transaction id, so an unchanged version
+-- means the list has not changed and the service can answer If-None-Match with 304.
+--
+-- The stamp is written by a deferred constraint trigger, which runs at commit:
+-- the row lock on "TableVersions" is held only for the commit itself instead
+-- of from the first write to the end of the transaction, so concurrent
+-- donation inserts no longer queue behind each other. A transaction writing
+-- many rows stamps the table once; later firings find its txid already set.
+
+create table if not exists "TableVersions" (
+    table_name text primary key,
+    version bigint not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+create or replace function bump_table_version()
+returns trigger
+language plpgsql as $$
+begin
+    insert into "TableVersions" as v (table_name, version)
+    values (tg_table_name, txid_current())
+    on conflict (table_name) do update
+        set version = excluded.version,
+            updated_at = now()
+        where v.version is distinct from excluded.version;
+    return null;
+end;
+$$;
+
+-- Campaigns
+drop trigger if exists campaigns_table_version on "Campaigns";
+create constraint trigger campaigns_table_version
+after insert or update or delete on "Campaigns"
+deferrable initially deferred
+for each row execute function bump_table_version();
+
+drop trigger if exists campaigns_table_version_truncate on "Campaigns";
+create trigger campaigns_table_version_truncate
+after truncate on "Campaigns"
+for each statement execute function bump_table_version();
+
+-- Donors
+drop trigger if exists donors_table_version on "Donors";
+create constraint trigger donors_table_version
+after insert or update or delete on "Donors"
+deferrable initially deferred
+for each row execute function bump_table_version();
+
+drop trigger if exists donors_table_version_truncate on "Donors";
+create trigger donors_table_version_truncate
+after truncate on "Donors"
+for each statement execute function bump_table_version();
+
+-- Donations
+drop trigger if exists donations_table_version on "Donations";
+create constraint trigger donations_table_version
+after insert or update or delete on "Donations"
+deferrable initially deferred
+for each row execute function bump_table_version();
+
+drop trigger if exists donations_table_version_truncate on "Donations";
+create trigger donations_table_version_truncate
+after truncate on "Donations"
+for each statement execute function bump_table_version();
+
+insert into "TableVersions" (table_name)
+values ('Campaigns'), ('Donors'), ('Donations')
+on conflict (table_name) do nothing;
@@ -0,0 +1,148 @@
+"""
+Minimal local stand-in for the Stripe API, for testing without network access.
+
+    python fake_stripe.py                      # listens on 127.0.0.1:12111
+    STRIPE_API_BASE=http://127.0.0.1:12111 python stripeservice.py
+
+Supports creating, retrieving and confirming PaymentIntents and creating
+charges. Confirming an intent (POST /v1/payment_intents/<id>/confirm, which is
+what the browser does through Stripe.js) sends a signed payment_intent.succeeded
+event to FAKE_STRIPE_WEBHOOK_URL, like Stripe would.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from dotenv import load_dotenv
+from send_test_event import DEFAULT_URL, post_event
+
+load_dotenv()
+
+PORT = int(os.getenv("FAKE_STRIPE_PORT", "12111"))
+WEBHOOK_URL = os.getenv("FAKE_STRIPE_WEBHOOK_URL", DEFAULT_URL)
+
+intents = {}
+idempotent_responses = {}
+lock = threading.Lock()
+
+
+def parse_form(body):
+    """
+    Decode Stripe's form encoding, turning metadata[key]=value into a dict
+    """
+    data = {"metadata": {}}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        match = re.fullmatch(r"(\w+)\[(\w+)\]", key)
+        if match:
+            data.setdefault(match.group(1), {})[match.group(2)] = value
+        else:
+            data[key] = value
+    return data
+
+
+def new_id(prefix):
+    return f"{prefix}_fake_{uuid.uuid4().hex[:16]}"
+
+
+def send_succeeded(intent):
+    secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+    if not secret:
+        print("STRIPE_WEBHOOK_SECRET is not set; not sending webhook")
+        return
+    event = {
+        "id": new_id("evt"),
+        "object": "event",
+        "created": int(time.time()),
+        "livemode": False,
+        "type": "payment_intent.succeeded",
+        "data": {"object": intent},
+    }
+    try:
+        response = post_event(WEBHOOK_URL, event, secret)
+        print(f"Webhook for {intent['id']}: {response.status_code}")
+    except Exception as e:
+        print(f"Webhook for {intent['id']} failed: {e}")
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status, message):
+        self._reply(status, {"error": {"type": "invalid_request_error", "message": message}})
+
+    def do_GET(self):
+        match = re.fullmatch(r"/v1/payment_intents/(\w+)", self.path.split("?")[0])
+        if match and match.group(1) in intents:
+            return self._reply(200, intents[match.group(1)])
+        self._error(404, "No such resource")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = parse_form(self.rfile.read(length).decode())
+        key = self.headers.get("Idempotency-Key")
+        with lock:
+            if key and key in idempotent_responses:
+                return self._reply(*idempotent_responses[key])
+            status, body = self._route(self.path.split("?")[0], data)
+            if key:
+                idempotent_responses[key] = (status, body)
+        self._reply(status, body)
+
+    def _route(self, path, data):
+        if path == "/v1/payment_intents":
+            intent_id = new_id("pi")
+            intents[intent_id] = {
+                "id": intent_id,
+                "object": "payment_intent",
+                "amount": int(data["amount"]),
+                "amount_received": 0,
+                "currency": data.get("currency", "sgd"),
+                "description": data.get("description"),
+                "metadata": data["metadata"],
+                "client_secret": f"{intent_id}_secret_{uuid.uuid4().hex[:8]}",
+                "status": "requires_payment_method",
+                "livemode": False,
+            }
+            return 200, intents[intent_id]
+
+        match = re.fullmatch(r"/v1/payment_intents/(\w+)/confirm", path)
+        if match:
+            intent = intents.get(match.group(1))
+            if not intent:
+                return 404, {"error": {"type": "invalid_request_error", "message": "No such payment_intent"}}
+            intent.update(status="succeeded", amount_received=intent["amount"])
+            threading.Thread(target=send_succeeded, args=(dict(intent),), daemon=True).start()
+            return 200, intent
+
+        if path == "/v1/charges":
+            return 200, {
+                "id": new_id("ch"),
+                "object": "charge",
+                "amount": int(data["amount"]),
+                "currency": data.get("currency"),
+                "description": data.get("description"),
+                "paid": True,
+                "status": "succeeded",
+            }
+        return 404, {"error": {"type": "invalid_request_error", "message": f"Unrecognized request URL ({path})"}}
+
+    def log_message(self, format, *args):
+        print(f"fake stripe: {format % args}")
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", PORT), FakeStripeHandler)
+    print(f"Fake Stripe API on http://127.0.0.1:{PORT}")
+    server.serve_forever()
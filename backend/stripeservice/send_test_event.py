@@ -0,0 +1,83 @@
+"""
+Sign a webhook event the way Stripe does and post it to the webhook endpoint.
+
+    python send_test_event.py                                  # fixtures/payment_intent.succeeded.json
+    python send_test_event.py fixtures/payment_intent.payment_failed.json
+    python send_test_event.py --intent-id pi_test_0001 --campaign-id 3 --amount 2500
+
+Uses STRIPE_WEBHOOK_SECRET from .env. Sending the same --intent-id twice
+checks that a redelivered event does not record the donation twice.
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+DEFAULT_URL = "http://127.0.0.1:8085/stripeservice/webhook"
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """
+    Build a Stripe-Signature header for a raw payload
+    """
+    timestamp = int(timestamp or time.time())
+    signed = f"{timestamp}.{payload}".encode()
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def post_event(url, event, secret):
+    payload = json.dumps(event)
+    return requests.post(
+        url,
+        data=payload,
+        headers={"Content-Type": "application/json", "Stripe-Signature": sign_payload(payload, secret)},
+        timeout=30,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a signed test event to the Stripe webhook")
+    parser.add_argument("fixture", nargs="?", default=os.path.join(FIXTURE_DIR, "payment_intent.succeeded.json"))
+    parser.add_argument("--url", default=os.getenv("STRIPE_WEBHOOK_URL", DEFAULT_URL))
+    parser.add_argument("--intent-id", help="PaymentIntent id (default: a new one per run)")
+    parser.add_argument("--campaign-id")
+    parser.add_argument("--email")
+    parser.add_argument("--amount", type=int, help="Amount in cents")
+    args = parser.parse_args()
+
+    secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+    if not secret:
+        raise SystemExit("STRIPE_WEBHOOK_SECRET is not set")
+
+    with open(args.fixture) as f:
+        event = json.load(f)
+    intent = event["data"]["object"]
+    intent["id"] = args.intent_id or f"pi_test_{uuid.uuid4().hex[:16]}"
+    event["id"] = f"evt_test_{uuid.uuid4().hex[:16]}"
+    event["created"] = int(time.time())
+    if args.campaign_id:
+        intent["metadata"]["campaign_id"] = args.campaign_id
+    if args.email:
+        intent["metadata"]["email"] = args.email
+    if args.amount:
+        intent["amount"] = args.amount
+        if intent.get("amount_received"):
+            intent["amount_received"] = args.amount
+
+    response = post_event(args.url, event, secret)
+    print(f"{event['type']} for {intent['id']}: {response.status_code} {response.text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,34 @@
 import os
+import sys
 import stripe
 from flask import Blueprint, Flask, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+# Shared backend modules live one directory up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from idempotency import IdempotencyStore, current_key, idempotent
+from service_client import client
+
 # Load environment variables
 load_dotenv()
 
 # Initialize Stripe
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+# Send Stripe API calls to a local fake server for testing (see fake_stripe.py)
+if os.getenv("STRIPE_API_BASE"):
+    stripe.api_base = os.getenv("STRIPE_API_BASE")
 
 # Set up Supabase client
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Responses to requests with an Idempotency-Key, replayed on retries
+idempotency_store = IdempotencyStore()
+
 # Create Flask app and blueprint
 app = Flask(__name__)
 CORS(app)
@@ -27,8 +40,25 @@ payment_blueprint = Blueprint("stripeservice", __name__)
 def health():
     return jsonify({"status": "payment service alive"}), 200
 
+def stripe_error_response(e):
+    """
+    Map a Stripe exception to the service's error response
+    """
+    if isinstance(e, stripe.error.CardError):
+        return jsonify({"error": f"Card error: {e.user_message}"}), 402
+    if isinstance(e, stripe.error.RateLimitError):
+        return jsonify({"error": "Too many requests to Stripe API"}), 429
+    if isinstance(e, stripe.error.InvalidRequestError):
+        return jsonify({"error": f"Invalid request: {e.user_message}"}), 400
+    if isinstance(e, stripe.error.AuthenticationError):
+        return jsonify({"error": "Authentication with Stripe API failed"}), 401
+    if isinstance(e, stripe.error.APIConnectionError):
+        return jsonify({"error": "Network communication with Stripe failed"}), 503
+    return jsonify({"error": "Something went wrong with Stripe"}), 500
+
 # Get Stripe Charge
 @payment_blueprint.route('/charges', methods=['POST'])
+@idempotent(idempotency_store, "charges")
 def charge():
     try:
         data = request.get_json()
@@ -38,7 +68,9 @@ def charge():
             amount=data["amount"],
             currency=data["currency"],
             description=data["description"],
-            source=data["source"]
+            source=data["source"],
+            # Stripe returns the original charge for a repeated key
+            idempotency_key=current_key(),
         )
 
         print("✅ Charge created:", charge["id"])
@@ -48,27 +80,115 @@ def charge():
             "charge": charge
         }), 200
 
-    except stripe.error.CardError as e:
-        return jsonify({"error": f"Card error: {e.user_message}"}), 402
+    except stripe.error.StripeError as e:
+        return stripe_error_response(e)
 
-    except stripe.error.RateLimitError as e:
-        return jsonify({"error": "Too many requests to Stripe API"}), 429
+    except Exception as e:
+        return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
-    except stripe.error.InvalidRequestError as e:
-        return jsonify({"error": f"Invalid request: {e.user_message}"}), 400
+# Create Payment Intent (confirmed by the browser, completed by the webhook)
+@payment_blueprint.route('/payment-intents', methods=['POST'])
+@idempotent(idempotency_store, "payment-intents")
+def create_payment_intent():
+    try:
+        data = request.get_json()
 
-    except stripe.error.AuthenticationError as e:
-        return jsonify({"error": "Authentication with Stripe API failed"}), 401
+        intent = stripe.PaymentIntent.create(
+            amount=data["amount"],
+            currency=data["currency"],
+            description=data.get("description"),
+            # Everything the webhook needs to record the donation
+            metadata=data.get("metadata") or {},
+            automatic_payment_methods={"enabled": True},
+            idempotency_key=current_key(),
+        )
 
-    except stripe.error.APIConnectionError as e:
-        return jsonify({"error": "Network communication with Stripe failed"}), 503
+        print("✅ PaymentIntent created:", intent["id"])
+        return jsonify({
+            "success": True,
+            "payment_intent_id": intent["id"],
+            "client_secret": intent["client_secret"],
+            "status": intent["status"],
+        }), 200
+
+    except KeyError as e:
+        return jsonify({"error": f"Missing field: {e.args[0]}"}), 400
 
     except stripe.error.StripeError as e:
-        return jsonify({"error": "Something went wrong with Stripe"}), 500
+        return stripe_error_response(e)
 
     except Exception as e:
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
+# Get Payment Intent (the completion re-reads it instead of trusting its caller)
+@payment_blueprint.route('/payment-intents/<payment_intent_id>', methods=['GET'])
+def get_payment_intent(payment_intent_id):
+    try:
+        intent = stripe.PaymentIntent.retrieve(payment_intent_id).to_dict()
+        return jsonify({
+            "success": True,
+            "payment_intent_id": intent["id"],
+            "status": intent["status"],
+            "amount": intent["amount"],
+            "amount_received": intent.get("amount_received", 0),
+            "currency": intent["currency"],
+            "metadata": intent.get("metadata") or {},
+        }), 200
+
+    except stripe.error.StripeError as e:
+        return stripe_error_response(e)
+
+    except Exception as e:
+        return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+
+# Stripe Webhook
+@payment_blueprint.route('/webhook', methods=['POST'])
+def webhook():
+    if not STRIPE_WEBHOOK_SECRET:
+        # Without the secret no signature can be checked, so no event is accepted
+        return jsonify({"status": "error", "message": "STRIPE_WEBHOOK_SECRET is not configured"}), 503
+
+    try:
+        event = stripe.Webhook.construct_event(
+            request.get_data(), request.headers.get("Stripe-Signature"), STRIPE_WEBHOOK_SECRET
+        )
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid payload"}), 400
+    except stripe.error.SignatureVerificationError:
+        return jsonify({"status": "error", "message": "Invalid signature"}), 400
+
+    if event["type"] != "payment_intent.succeeded":
+        return jsonify({"status": "success", "message": f"Ignored {event['type']}"}), 200
+
+    intent = event["data"]["object"].to_dict()
+    metadata = intent.get("metadata") or {}
+    completion = {
+        "payment_intent_id": intent["id"],
+        "campaign_id": metadata.get("campaign_id"),
+        "email": metadata.get("email"),
+        "name": metadata.get("name"),
+        # The amount actually received, in the currency's major unit
+        "amount": intent.get("amount_received", intent.get("amount", 0)) / 100,
+    }
+    try:
+        # Stripe redelivers events; the key makes a redelivery replay the first result
+        response = client.post(
+            "makedonation", "/complete", json=completion, headers={"Idempotency-Key": f"complete-{intent['id']}"}
+        )
+    except Exception as e:
+        print(f"Could not complete donation for {intent['id']}: {e}")
+        return jsonify({"status": "error", "message": "Donation service unavailable"}), 503
+
+    if response.status_code >= 400:
+        # The card was charged, so never ack an event without a donation row: a
+        # non-2xx answer makes Stripe redeliver it, and events that keep failing
+        # stay listed as failed deliveries in the Stripe dashboard for follow-up.
+        # 4xx answers are retried too, since a missing intent, donor-service error
+        # or deleted campaign can be temporary.
+        print(f"Completing donation for {intent['id']} failed ({response.status_code}): {response.text}")
+        return jsonify({"status": "error", "message": "Failed to complete donation"}), 502
+    return jsonify({"status": "success"}), 200
+
 # Register blueprint
 app.register_blueprint(payment_blueprint, url_prefix='/stripeservice')
 
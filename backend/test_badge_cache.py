@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test the badge cache (make_badge) against the stub image and Storage APIs in
+benchmarks/stub_services.py. Checks that a repeated prompt is served from the
+cache, that identical concurrent requests share one generation and that
+force=true generates again.
+
+Usage: python test_badge_cache.py   (or pytest test_badge_cache.py)
+"""
+
+import atexit
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BACKEND_DIR, "benchmarks"))
+sys.path.append(os.path.join(BACKEND_DIR, "campaign"))
+
+from stub_services import start_stub_server
+
+CONCURRENT = 8
+# Long enough for every concurrent request to arrive while the first generation runs
+STUB_DELAY = 0.2
+
+# The campaign service reads its settings at import, so one stub serves every test
+_service = None
+_prompts = count()
+
+def start_badge_service():
+    """Start the stub image API and import the campaign service pointed at it (once)"""
+    global _service
+    if _service:
+        return _service
+
+    server, base_url = start_stub_server(delay=STUB_DELAY)
+    atexit.register(server.shutdown)
+
+    output_dir = tempfile.mkdtemp()
+    os.environ.update({
+        "API_URL": f"{base_url}/v1/images/generations",
+        "SUPABASE_URL": base_url,
+        "SUPABASE_KEY": "test",
+        "BADGE_OUTPUT_DIR": output_dir,
+        "BADGE_CACHE_PATH": os.path.join(output_dir, "index.db"),
+        "BADGE_KEEP_LOCAL": "true",
+    })
+    with contextlib.redirect_stdout(io.StringIO()):
+        import campaign as campaign_service
+
+    _service = (server, campaign_service)
+    return _service
+
+def new_prompt():
+    """A prompt no earlier test has used, so each test starts with a cache miss"""
+    return f"Design a modern badge for a donor that contributed to Test Campaign {next(_prompts)}."
+
+def make(campaign_service, prompt, force=False):
+    from badge_jobs import BadgeJob
+
+    return campaign_service.make_badge(BadgeJob({"test": prompt}), prompt, None, force)
+
+def test_repeat_prompt_is_cache_hit():
+    """The second request for a prompt makes no upstream call"""
+    server, campaign_service = start_badge_service()
+    prompt = new_prompt()
+
+    before = server.generations
+    first, cached = make(campaign_service, prompt)
+    assert not cached
+    assert server.generations == before + 1
+
+    again, cached = make(campaign_service, prompt)
+    assert cached
+    assert again["badge_url"] == first["badge_url"]
+    assert server.generations == before + 1
+    print("✅ Repeated prompt served from the cache")
+
+def test_concurrent_identical_requests_generate_once():
+    """N identical requests at once share a single upstream generation"""
+    server, campaign_service = start_badge_service()
+    prompt = new_prompt()
+
+    before = server.generations
+    with ThreadPoolExecutor(max_workers=CONCURRENT) as pool:
+        results = list(pool.map(lambda _: make(campaign_service, prompt), range(CONCURRENT)))
+
+    assert server.generations == before + 1
+    assert len({entry["badge_url"] for entry, _ in results}) == 1
+    print(f"✅ {CONCURRENT} concurrent requests, 1 generation")
+
+def test_force_regenerates():
+    """force=true calls the image API again and replaces the cached badge"""
+    server, campaign_service = start_badge_service()
+    prompt = new_prompt()
+
+    first, _ = make(campaign_service, prompt)
+    before = server.generations
+    forced, cached = make(campaign_service, prompt, force=True)
+    assert not cached
+    assert server.generations == before + 1
+    assert forced["badge_url"] != first["badge_url"]
+
+    again, cached = make(campaign_service, prompt)
+    assert cached
+    assert again["badge_url"] == forced["badge_url"]
+    print("✅ force=true regenerated the badge")
+
+if __name__ == "__main__":
+    test_repeat_prompt_is_cache_hit()
+    test_concurrent_identical_requests_generate_once()
+    test_force_regenerates()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Concurrency test for the atomic campaign increment.
+Fires many parallel increments at one campaign and checks that none were lost.
+Start the campaign service first (python campaign.py, port 8080).
+
+With --donate the requests go through the whole donate flow instead
+(POST /makedonation/donate with a Stripe test card), so the makedonation,
+stripe, donor and donation services must be running too; the campaign total
+must grow by exactly the sum of the donations that succeeded.
+
+Usage: python test_increment.py <campaign_id> [requests] [workers] [--donate]
+"""
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import requests
+
+CAMPAIGN_URL = "http://127.0.0.1:8080/campaign"
+DONATE_URL = "http://127.0.0.1:8086/makedonation/donate"
+AMOUNT = Decimal("1.25")
+
+def get_current_amount(campaign_id):
+    response = requests.get(f"{CAMPAIGN_URL}/{campaign_id}")
+    response.raise_for_status()
+    return Decimal(str(response.json()["data"][0].get("current_amount") or 0))
+
+def increment(campaign_id):
+    response = requests.post(
+        f"{CAMPAIGN_URL}/{campaign_id}/increment", json={"amount": float(AMOUNT)}
+    )
+    return response.status_code
+
+def donate(campaign_id, amount, number):
+    """One donation through the donate flow; returns the amount when it was recorded"""
+    response = requests.post(
+        DONATE_URL,
+        json={
+            "campaign_id": campaign_id,
+            "name": f"Concurrency Donor {number}",
+            "email": f"concurrency-{number}@example.com",
+            "amount": float(amount),
+            "charge": {
+                "amount": int(amount * 100),
+                "currency": "sgd",
+                "description": f"Concurrency test donation {number}",
+                "source": "tok_visa",
+            },
+        },
+    )
+    return amount if response.status_code == 201 else None
+
+def run_parallel_increments(campaign_id, total_requests, workers):
+    """Fire parallel increments and compare the final total with the expected one"""
+    print(f"🧪 Firing {total_requests} increments of {AMOUNT} at campaign {campaign_id} with {workers} workers...")
+
+    before = get_current_amount(campaign_id)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        statuses = list(pool.map(increment, [campaign_id] * total_requests))
+    after = get_current_amount(campaign_id)
+
+    succeeded = statuses.count(200)
+    expected = before + AMOUNT * succeeded
+
+    print(f"   Before:   {before}")
+    print(f"   After:    {after}")
+    print(f"   Expected: {expected} ({succeeded}/{total_requests} requests succeeded)")
+
+    if succeeded != total_requests:
+        print("❌ Some increment requests failed")
+        return False
+    if after != expected:
+        print(f"❌ Lost updates: off by {expected - after}")
+        return False
+
+    print("✅ Final total is exact")
+    return True
+
+def run_parallel_donations(campaign_id, total_requests, workers):
+    """Fire parallel donations and check the campaign grew by exactly their sum"""
+    print(f"🧪 Firing {total_requests} donations at campaign {campaign_id} with {workers} workers...")
+
+    # Different amounts, so a lost or doubled update cannot cancel out
+    amounts = [AMOUNT * (i % 7 + 1) for i in range(total_requests)]
+    before = get_current_amount(campaign_id)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        recorded = list(pool.map(donate, [campaign_id] * total_requests, amounts, range(total_requests)))
+    after = get_current_amount(campaign_id)
+
+    succeeded = [amount for amount in recorded if amount is not None]
+    expected = before + sum(succeeded, Decimal(0))
+
+    print(f"   Before:   {before}")
+    print(f"   After:    {after}")
+    print(f"   Expected: {expected} ({len(succeeded)}/{total_requests} donations succeeded)")
+
+    if len(succeeded) != total_requests:
+        print("❌ Some donations failed")
+        return False
+    if after != expected:
+        print(f"❌ current_amount is off by {expected - after}")
+        return False
+
+    print("✅ current_amount equals the sum of the donations")
+    return True
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg != "--donate"]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    campaign_id = int(args[0])
+    total_requests = int(args[1]) if len(args) > 1 else 200
+    workers = int(args[2]) if len(args) > 2 else 32
+
+    run = run_parallel_donations if "--donate" in sys.argv else run_parallel_increments
+    ok = run(campaign_id, total_requests, workers)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
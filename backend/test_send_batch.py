@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test POST /email/send-batch against a local aiosmtpd server.
+Checks that every message is delivered, that the batch reuses the pooled
+SMTP connections instead of opening one per message, that a batch without
+limits uses the configured defaults, and that bad concurrency /
+rate_per_second values are rejected.
+
+Usage: python test_send_batch.py   (or pytest test_send_batch.py)
+"""
+
+import atexit
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+POOL_SIZE = 2
+MESSAGES = 12
+
+# The email service reads its SMTP settings at import, so one server serves every test
+_service = None
+
+class RecordingHandler:
+    """Keeps every delivered message and the connection it arrived on"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.delivered = []
+
+    async def handle_DATA(self, server, session, envelope):
+        with self.lock:
+            # session.peer is the client's (host, port), one per SMTP connection
+            self.delivered.append((session.peer, envelope.rcpt_tos))
+        return "250 Message accepted for delivery"
+
+def accept_any_login(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_email_service():
+    """Start an SMTP server and import the email service pointed at it (once)"""
+    global _service
+    if _service:
+        _service[1].delivered.clear()
+        return _service
+
+    handler = RecordingHandler()
+    controller = Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=free_port(),
+        authenticator=accept_any_login,
+        auth_require_tls=False,
+    )
+    controller.start()
+    atexit.register(controller.stop)
+
+    os.environ.update({
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(controller.port),
+        "SMTP_STARTTLS": "false",
+        "SMTP_USER": "sender@example.com",
+        "SMTP_PASS": "secret",
+        "SMTP_POOL_SIZE": str(POOL_SIZE),
+        "OUTBOX_PATH": os.path.join(tempfile.mkdtemp(), "outbox.db"),
+    })
+    sys.path.append(os.path.join(BACKEND_DIR, "email"))
+    import send_email
+
+    _service = (controller, handler, send_email.app.test_client())
+    return _service
+
+def batch(client, **overrides):
+    body = {
+        "email_type": "thanks",
+        "messages": [
+            {
+                "to_email": f"donor{i}@example.com",
+                "context": {"donor_name": f"Donor {i}", "donation_amount": 10, "campaign_name": "Test"},
+            }
+            for i in range(MESSAGES)
+        ],
+        "concurrency": POOL_SIZE,
+        "rate_per_second": 1000,
+    }
+    body.update(overrides)
+    return client.post("/email/send-batch", json=body)
+
+def test_send_batch_reuses_connections():
+    """Every message arrives, over at most POOL_SIZE connections"""
+    _, handler, client = start_email_service()
+    response = batch(client)
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["sent"] == MESSAGES
+
+    recipients = sorted(rcpt for _, rcpts in handler.delivered for rcpt in rcpts)
+    assert recipients == sorted(f"donor{i}@example.com" for i in range(MESSAGES))
+
+    connections = {peer for peer, _ in handler.delivered}
+    assert 1 <= len(connections) <= POOL_SIZE, f"{len(connections)} connections for {MESSAGES} messages"
+    print(f"✅ {MESSAGES} messages delivered over {len(connections)} connection(s)")
+
+def test_send_batch_uses_default_limits():
+    """A batch that leaves out concurrency and rate_per_second still sends"""
+    _, handler, client = start_email_service()
+    response = client.post("/email/send-batch", json={"email_type": "thanks", "messages": [{"to_email": "a@example.com"}]})
+    assert response.status_code == 200, response.get_json()
+    assert [rcpts for _, rcpts in handler.delivered] == [["a@example.com"]]
+    print("✅ Batch without limits sent with the defaults")
+
+def test_send_batch_rejects_bad_limits():
+    """Non-numeric, non-finite and non-positive limits are a 400 and nothing is sent"""
+    _, handler, client = start_email_service()
+    for field in ("concurrency", "rate_per_second"):
+        for value in ("fast", "inf", "nan", 0, -1, True):
+            response = batch(client, **{field: value})
+            assert response.status_code == 400, (field, value, response.get_json())
+    assert handler.delivered == []
+    print("✅ Bad concurrency and rate_per_second values rejected")
+
+if __name__ == "__main__":
+    test_send_batch_reuses_connections()
+    test_send_batch_uses_default_limits()
+    test_send_batch_rejects_bad_limits()
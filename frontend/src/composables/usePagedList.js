@@ -0,0 +1,53 @@
+import { ref, computed } from 'vue'
+
+// Fetch one page of a backend list endpoint (GET <baseUrl>/?...&cursor=...).
+// Resolves to the list envelope: { status, data, next_cursor, limit }
+export async function fetchPage(baseUrl, query = {}, cursor = null) {
+  const params = new URLSearchParams(query)
+  if (cursor) params.set('cursor', cursor)
+  const response = await fetch(`${baseUrl}/?${params}`)
+  return response.json()
+}
+
+// A keyset-paged list that is loaded on demand: reset() loads the first page,
+// loadMore() appends the page after next_cursor. mapRows turns one page of
+// backend rows into display items (and may drop rows).
+export function usePagedList(baseUrl, { query = () => ({}), mapRows = rows => rows } = {}) {
+  const items = ref([])
+  const nextCursor = ref(null)
+  const loadingMore = ref(false)
+  const hasMore = computed(() => nextCursor.value !== null)
+
+  // Bumped on reset so a page that arrives after a reset is dropped
+  let generation = 0
+
+  async function load(cursor) {
+    const started = generation
+    const result = await fetchPage(baseUrl, query(), cursor)
+    if (started !== generation) return result
+    if (result.status === 'success') {
+      items.value = cursor ? [...items.value, ...mapRows(result.data)] : mapRows(result.data)
+      nextCursor.value = result.next_cursor ?? null
+    }
+    return result
+  }
+
+  function reset() {
+    generation += 1
+    items.value = []
+    nextCursor.value = null
+    return load(null)
+  }
+
+  async function loadMore() {
+    if (!hasMore.value || loadingMore.value) return null
+    loadingMore.value = true
+    try {
+      return await load(nextCursor.value)
+    } finally {
+      loadingMore.value = false
+    }
+  }
+
+  return { items, hasMore, loadingMore, reset, loadMore }
+}